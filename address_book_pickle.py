@@ -1,52 +1,153 @@
+import os
 import pickle
+import sys
+from bisect import bisect_left, insort
+from calendar import isleap
 from collections import UserDict
-from datetime import datetime, timedelta
+from itertools import islice
+from datetime import date, datetime, time, timedelta
 import re
-from prettytable import PrettyTable
-from fuzzywuzzy import process
+from pattern_index import PATTERN_FIELDS, PATTERN_LIMIT, PatternIndex, parse_pattern
+from profiling import profiler
 
 
 class Field:
+  __slots__ = ('value',)
+
   def __init__(self, value):
     self.value = value
   def __str__(self):
     return str(self.value)
+
+  def __getstate__(self):
+    return {'value': self.value}
+
+  def __setstate__(self, state):
+    if isinstance(state, tuple):
+      state = state[1]
+    for name, value in state.items():
+      setattr(self, name, value)
+
+
+field_value = Field.value
   
 
 class Name(Field):
-  pass
+  __slots__ = ()
 
 
 class Phone(Field):
+  __slots__ = ()
+
   def __init__(self, value: str):
     if value.isdigit() and len(value) == 10:
       super().__init__(value)
     else:
       raise ValueError('Incorrect phone number')
+
+  @property
+  def value(self):
+    number = field_value.__get__(self)
+    if isinstance(number, int):
+      return f'{number:010d}'
+    return number
+
+  @value.setter
+  def value(self, value):
+    if isinstance(value, Phone):
+      value = value.value
+    if value.isascii() and value.isdigit():
+      value = int(value)
+    field_value.__set__(self, value)
     
 
+BIRTHDAY_FORMAT = re.compile(r'(\d{2})\.(\d{2})\.(\d{4})')
+
+
 class Birthday(Field):
+  __slots__ = ()
+
   def __init__(self, value):
     try:
-      brth_date = datetime.strptime(value, '%d.%m.%Y')
+      match = BIRTHDAY_FORMAT.fullmatch(value)
+      if match:
+        day, month, year = match.groups()
+        brth_date = datetime(int(year), int(month), int(day))
+      else:
+        brth_date = datetime.strptime(value, '%d.%m.%Y')
       super().__init__(brth_date)
     except ValueError:
       raise ValueError("Invalid date format. Use DD.MM.YYYY")
 
+  @property
+  def value(self):
+    return datetime.combine(date.fromordinal(field_value.__get__(self)), time())
+
+  @value.setter
+  def value(self, value):
+    field_value.__set__(self, value.toordinal())
+
 
 class Address(Field):
-  pass
+  __slots__ = ()
+
+  def __init__(self, value):
+    super().__init__(sys.intern(value))
+
+  def __setstate__(self, state):
+    super().__setstate__(state)
+    self.value = sys.intern(self.value)
+
+
+EMAIL_FORMAT = re.compile(r'\w+@\w+\.\w+')
 
 
 class Email(Field):
+  __slots__ = ()
+
   def __init__(self, value):
-    if not re.match(r'\w+@\w+\.\w+', value):
+    if not EMAIL_FORMAT.match(value):
       raise ValueError('Invalid email format')
     super().__init__(value)
 
 
-class Record:
+def tracked(method):
+  def inner(self, *args, **kwargs):
+    book = self._book
+    if book is None:
+      return method(self, *args, **kwargs)
+    book.before_change(self)
+    try:
+      return method(self, *args, **kwargs)
+    finally:
+      book.after_change(self)
+  return inner
+
+
+class Entry:
+  __slots__ = ('_book', '_key')
+  fields = ()
+
+  def __init__(self):
+    self._book = None
+    self._key = None
+
+  def __getstate__(self):
+    return {name: getattr(self, name) for name in self.fields}
+
+  def __setstate__(self, state):
+    self._book = None
+    self._key = None
+    for name in self.fields:
+      setattr(self, name, state.get(name))
+
+
+class Record(Entry):
+  __slots__ = ('name', 'phones', 'birthday', 'email', 'address')
+  fields = __slots__
+
   def __init__(self, name):
+    super().__init__()
     self.name = Name(name)
     self.phones = []
     self.birthday = None
@@ -54,10 +155,12 @@ class Record:
     self.address = None
   
 
+  @tracked
   def add_birthday(self, birthday):
     self.birthday = Birthday(birthday)
 
 
+  @tracked
   def add_phone(self, phone):
     if not any(p.value == phone for p in self.phones):
       self.phones.append(Phone(phone))
@@ -65,10 +168,12 @@ class Record:
       raise ValueError('This phone is already added')  
 
 
+  @tracked
   def add_email(self, email):
     self.email = Email(email)
 
 
+  @tracked
   def add_address(self, address):
     self.address = Address(address)
 
@@ -79,6 +184,7 @@ class Record:
     return 'Contact do not have email'
 
 
+  @tracked
   def remove_email(self):
     rem_email = self.find_email
     if rem_email:
@@ -93,6 +199,7 @@ class Record:
     return 'Contact do not have address'
   
 
+  @tracked
   def remove_address(self):
     rem_address = self.find_address
     if rem_address:
@@ -107,6 +214,7 @@ class Record:
     return 'Contact does not have birthday'
   
 
+  @tracked
   def remove_birthday(self):
     rem_birthday = self.find_birthday
     if rem_birthday:
@@ -122,6 +230,7 @@ class Record:
     return 'Contact do not have phones'
       
 
+  @tracked
   def remove_phone(self, phone):
     rem_phone = self.find_phone(phone)
     if rem_phone:
@@ -130,24 +239,29 @@ class Record:
     return 'No phone to remove'  
 
 
+  @tracked
   def edit_phone(self, old_phone, new_phone):
     phone_obj = self.find_phone(old_phone)
     if phone_obj:
-      phone_obj.value = Phone(new_phone)
+      phone_obj.value = Phone(new_phone).value
 
 
+  @tracked
   def edit_email(self, new_email):
     self.email = Email(new_email)
 
 
+  @tracked
   def edit_address(self, new_address):
     self.address = Address(new_address)
 
 
+  @tracked
   def edit_birthday(self, new_birthday):
     self.birthday = Birthday(new_birthday) 
 
 
+  @tracked
   def edit_name(self, new_name):
     if not new_name:
       raise ValueError('Name can not be empty') 
@@ -157,6 +271,7 @@ class Record:
     
 
   def prettytable_for_search(self):
+    from prettytable import PrettyTable
     table = PrettyTable()
     table.field_names = ["Name", "Phones", "Email", "Address", "Birthday"]
     birthday = self.birthday.value.strftime('%d.%m.%Y') if self.birthday else '-'
@@ -175,54 +290,296 @@ class Record:
     return f"Contact: {self.name.value}, Phones: {phones}, Email: {email}, Address: {address}, birthday: {birthday}"
   
   
-class AddressBook(UserDict):
+def normalize_address(address):
+  return ' '.join(address.lower().split())
+
+
+def index_add(index, value, key, record):
+  index.setdefault(value, {})[key] = record
+
+
+def index_discard(index, value, key):
+  records = index.get(value)
+  if records is not None:
+    records.pop(key, None)
+    if not records:
+      del index[value]
+
+
+BIRTHDAY_QUERY = re.compile(r'(\d{2})\.(\d{2})(?:\.(\d{4}))?')
+DAYS_BEFORE_MONTH = [0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335]
+
+
+def day_of_year(month, day):
+  return DAYS_BEFORE_MONTH[month] + day - 1
+
+
+def celebration_date(month, day, year):
+  if month == 2 and day == 29 and not isleap(year):
+    return date(year, 2, 28)
+  return date(year, month, day)
+
+
+def next_birthday(birthday, today):
+  this_year = celebration_date(birthday.month, birthday.day, today.year)
+  if this_year < today:
+    return celebration_date(birthday.month, birthday.day, today.year + 1)
+  return this_year
+
+
+def birthday_ranges(today, end_date):
+  if end_date < today:
+    return []
+  if (end_date - today).days >= 365:
+    return [((1, 1), (12, 31))]
+  start = (today.month, today.day)
+  end = (end_date.month, end_date.day)
+  if end == (2, 28):
+    end = (2, 29)
+  if end_date.year == today.year:
+    return [(start, end)]
+  return [(start, (12, 31)), ((1, 1), end)]
+
+
+def index_first(index, value):
+  records = index.get(value)
+  if records:
+    return next(iter(records.values()))
+  return None
+
+
+class Book(UserDict):
+  storage = None
+  changes = 0
+  transient = ('storage', 'changes')
+
+  def __init__(self, *args, **kwargs):
+    self.reset_index()
+    super().__init__(*args, **kwargs)
+
+  def _put(self, key, record):
+    old = self.data.get(key)
+    if old is not None:
+      self.unindex(old)
+      old._book = None
+    record._book = self
+    record._key = key
+    self.data[key] = record
+    self.index(record)
+
+  def _pop(self, key):
+    record = self.data.pop(key, None)
+    if record is not None:
+      self.unindex(record)
+      record._book = None
+    return record
+
+  def put_many(self, items):
+    entries = []
+    fresh = {}
+    for key, record in items:
+      old = self.data.get(key)
+      if old is not None:
+        if key not in fresh:
+          self.unindex(old)
+        old._book = None
+      record._book = self
+      record._key = key
+      self.data[key] = fresh[key] = record
+      entries.append(('put', key, record))
+    self.index_many(fresh.values())
+    self.log_many(entries)
+    return len(entries)
+
+  def log(self, op, key, record=None):
+    self.changes += 1
+    if self.storage is not None:
+      self.storage.append(op, key, record)
+
+  def log_many(self, entries):
+    self.changes += len(entries)
+    if self.storage is not None:
+      self.storage.append_many(entries)
+
+  def apply(self, op, key, record=None):
+    if op == 'put':
+      self._put(key, record)
+    elif op == 'del':
+      self._pop(key)
+
+  def reset_index(self):
+    pass
+
+  def rebuild_index(self):
+    self.reset_index()
+    for record in self.data.values():
+      self.index(record)
+
+  def index(self, record):
+    pass
+
+  def index_many(self, records):
+    for record in records:
+      self.index(record)
+
+  def unindex(self, record):
+    pass
+
+  def before_change(self, record):
+    self.unindex(record)
+
+  def after_change(self, record):
+    self.index(record)
+    self.log('put', record._key, record)
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    for name in self.transient:
+      state.pop(name, None)
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    for key, record in self.data.items():
+      record._book = self
+      record._key = key
+    self.rebuild_index()
+
+
+class AddressBook(Book):
+  transient = Book.transient + ('phones_index', 'emails_index', 'addresses_index', 'birthdays_index', 'birthdays_by_day', 'name_index', 'pattern_indexes')
+
+  def reset_index(self):
+    self.name_index = None
+    self.pattern_indexes = {}
+    self.phones_index = {}
+    self.emails_index = {}
+    self.addresses_index = {}
+    self.birthdays_index = []
+    self.birthdays_by_day = {}
+
+  def rebuild_index(self):
+    self.reset_index()
+    for record in self.data.values():
+      self.index(record, sort=False)
+    self.birthdays_index.sort()
+
+  def index_many(self, records):
+    records = list(records)
+    if len(records) * 4 > len(self.data):
+      self.pattern_indexes = {}
+    for record in records:
+      self.index(record, sort=False)
+    self.birthdays_index.sort()
+
+  def index(self, record, sort=True):
+    key = record._key
+    if self.name_index is not None:
+      self.name_index.add(key)
+    for pattern_index in self.pattern_indexes.values():
+      pattern_index.add(key, record)
+    for phone in record.phones:
+      index_add(self.phones_index, phone.value, key, record)
+    if record.email:
+      index_add(self.emails_index, record.email.value, key, record)
+    if record.address:
+      index_add(self.addresses_index, normalize_address(record.address.value), key, record)
+    if record.birthday:
+      birthday = record.birthday.value
+      entry = (day_of_year(birthday.month, birthday.day), key)
+      if sort:
+        insort(self.birthdays_index, entry)
+      else:
+        self.birthdays_index.append(entry)
+      index_add(self.birthdays_by_day, (birthday.month, birthday.day), key, record)
+
+  def unindex(self, record):
+    key = record._key
+    if self.name_index is not None:
+      self.name_index.remove(key)
+    for pattern_index in self.pattern_indexes.values():
+      pattern_index.remove(key, record)
+    for phone in record.phones:
+      index_discard(self.phones_index, phone.value, key)
+    if record.email:
+      index_discard(self.emails_index, record.email.value, key)
+    if record.address:
+      index_discard(self.addresses_index, normalize_address(record.address.value), key)
+    if record.birthday:
+      birthday = record.birthday.value
+      entry = (day_of_year(birthday.month, birthday.day), key)
+      position = bisect_left(self.birthdays_index, entry)
+      if position < len(self.birthdays_index) and self.birthdays_index[position] == entry:
+        del self.birthdays_index[position]
+      index_discard(self.birthdays_by_day, (birthday.month, birthday.day), key)
+
   def add_record(self, record: Record):
-    self.data[record.name.value] = record
+    self._put(record.name.value, record)
+    self.log('put', record.name.value, record)
 
   def find(self, name) -> Record:
     if name in self.data:
       return self.data[name]
 
+  def name_matches(self, name):
+    if self.name_index is None:
+      from fuzzy_index import NameIndex
+      self.name_index = NameIndex()
+      for key in self.data:
+        self.name_index.add(key)
+    return self.name_index.extract(name)
+
+  def suggest_names(self, name):
+    return [key for key, score in self.name_matches(name)]
+
+  def pattern_index(self, field):
+    pattern_index = self.pattern_indexes.get(field)
+    if pattern_index is None:
+      pattern_index = self.pattern_indexes[field] = PatternIndex(field).build(self.data.items())
+    return pattern_index
+
+  def matches(self, field, mode, text):
+    return self.pattern_index(field).matches(mode, text)
+
+  def find_matching(self, field, mode, text):
+    seen = set()
+    for _, key in self.matches(field, mode, text):
+      if key not in seen:
+        seen.add(key)
+        yield self.data[key]
+
   def find_by_phone(self, phone) -> Record:
-    for contact in self.data.values():
-      if phone in [p.value for p in contact.phones]:
-        return contact
-    return None
+    return index_first(self.phones_index, phone)
 
   def find_by_brthd(self, birthday) -> Record:
-    bday_with_year = (len(birthday.split('.')) == 3 and len(birthday.split('.')[0]) == 2 and len(birthday.split('.')[1]) == 2 and len(birthday.split('.')[2]) == 4)
-    contacts = []
-    for contact in self.data.values():
-      if contact.birthday is not None and birthday == contact.birthday.value.strftime('%d.%m' + '%Y' * bday_with_year):
-        contacts.append(contact)
-    return contacts
+    match = BIRTHDAY_QUERY.fullmatch(birthday)
+    if not match:
+      return []
+    day, month, year = match.groups()
+    contacts = self.birthdays_by_day.get((int(month), int(day)), {}).values()
+    if year:
+      return [contact for contact in contacts if contact.birthday.value.year == int(year)]
+    return list(contacts)
     
   def find_by_mail(self, email) -> Record:
-    for contact in self.data.values():
-      if contact.email is not None and email == contact.email.value:
-        return contact
-    return None
+    return index_first(self.emails_index, email)
 
   def find_by_addr(self, address) -> Record:
-    for contact in self.data.values():
-      if contact.address is not None and address == contact.address.value:
-        return contact
-    return None
+    return index_first(self.addresses_index, normalize_address(address))
 
 
   def get_upcoming_birthdays(self, days):
     today = datetime.today().date()
     end_date = today + timedelta(days=days)
     list_of_birthdays = []
-  
-    for record in self.data.values():
-      if record.birthday:
-        birthday = record.birthday.value.date()
-        birthday_this_year = birthday.replace(year=today.year)
-          
-        if birthday_this_year < today:
-          birthday_this_year = birthday_this_year.replace(year=today.year + 1)
-        if today <= birthday_this_year <= end_date:
+
+    for start, end in birthday_ranges(today, end_date):
+      lo = bisect_left(self.birthdays_index, (day_of_year(*start),))
+      hi = bisect_left(self.birthdays_index, (day_of_year(*end) + 1,))
+      for _, key in self.birthdays_index[lo:hi]:
+        record = self.data[key]
+        birthday_this_year = next_birthday(record.birthday.value, today)
+        if birthday_this_year <= end_date:
           list_of_birthdays.append({
             "name": record.name.value,
             "birthday": birthday_this_year.strftime("%Y-%m-%d")
@@ -233,7 +590,12 @@ class AddressBook(UserDict):
   def delete(self, name):
     del_contact = self.find(name)
     if del_contact:
-      self.data.pop(name, None)
+      self._pop(name)
+      self.log('del', name)
+
+
+class CommandError(str):
+  pass
 
 
 def input_error(func):
@@ -241,11 +603,11 @@ def input_error(func):
     try:
       return func(*args, **kwargs)
     except ValueError as err:
-      return str(err)
+      return CommandError(err)
     except IndexError:
-      return "\nGive me the name.\n"
+      return CommandError("\nGive me the name.\n")
     except KeyError:
-      return "\nNo such contact.\n"
+      return CommandError("\nNo such contact.\n")
   return inner
 
 
@@ -268,9 +630,7 @@ def suggestion_name(book: AddressBook):
     break
   if name in book.data:
     return name
-  contacts = list(book.data.keys())
-  variants = process.extract(name, contacts, limit=None)
-  variants = [v[0] for v in variants if v[1]>=60]
+  variants = book.suggest_names(name)
   for suggest_name in variants:
     choice = input(f'\nDid you mean {suggest_name}? [Y/N]. Or press Enter to add new contact: \n').strip().upper()
     if choice == 'Y':
@@ -284,8 +644,8 @@ def suggestion_name(book: AddressBook):
 
 
 @input_error
-def remove_contact(book: AddressBook):
-  name = input('\nWhich contact do you want to delete? \n').capitalize()
+def remove_contact(book: AddressBook, args=()):
+  name = args[0].capitalize() if args else input('\nWhich contact do you want to delete? \n').capitalize()
   record = book.find(name)
   if record:
     book.delete(name)
@@ -293,44 +653,223 @@ def remove_contact(book: AddressBook):
   return '\nContact not exists\n'
 
 
+FIELD_TYPES = {'phone': Phone, 'email': Email, 'address': Address, 'birthday': Birthday}
+
+
+def parse_fields(args):
+  fields = []
+  for arg in args:
+    field, sep, value = arg.partition('=')
+    field = field.lower()
+    if not sep or field not in FIELD_TYPES:
+      raise ValueError(f'\nUse field=value with one of: {", ".join(FIELD_TYPES)}. Got: {arg}\n')
+    FIELD_TYPES[field](value)
+    fields.append((field, value))
+  return fields
+
+
 @input_error
-def show_all(book: AddressBook) -> str:
-  if not book.data:
-    return "\nNo contacts found :(\n"
+def add_contact(args, book: AddressBook):
+  name = args[0].capitalize()
+  fields = parse_fields(args[1:])
+  record = book.find(name)
+  phones = [Phone(value).value for field, value in fields if field == 'phone']
+  old_phones = [phone.value for phone in record.phones] if record else []
+  if len(old_phones) + len(phones) > 2:
+    raise ValueError('\nMax 2 phones for contact.\n')
+  if len(set(phones)) < len(phones) or set(phones) & set(old_phones):
+    raise ValueError('\nThis phone is already added.\n')
+  if record is None:
+    record = Record(name)
+    book.add_record(record)
+    message = f'Contact {name} added.'
+  else:
+    message = f'Contact {name} updated.'
+  for field, value in fields:
+    if field == 'phone':
+      record.add_phone(value)
+    elif field == 'email':
+      record.add_email(value)
+    elif field == 'address':
+      record.add_address(value)
+    elif field == 'birthday':
+      record.add_birthday(value)
+  return message
+
+
+@input_error
+def edit_contact(args, book: AddressBook):
+  if len(args) < 2:
+    raise ValueError('\nUse: edit <name> <name|phone|email|address|birthday> <value>\n')
+  name, info_type, *values = args
+  name = name.capitalize()
+  record = book.find(name)
+  if record is None:
+    return '\nNo such contact\n'
+  info_type = info_type.lower()
+  if not values:
+    raise ValueError(f'\nGive me the new {info_type}.\n')
+  if info_type == 'name':
+    new_name = ' '.join(values).strip().capitalize()
+    if book.find(new_name) is not None and new_name != name:
+      raise ValueError(f'\nContact {new_name} already exists.\n')
+    record.edit_name(new_name)
+    book.delete(name)
+    book.add_record(record)
+    return f'Name {name} changed to name {new_name}'
+  if info_type == 'phone':
+    if len(values) != 2:
+      raise ValueError('\nUse: edit <name> phone <old phone> <new phone>\n')
+    if not isinstance(record.find_phone(values[0]), Phone):
+      raise ValueError('\nNo such phone number\n')
+    record.edit_phone(values[0], values[1])
+    return f'Phone {values[0]} changed to phone {values[1]}'
+  if info_type == 'email':
+    record.edit_email(values[0])
+  elif info_type == 'address':
+    record.edit_address(' '.join(values))
+  elif info_type == 'birthday':
+    record.edit_birthday(values[0])
+  else:
+    raise ValueError('\nUse only:  name  phone  email  address  birthday\n')
+  return f'{info_type.capitalize()} of {name} changed to {" ".join(values)}'
+
+
+@input_error
+def remove_contact_field(args, book: AddressBook):
+  if len(args) < 2:
+    raise ValueError('\nUse: remove <name> <phone|email|address|birthday> [phone]\n')
+  name, info_type, *values = args
+  name = name.capitalize()
+  record = book.find(name)
+  if record is None:
+    return '\nNo such contact.\n'
+  info_type = info_type.lower()
+  if info_type == 'phone':
+    if not record.phones:
+      return f'\nContact {name} has no phone.\n'
+    phone = values[0] if values else record.phones[0].value
+    if len(record.phones) > 1 and not values:
+      raise ValueError('\nUse: remove <name> phone <phone>\n')
+    if not isinstance(record.find_phone(phone), Phone):
+      raise ValueError('\nNo such phone number\n')
+    record.remove_phone(phone)
+    return f'Phone {phone} removed from {name}'
+  if info_type not in ('email', 'address', 'birthday'):
+    raise ValueError('\nUse only:  phone  email  address  birthday\n')
+  if getattr(record, info_type) is None:
+    return f'\nContact {name} has no {info_type}.\n'
+  getattr(record, f'remove_{info_type}')()
+  return f'{info_type.capitalize()} removed from {name}.'
+
+
+PAGE_SIZE = 20
+
+
+def parse_page_args(args):
+  page = None
+  size = PAGE_SIZE
+  args = list(args)
+  while args:
+    option = args.pop(0)
+    if option not in ('--page', '--size') or not args or not args[0].isdigit() or int(args[0]) < 1:
+      raise ValueError('\nUse: --page N --size K\n')
+    if option == '--page':
+      page = int(args.pop(0))
+    else:
+      size = int(args.pop(0))
+  return page, size
+
+
+def make_table(field_names, rows, title=None):
+  from prettytable import PrettyTable
   table = PrettyTable()
-  table.title = "CONTACTS"
-  table.field_names = ['NAME', 'PHONES', 'EMAIL', 'ADDRESS', 'BIRTHDAY']
+  if title:
+    table.title = title
+  table.field_names = field_names
   table.align = 'c'
   table.hrules = 1
+  for row in rows:
+    table.add_row(row)
+  return table
+
+
+def table_pages(field_names, rows, size, title=None):
+  number = 1
+  while True:
+    page = list(islice(rows, size))
+    if not page:
+      return
+    yield make_table(field_names, page, f'{title} - page {number}' if title else None)
+    number += 1
+
+
+interactive = True
+
+
+def set_interactive(flag):
+  global interactive
+  interactive = flag
+
+
+def show_pages(field_names, items, args, title=None, empty='\nNothing found\n', row=None):
+  page, size = parse_page_args(args)
+  items = iter(items)
+  if page is not None:
+    items = list(islice(items, (page - 1) * size, page * size))
+    if not items:
+      return f'\nPage {page} is empty\n'
+    rows = map(row, items) if row else items
+    return '\n' + str(make_table(field_names, rows, f'{title} - page {page}' if title else None)) + '\n'
+  rows = map(row, items) if row else items
+  if not interactive:
+    rows = list(rows)
+    if not rows:
+      return empty
+    return (str(table) for table in table_pages(field_names, iter(rows), size, title))
+  pages = table_pages(field_names, rows, size, title)
+  table = next(pages, None)
+  if table is None:
+    return empty
+  while True:
+    with profiler.paused():
+      print('\n' + str(table))
+    table = next(pages, None)
+    if table is None:
+      return ''
+    with profiler.paused():
+      answer = input('\nEnter - next page, q - stop: ')
+    if answer.strip().lower() == 'q':
+      return ''
+
+
+def contact_row(record):
+  birthday = record.birthday.value.strftime('%d.%m.%Y') if record.birthday else '-'
+  email = record.email.value if record.email else '-'
+  address = record.address.value if record.address else '-'
+  phones = '\n'.join(str(p.value) for p in record.phones) if record.phones else '-'
+  return [record.name.value, phones, email, address, birthday]
 
-  for record in book.data.values():
-    birthday = record.birthday.value.strftime('%d.%m.%Y') if record.birthday else '-'
-    email = record.email.value if record.email else '-'
-    address = record.address.value if record.address else '-'
-    phones = '\n'.join(str(p.value) for p in record.phones) if record.phones else '-'
 
-    table.add_row([record.name.value, phones, email, address, birthday])
-  return '\n' + str(table) + '\n'
+@input_error
+def show_all(book: AddressBook, args=()) -> str:
+  if not book.data:
+    return "\nNo contacts found :(\n"
+  return show_pages(['NAME', 'PHONES', 'EMAIL', 'ADDRESS', 'BIRTHDAY'], book.data.values(), args, "CONTACTS", row=contact_row)
 
 
 @input_error
 def birthdays(args, book):
-  if len(args) != 1:
+  if len(args) < 1:
     raise KeyError
   days = int(args[0])
   upcoming_birthdays = book.get_upcoming_birthdays(days)
   if not upcoming_birthdays:
     return f"No birthdays in the next {days} days."
-   
-  table = PrettyTable()
-  table.field_names = ["Name", "Birthday", "Days Left"]
-  
-  for entry in upcoming_birthdays:
-    name = entry["name"]
-    birthday = entry["birthday"]
-    days_left = (datetime.strptime(birthday, "%Y-%m-%d").date() - datetime.today().date()).days
-    table.add_row([name, birthday, days_left])
-  return table
+
+  today = datetime.today().date()
+  row = lambda entry: [entry["name"], entry["birthday"], (datetime.strptime(entry["birthday"], "%Y-%m-%d").date() - today).days]
+  return show_pages(["Name", "Birthday", "Days Left"], upcoming_birthdays, args[1:], row=row)
 
 
 @input_error
@@ -556,6 +1095,8 @@ def edit_contact_info(book: AddressBook):
             while True:
               new_name = input('\nEnter new name: \n').strip().capitalize()
               try:
+                if book.find(new_name) is not None and new_name != name:
+                  raise ValueError(f'\nContact {new_name} already exists.\n')
                 record.edit_name(new_name)
                 book.delete(name)
                 book.add_record(record)
@@ -589,21 +1130,16 @@ def search_by_phone(phone: str, book) -> str:
   return f'No contact with this Phone: {phone}.'
 
 
-def prettytable_for_search_birthday(records):
-  table = PrettyTable()
-  table.field_names = ["Name", "Birthday"]
-  for cont in records:
-    name = cont.name.value
-    birthday = cont.birthday.value.strftime('%d.%m.%Y') if cont.birthday else '-'
-    table.add_row([name, birthday])
-  return table
+def prettytable_for_search_birthday(records, args=()):
+  row = lambda cont: [cont.name.value, cont.birthday.value.strftime('%d.%m.%Y') if cont.birthday else '-']
+  return show_pages(["Name", "Birthday"], records, args, row=row)
 
 
-def search_by_birthday(birthday: str, book) -> str:
+def search_by_birthday(birthday: str, book, args=()) -> str:
   records = book.find_by_brthd(birthday)
   if len(records) == 0:
     return f'No contact with this Birthday: {birthday}.'
-  return prettytable_for_search_birthday(records)
+  return prettytable_for_search_birthday(records, args)
 
 
 def search_by_email(email: str, book) -> str:
@@ -620,21 +1156,77 @@ def search_by_address(address: str, book) -> str:
   return f'No contact with this Address: {address}.'
 
 
+def parse_limit(args):
+  args = list(args)
+  if '--limit' not in args:
+    return args, PATTERN_LIMIT
+  position = args.index('--limit')
+  if position + 1 == len(args) or not args[position + 1].isdigit():
+    raise ValueError('\nUse: --limit N (0 shows every match)\n')
+  limit = int(args[position + 1])
+  del args[position:position + 2]
+  return args, limit
+
+
+def search_by_pattern(field, pattern, book, args=()) -> str:
+  mode, text = parse_pattern(pattern)
+  args, limit = parse_limit(args)
+  records = book.find_matching(field, mode, text)
+  if limit:
+    records = islice(records, limit)
+  return show_pages(['NAME', 'PHONES', 'EMAIL', 'ADDRESS', 'BIRTHDAY'], records, args, f'{field.upper()} {pattern}', empty=f'No contact with {field} matching {pattern}.', row=contact_row)
+
+
 @input_error
 def search(args, book: AddressBook) -> str:
   comms = {'name': search_by_name, 'phone': search_by_phone, 'birthday': search_by_birthday, 'email': search_by_email, 'address': search_by_address}
+  if ':' in args[0]:
+    from contact_query import search_query
+    return search_query(args, book)
+  if args[0] in PATTERN_FIELDS and parse_pattern(args[1]):
+    return search_by_pattern(args[0], args[1], book, args[2:])
+  if args[0] == 'birthday':
+    return search_by_birthday(args[1], book, args[2:])
   return comms[args[0]](args[1], book)
 
 
+command_matchers = {}
+
+
 def suggest_command(user_input, commands):
-    best_match = process.extract(user_input, commands)
-    best_match = [match[0] for match in best_match if match[1] > 60]
-    return best_match
+    key = tuple(commands)
+    if key not in command_matchers:
+      from fuzzy_index import CommandMatcher
+      command_matchers[key] = CommandMatcher(commands)
+    return command_matchers[key].suggest(user_input)
 
 
-def save_data(book, filename="addressbook.pkl"):
-  with open(filename, "wb") as f:
-    pickle.dump(book, f)
+def fsync_dir(filename):
+  try:
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+  except OSError:
+    return
+  try:
+    os.fsync(fd)
+  except OSError:
+    pass
+  finally:
+    os.close(fd)
+
+
+def save_data(book, filename="addressbook.pkl", dump=pickle.dump):
+  tmp_filename = f'{filename}.{os.getpid()}.tmp'
+  try:
+    with open(tmp_filename, "wb") as f:
+      dump(book, f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+  except BaseException:
+    if os.path.exists(tmp_filename):
+      os.remove(tmp_filename)
+    raise
+  fsync_dir(filename)
 
 
 def load_data(filename="addressbook.pkl"):
@@ -0,0 +1,148 @@
+import json
+import sys
+from collections import deque
+from datetime import date
+from address_book_pickle import Record, Phone, Email, Address, Birthday, EMAIL_FORMAT
+
+
+CHUNK_SIZE = 10_000
+ROW_ERRORS = (ValueError, TypeError, AttributeError)
+
+
+def validated(cls, value):
+  field = cls.__new__(cls)
+  field.value = value
+  return field
+
+
+def fast_phone(value):
+  if type(value) is str and len(value) == 10 and value.isdigit():
+    return value
+
+
+def fast_email(value, match=EMAIL_FORMAT.match):
+  if type(value) is str and match(value):
+    return value
+
+
+def fast_birthday(value):
+  if type(value) is str and len(value) == 10 and value[2] == '.' and value[5] == '.':
+    day, month, year = value[:2], value[3:5], value[6:]
+    if day.isdecimal() and month.isdecimal() and year.isdecimal():
+      try:
+        return date(int(year), int(month), int(day))
+      except ValueError:
+        return None
+
+
+def fast_address(value):
+  if type(value) is str:
+    return sys.intern(value)
+
+
+def parse_column(values, fast, cls, optional=True):
+  parsed = []
+  errors = {}
+  append = parsed.append
+  for position, value in enumerate(values):
+    if optional and not value:
+      append(None)
+      continue
+    try:
+      result = fast(value)
+      if result is None:
+        result = cls(value).value
+    except ROW_ERRORS as e:
+      errors[position] = e
+      result = None
+    append(result)
+  return parsed, errors
+
+
+def split_rows(rows):
+  numbers, names, phones, owners, emails, addresses, birthdays = [], [], [], [], [], [], []
+  errors = []
+  for number, row in rows:
+    try:
+      if isinstance(row, str):
+        row = json.loads(row)
+      name = (row.get('name') or '').strip()
+      if not name:
+        raise ValueError('Missing name')
+      row_phones = row.get('phones') or []
+      if isinstance(row_phones, str):
+        row_phones = row_phones.split()
+      row_phones = list(dict.fromkeys(row_phones))
+      if len(row_phones) > 2:
+        raise ValueError('Max 2 phones for contact')
+    except ROW_ERRORS as e:
+      errors.append((number, str(e)))
+      continue
+    owners.extend([len(numbers)] * len(row_phones))
+    numbers.append(number)
+    names.append(name.capitalize())
+    phones.extend(row_phones)
+    emails.append(row.get('email'))
+    addresses.append(row.get('address'))
+    birthdays.append(row.get('birthday'))
+  return numbers, names, phones, owners, emails, addresses, birthdays, errors
+
+
+def validate_columns(rows):
+  numbers, names, phones, owners, emails, addresses, birthdays, errors = split_rows(rows)
+  phones, phone_errors = parse_column(phones, fast_phone, Phone, optional=False)
+  emails, failures = parse_column(emails, fast_email, Email)
+  addresses, address_errors = parse_column(addresses, fast_address, Address)
+  birthdays, birthday_errors = parse_column(birthdays, fast_birthday, Birthday)
+  for later in (address_errors, birthday_errors):
+    for position, error in later.items():
+      failures.setdefault(position, error)
+  for position in sorted(phone_errors, reverse=True):
+    failures[owners[position]] = phone_errors[position]
+  row_phones = [[] for _ in numbers]
+  for owner, phone in zip(owners, phones):
+    row_phones[owner].append(phone)
+  valid = []
+  for position, row in enumerate(zip(names, row_phones, emails, addresses, birthdays)):
+    if position in failures:
+      errors.append((numbers[position], str(failures[position])))
+    else:
+      valid.append(row)
+  errors.sort()
+  return valid, errors
+
+
+def build_records(rows):
+  records = []
+  for name, phones, email, address, birthday in rows:
+    record = Record(name)
+    record.phones = [validated(Phone, phone) for phone in phones]
+    record.email = validated(Email, email) if email else None
+    record.address = validated(Address, sys.intern(address)) if address else None
+    record.birthday = validated(Birthday, birthday) if birthday else None
+    records.append((name, record))
+  return records
+
+
+def validate_contacts(rows):
+  valid, errors = validate_columns(rows)
+  return build_records(valid), errors
+
+
+def validate_chunks(chunks, workers=0):
+  if workers <= 1:
+    for chunk in chunks:
+      yield validate_contacts(chunk)
+    return
+  from concurrent.futures import ProcessPoolExecutor
+  from sharded_book import pool_context
+  with ProcessPoolExecutor(workers, mp_context=pool_context()) as pool:
+    pending = deque()
+    for chunk in chunks:
+      pending.append(pool.submit(validate_columns, chunk))
+      if len(pending) >= workers * 2:
+        valid, errors = pending.popleft().result()
+        yield build_records(valid), errors
+    while pending:
+      valid, errors = pending.popleft().result()
+      yield build_records(valid), errors
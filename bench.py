@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from heapq import nlargest
+from itertools import islice
+from fuzzywuzzy import process
+from prettytable import PrettyTable
+import address_book_pickle
+from address_book_pickle import AddressBook, Record, load_data, save_data, show_all
+from note_book import NoteBook, NoteRecord
+from bench_memory import CITIES, STREETS, measure
+try:
+  from bulk_io import gc_paused
+except ImportError:
+  gc_paused = nullcontext
+
+
+FIRST_NAMES = [
+  'Olena', 'Ivan', 'Andrii', 'Oksana', 'Mykola', 'Iryna', 'Dmytro', 'Nataliia', 'Serhii', 'Tetiana',
+  'Oleksandr', 'Yuliia', 'Vasyl', 'Kateryna', 'Bohdan', 'Mariia', 'Taras', 'Sofiia', 'Petro', 'Halyna',
+  'Roman', 'Anna', 'Yurii', 'Liudmyla', 'Viktor', 'Svitlana', 'Oleh', 'Larysa', 'Maksym', 'Daryna',
+  'Volodymyr', 'Khrystyna', 'Artem', 'Viktoriia', 'Yaroslav', 'Alina', 'Stepan', 'Zoriana', 'Denys', 'Marta',
+]
+LAST_NAME_ROOTS = [
+  'Shevch', 'Koval', 'Bondar', 'Tkach', 'Kravch', 'Oliin', 'Polishch', 'Lys', 'Boi', 'Meln', 'March', 'Rud',
+  'Savch', 'Petr', 'Moroz', 'Pavl', 'Klym', 'Hrytsai', 'Sydor', 'Ostap', 'Levch', 'Kuz', 'Horb', 'Zhuk',
+]
+LAST_NAME_ENDINGS = ['enko', 'uk', 'chuk', 'ak', 'yk', 'ych', 'ko', 'iv', 'yshyn', 'ovskyi']
+LAST_NAMES = [root + ending for root in LAST_NAME_ROOTS for ending in LAST_NAME_ENDINGS]
+OPERATORS = ['050', '066', '067', '068', '073', '093', '095', '096', '097', '098', '099']
+DOMAINS = ['gmail.com', 'ukr.net', 'i.ua', 'meta.ua', 'outlook.com', 'company.com.ua']
+DOMAIN_WEIGHTS = [40, 25, 10, 5, 10, 10]
+WORDS = [
+  'call', 'meeting', 'buy', 'send', 'report', 'book', 'ticket', 'doctor', 'gift', 'plan', 'budget', 'review',
+  'draft', 'order', 'pay', 'invoice', 'trip', 'read', 'fix', 'car', 'school', 'project', 'idea', 'garden',
+]
+TAGS = ['work', 'home', 'urgent', 'ideas', 'shopping', 'family', 'travel', 'books', 'health', 'money'] + [f'project{number}' for number in range(190)]
+TAG_WEIGHTS = [1 / rank ** 1.1 for rank in range(1, len(TAGS) + 1)]
+FIRST_BIRTHDAY = date(1940, 1, 1).toordinal()
+LAST_BIRTHDAY = date(2010, 12, 31).toordinal()
+PATTERN_FIELDS = ('name', 'phone', 'email')
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def generate_contacts(count, rng):
+  seen = {}
+  for number in range(count):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    name = f'{first} {last}'.capitalize()
+    seen[name] = seen.get(name, 0) + 1
+    if seen[name] > 1:
+      name = f'{name} {seen[name]}'
+    record = Record(name)
+    record.add_phone(f'{rng.choice(OPERATORS)}{rng.randrange(10**7):07d}')
+    if rng.random() < 0.2:
+      record.add_phone(f'{rng.choice(OPERATORS)}{rng.randrange(10**7):07d}')
+    if rng.random() < 0.85:
+      domain = rng.choices(DOMAINS, DOMAIN_WEIGHTS)[0]
+      record.add_email(f'{first.lower()}_{last.lower()}{number}@{domain}')
+    if rng.random() < 0.7:
+      record.add_address(f'{rng.choice(CITIES)}, {rng.choice(STREETS)} {rng.randrange(1, 200)}, apt {rng.randrange(1, 150)}')
+    if rng.random() < 0.8:
+      birthday = date.fromordinal(rng.randint(FIRST_BIRTHDAY, LAST_BIRTHDAY))
+      if (birthday.month, birthday.day) == (2, 29):
+        birthday -= timedelta(days=1)
+      record.add_birthday(birthday.strftime('%d.%m.%Y'))
+    yield record
+
+
+def generate_notes(count, rng):
+  start = datetime(2020, 1, 1)
+  for number in range(count):
+    note_record = NoteRecord(' '.join(rng.choices(WORDS, k=rng.randint(5, 20))))
+    note_record.ctreated = start + timedelta(seconds=rng.randrange(5 * 365 * 24 * 3600))
+    for tag in rng.choices(TAGS, TAG_WEIGHTS, k=rng.choices([0, 1, 2, 3, 4], [10, 30, 30, 20, 10])[0]):
+      note_record.add_tag(tag)
+    yield note_record
+
+
+def build_contacts(size, seed):
+  book = AddressBook()
+  with gc_paused():
+    for record in generate_contacts(size, random.Random(seed)):
+      book.add_record(record)
+  return book
+
+
+def build_notes(size, seed):
+  note_book = NoteBook()
+  with gc_paused():
+    for note_record in generate_notes(size, random.Random(seed + 1)):
+      note_book.add_note(note_record)
+  return note_book
+
+
+def rebuild_name_index(book, name):
+  book.name_index = None
+  book.suggest_names(name)
+
+
+def rebuild_pattern_indexes(book):
+  book.pattern_indexes = {}
+  for field in PATTERN_FIELDS:
+    book.matches(field, 'prefix', '')
+
+
+def field_values(record, field):
+  if field == 'name':
+    return [record.name.value.lower()]
+  if field == 'phone':
+    return [phone.value for phone in record.phones]
+  return [record.email.value.lower()] if record.email else []
+
+
+def first_matches(book, field, mode, text, limit=100):
+  if hasattr(book, 'find_matching'):
+    return list(islice(book.find_matching(field, mode, text), limit))
+  test = str.startswith if mode == 'prefix' else str.endswith
+  text = text if field == 'phone' else text.lower()
+  found = (record for record in book.data.values() if any(test(value, text) for value in field_values(record, field)))
+  return list(islice(found, limit))
+
+
+def extract_names(book, name):
+  return [match for match, score in process.extract(name, list(book.data.keys()), limit=None) if score >= 60]
+
+
+def tagged_notes(note_book, tags):
+  if hasattr(note_book, 'find_by_tags'):
+    return note_book.find_by_tags(tags)
+  return [(id, note_record) for id, note_record in note_book.data.items() if all(tag in note_record.tags for tag in tags)]
+
+
+def latest_notes(note_book, count):
+  if hasattr(note_book, 'latest_notes'):
+    return note_book.latest_notes(count)
+  return nlargest(count, note_book.data.items(), key=lambda item: item[0])
+
+
+def note_range(note_book, first, last):
+  if hasattr(note_book, 'notes_between'):
+    return list(note_book.notes_between(first, last))
+  return [(id, note_record) for id, note_record in note_book.data.items() if first <= id <= last]
+
+
+def misspell(name, rng):
+  position = rng.randrange(1, len(name))
+  return name[:position] + rng.choice('aeiouy') + name[position + 1:]
+
+
+class Runner:
+  def __init__(self, repeat):
+    self.repeat = repeat
+    self.results = []
+
+  def record(self, name, size, seconds, ops=1, **extra):
+    result = {'benchmark': name, 'size': size, 'ops': ops, 'seconds_per_op': seconds / ops, **extra}
+    self.results.append(result)
+    return result
+
+  def time(self, name, size, function, calls):
+    runs = []
+    for _ in range(self.repeat):
+      start = time.perf_counter()
+      for args in calls:
+        function(*args)
+      runs.append(time.perf_counter() - start)
+    return self.record(name, size, min(runs), len(calls), median_seconds_per_op=statistics.median(runs) / len(calls))
+
+
+def run_size(runner, size, seed, queries, fuzzy_queries):
+  rng = random.Random(seed + 2)
+  book, contacts_memory = measure(lambda: build_contacts(size, seed))
+  runner.record('memory_per_contact', size, 0, bytes=contacts_memory / size)
+  note_book, notes_memory = measure(lambda: build_notes(size, seed))
+  runner.record('memory_per_note', size, 0, bytes=notes_memory / size)
+  records = list(book.data.values())
+
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'addressbook.pkl')
+    result = runner.time('save_data', size, save_data, [(book, filename)])
+    result['file_bytes'] = os.path.getsize(filename)
+    runner.time('load_data', size, load_data, [(filename,)])
+
+  sample = [rng.choice(records) for _ in range(queries)]
+  phones = [(record.phones[0].value,) for record in sample]
+  phones += [(f'{rng.choice(OPERATORS)}{rng.randrange(10**7):07d}',) for _ in range(queries)]
+  runner.time('find_by_phone', size, book.find_by_phone, phones)
+  birthdays = [(record.birthday.value.strftime('%d.%m.%Y'),) for record in sample if record.birthday]
+  birthdays += [(record.birthday.value.strftime('%d.%m'),) for record in sample if record.birthday]
+  runner.time('find_by_brthd', size, book.find_by_brthd, birthdays)
+  runner.time('get_upcoming_birthdays_7', size, book.get_upcoming_birthdays, [(7,)] * 10)
+  runner.time('get_upcoming_birthdays_30', size, book.get_upcoming_birthdays, [(30,)] * 10)
+
+  if hasattr(book, 'pattern_indexes'):
+    runner.time('pattern_index_build', size, rebuild_pattern_indexes, [(book,)])
+  runner.time('search_phone_prefix_100', size, first_matches, [(book, 'phone', 'prefix', record.phones[0].value[:4]) for record in sample])
+  runner.time('search_name_prefix_100', size, first_matches, [(book, 'name', 'prefix', record.name.value[:2]) for record in sample])
+  runner.time('search_email_suffix_100', size, first_matches, [(book, 'email', 'suffix', '@' + record.email.value.split('@')[1]) for record in sample if record.email])
+
+  tags = [([tag],) for tag in rng.choices(TAGS, TAG_WEIGHTS, k=queries)]
+  runner.time('find_by_tag', size, tagged_notes, [(note_book, *tag) for tag in tags])
+  pairs = [(note_book, rng.sample(TAGS[:10], 2)) for _ in range(queries)]
+  runner.time('find_by_tags_and', size, tagged_notes, pairs)
+  runner.time('latest_notes_20', size, latest_notes, [(note_book, 20)] * queries)
+  ranges = [(note_book, start, start + 99) for start in (rng.randrange(1, size + 1) for _ in range(queries))]
+  runner.time('notes_between_100', size, note_range, ranges)
+
+  names = [misspell(record.name.value, rng) for record in sample[:fuzzy_queries]]
+  runner.time('suggest_names_extract', size, extract_names, [(book, name) for name in names])
+  if hasattr(book, 'suggest_names'):
+    runner.time('name_index_build', size, rebuild_name_index, [(book, records[0].name.value)])
+    runner.time('suggest_names', size, book.suggest_names, [(name,) for name in names])
+
+  if hasattr(address_book_pickle, 'set_interactive'):
+    address_book_pickle.set_interactive(False)
+    runner.time('show_all_page', size, show_all, [(book, ['--page', str(rng.randrange(1, max(size // 100, 1) + 1)), '--size', '100']) for _ in range(10)])
+
+
+def git_revision():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return 'unknown'
+
+
+def format_value(item):
+  if 'bytes' in item:
+    return f"{item['bytes']:.0f} B"
+  return f"{item['seconds_per_op'] * 1e6:.1f} us"
+
+
+def value(item):
+  return item.get('bytes', item['seconds_per_op'])
+
+
+def report(results, baseline=None):
+  previous = {(item['benchmark'], item['size']): item for item in baseline['results']} if baseline else {}
+  table = PrettyTable()
+  table.field_names = ['benchmark', 'size', 'result', 'file size'] + (['baseline', 'change'] if baseline else [])
+  table.align = 'r'
+  for item in results:
+    row = [item['benchmark'], item['size'], format_value(item), item.get('file_bytes', '')]
+    if baseline:
+      old = previous.get((item['benchmark'], item['size']))
+      row += [format_value(old), f'{value(item) / value(old):.2f}x'] if old and value(old) else ['-', '-']
+    table.add_row(row)
+  return table
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Benchmarks for the address book and notebook')
+  parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of contacts and notes to generate')
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--queries', type=int, default=1000, help='lookups per query benchmark')
+  parser.add_argument('--fuzzy-queries', type=int, default=20, help='misspelled names for the fuzzy name search')
+  parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark, the best one is reported')
+  parser.add_argument('--output', metavar='FILE', default='bench_results.json', help='where to write the results as JSON')
+  parser.add_argument('--compare', metavar='FILE', help='results of an earlier run to compare with')
+  return parser.parse_args()
+
+
+def main():
+  options = parse_args()
+  runner = Runner(options.repeat)
+  for size in options.sizes:
+    print(f'benchmarking {size} contacts and notes...', file=sys.stderr)
+    run_size(runner, size, options.seed, options.queries, options.fuzzy_queries)
+  results = {
+    'revision': git_revision(),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'date': datetime.now().isoformat(timespec='seconds'),
+    'seed': options.seed,
+    'results': runner.results,
+  }
+  with open(options.output, 'w', encoding='utf-8') as f:
+    json.dump(results, f, indent=1)
+  baseline = None
+  if options.compare:
+    with open(options.compare, encoding='utf-8') as f:
+      baseline = json.load(f)
+  print(report(runner.results, baseline))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,107 @@
+import pickle
+import random
+import sys
+import tracemalloc
+from collections import UserDict
+from datetime import datetime
+from address_book_pickle import AddressBook, Record
+from note_book import NoteBook, NoteRecord
+
+
+CITIES = ['Kyiv', 'Lviv', 'Odesa', 'Kharkiv', 'Dnipro', 'Zaporizhzhia', 'Vinnytsia', 'Poltava']
+STREETS = ['Shevchenka', 'Franka', 'Hrushevskoho', 'Sadova', 'Tsentralna', 'Lesi Ukrainky', 'Soborna']
+TAGS = ['work', 'home', 'urgent', 'ideas', 'shopping', 'family', 'travel', 'books', 'health', 'money']
+
+
+class LegacyField:
+  def __init__(self, value):
+    self.value = value
+
+
+class LegacyRecord:
+  def __init__(self, name):
+    self.name = LegacyField(name)
+    self.phones = []
+    self.birthday = None
+    self.email = None
+    self.address = None
+
+  def add_phone(self, phone):
+    self.phones.append(LegacyField(phone))
+
+  def add_email(self, email):
+    self.email = LegacyField(email)
+
+  def add_address(self, address):
+    self.address = LegacyField(address)
+
+  def add_birthday(self, birthday):
+    self.birthday = LegacyField(datetime.strptime(birthday, '%d.%m.%Y'))
+
+
+class LegacyNoteRecord:
+  def __init__(self, note):
+    self.note = LegacyField(note)
+    self.tags = []
+    self.ctreated = datetime.now()
+
+  def add_tag(self, tag):
+    self.tags.append(tag)
+
+
+def make_contacts(count, rng, record_class=Record):
+  for number in range(count):
+    record = record_class(f'Contact{number}')
+    record.add_phone(f'0{rng.randrange(10**9):09d}')
+    if rng.random() < 0.5:
+      record.add_phone(f'0{rng.randrange(10**9):09d}')
+    record.add_email(f'user{number}@mail.com')
+    record.add_address(f'{rng.choice(CITIES)}, {rng.choice(STREETS)} {rng.randrange(1, 200)}')
+    record.add_birthday(f'{rng.randrange(1, 29):02d}.{rng.randrange(1, 13):02d}.{rng.randrange(1950, 2010)}')
+    yield record
+
+
+def make_notes(count, rng, record_class=NoteRecord):
+  for number in range(count):
+    note_record = record_class(f'Note number {number} about {rng.choice(TAGS)}')
+    for tag in rng.sample(TAGS, 3):
+      note_record.add_tag(''.join(tag))
+    yield note_record
+
+
+def measure(build):
+  tracemalloc.start()
+  before = tracemalloc.take_snapshot()
+  objects = build()
+  after = tracemalloc.take_snapshot()
+  tracemalloc.stop()
+  size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+  return objects, size
+
+
+def legacy_sizes(count):
+  contacts, contacts_size = measure(lambda: list(make_contacts(count, random.Random(1), LegacyRecord)))
+  notes, notes_size = measure(lambda: list(make_notes(count, random.Random(2), LegacyNoteRecord)))
+  book = UserDict((record.name.value, record) for record in contacts)
+  note_book = UserDict(enumerate(notes, 1))
+  return contacts_size, len(pickle.dumps(book)), notes_size, len(pickle.dumps(note_book))
+
+
+def main(count=20_000):
+  legacy_contacts, legacy_contacts_pickled, legacy_notes, legacy_notes_pickled = legacy_sizes(count)
+  contacts, contacts_size = measure(lambda: list(make_contacts(count, random.Random(1))))
+  notes, notes_size = measure(lambda: list(make_notes(count, random.Random(2))))
+  book = AddressBook()
+  for record in contacts:
+    book.add_record(record)
+  note_book = NoteBook()
+  for note_record in notes:
+    note_book.add_note(note_record)
+  print(f'legacy contacts: {legacy_contacts / count:.0f} bytes in memory, {legacy_contacts_pickled / count:.0f} bytes pickled per contact')
+  print(f'contacts: {contacts_size / count:.0f} bytes in memory ({1 - contacts_size / legacy_contacts:.0%} less), {len(pickle.dumps(book)) / count:.0f} bytes pickled per contact')
+  print(f'legacy notes: {legacy_notes / count:.0f} bytes in memory, {legacy_notes_pickled / count:.0f} bytes pickled per note')
+  print(f'notes: {notes_size / count:.0f} bytes in memory ({1 - notes_size / legacy_notes:.0%} less), {len(pickle.dumps(note_book)) / count:.0f} bytes pickled per note')
+
+
+if __name__ == "__main__":
+  main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,275 @@
+import csv
+import gc
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from address_book_pickle import input_error
+from note_book import NoteRecord
+from batch_validation import CHUNK_SIZE, ROW_ERRORS, validate_chunks
+
+
+MAX_REPORTED = 20
+CONTACT_FIELDS = ['name', 'phones', 'email', 'address', 'birthday']
+NOTE_FIELDS = ['id', 'note', 'tags', 'created']
+PHONE_SEPARATORS = re.compile(r'[\s\-().]')
+VCARD_SPECIAL = re.compile(r'([\\,;])')
+VCARD_SPLIT = re.compile(r'(?<!\\);')
+VCARD_UNESCAPE = re.compile(r'\\(.)')
+
+
+def file_format(filename, fmt=None):
+  fmt = (fmt or os.path.splitext(filename)[1].lstrip('.')).lower()
+  if fmt in ('vcard', 'vcf'):
+    return 'vcf'
+  if fmt in ('json', 'jsonl', 'ndjson'):
+    return 'jsonl'
+  if fmt == 'csv':
+    return 'csv'
+  raise ValueError('\nUse one of the formats: csv, jsonl, vcf\n')
+
+
+def read_csv(f):
+  reader = csv.DictReader(f)
+  for row in reader:
+    yield reader.line_num, row
+
+
+def read_jsonl(f):
+  for number, line in enumerate(f, 1):
+    if line.strip():
+      yield number, line
+
+
+def vcard_unescape(value):
+  return VCARD_UNESCAPE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+def vcard_lines(f):
+  number, line = 0, None
+  for current, text in enumerate(f, 1):
+    text = text.rstrip('\r\n')
+    if text[:1] in (' ', '\t') and line is not None:
+      line += text[1:]
+      continue
+    if line is not None:
+      yield number, line
+    number, line = current, text
+  if line is not None:
+    yield number, line
+
+
+def read_vcard(f):
+  row = None
+  for number, line in vcard_lines(f):
+    name, sep, value = line.partition(':')
+    prop = name.split(';', 1)[0].split('.')[-1].upper()
+    if prop == 'BEGIN':
+      row = {'number': number, 'phones': []}
+    elif row is None:
+      continue
+    elif prop == 'END':
+      yield row.pop('number'), row
+      row = None
+    elif prop == 'FN':
+      row['name'] = vcard_unescape(value)
+    elif prop == 'N' and 'name' not in row:
+      parts = [vcard_unescape(part) for part in VCARD_SPLIT.split(value)]
+      row['name'] = ' '.join(part for part in parts[1::-1] if part)
+    elif prop == 'TEL':
+      row['phones'].append(PHONE_SEPARATORS.sub('', value))
+    elif prop == 'EMAIL':
+      row.setdefault('email', value)
+    elif prop == 'ADR':
+      parts = [vcard_unescape(part).strip() for part in VCARD_SPLIT.split(value)]
+      row.setdefault('address', ', '.join(part for part in parts if part))
+    elif prop == 'BDAY':
+      row['birthday'] = vcard_birthday(value)
+
+
+def vcard_birthday(value):
+  digits = value.replace('-', '')
+  if len(digits) == 8 and digits.isdigit():
+    return f'{digits[6:8]}.{digits[4:6]}.{digits[:4]}'
+  return value
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'vcf': read_vcard}
+
+
+def note_from_row(row):
+  if isinstance(row, str):
+    row = json.loads(row)
+  text = (row.get('note') or '').strip()
+  if not text:
+    raise ValueError('Missing note text')
+  note_record = NoteRecord(text)
+  tags = row.get('tags') or []
+  if isinstance(tags, str):
+    tags = tags.split()
+  for tag in tags:
+    note_record.add_tag(tag)
+  if row.get('created'):
+    note_record.ctreated = datetime.fromisoformat(row['created'])
+  return note_record
+
+
+def chunks(rows, size=CHUNK_SIZE):
+  while True:
+    chunk = list(islice(rows, size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def note_batches(rows, first_id):
+  id = first_id
+  for chunk in chunks(rows):
+    items, errors = [], []
+    for number, row in chunk:
+      try:
+        note_record = note_from_row(row)
+      except ROW_ERRORS as e:
+        errors.append((number, str(e)))
+        continue
+      items.append((id, note_record))
+      id += 1
+    yield items, errors
+
+
+def store_batches(book, batches):
+  imported = skipped = 0
+  for items, errors in batches:
+    for number, message in errors[:max(MAX_REPORTED - skipped, 0)]:
+      print(f'line {number}: {message}')
+    skipped += len(errors)
+    imported += book.put_many(items)
+  return imported, skipped
+
+
+@contextmanager
+def gc_paused():
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if enabled:
+      gc.enable()
+
+
+def import_file(filename, book, kind, fmt=None, workers=0):
+  reader = READERS[file_format(filename, fmt)]
+  with open(filename, encoding='utf-8', newline='') as f, gc_paused():
+    if kind == 'contacts':
+      batches = validate_chunks(chunks(reader(f)), workers)
+    else:
+      batches = note_batches(reader(f), book.next_id())
+    return store_batches(book, batches)
+
+
+def contact_values(record):
+  return (
+    record.name.value,
+    [phone.value for phone in record.phones],
+    record.email.value if record.email else '',
+    record.address.value if record.address else '',
+    record.birthday.value.strftime('%d.%m.%Y') if record.birthday else '',
+  )
+
+
+def note_values(id, note_record):
+  return (id, note_record.note.value, sorted(note_record.tags), note_record.ctreated.isoformat())
+
+
+def write_csv(f, fields, rows):
+  writer = csv.writer(f)
+  writer.writerow(fields)
+  for row in rows:
+    writer.writerow([' '.join(value) if isinstance(value, list) else value for value in row])
+
+
+def write_jsonl(f, fields, rows):
+  for row in rows:
+    f.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False))
+    f.write('\n')
+
+
+def vcard_escape(value):
+  return VCARD_SPECIAL.sub(r'\\\1', value).replace('\n', '\\n')
+
+
+def write_vcard(f, fields, rows):
+  for name, phones, email, address, birthday in rows:
+    name = vcard_escape(name)
+    f.write(f'BEGIN:VCARD\r\nVERSION:3.0\r\nFN:{name}\r\nN:;{name};;;\r\n')
+    for phone in phones:
+      f.write(f'TEL;TYPE=CELL:{phone}\r\n')
+    if email:
+      f.write(f'EMAIL:{email}\r\n')
+    if address:
+      f.write(f'ADR:;;{vcard_escape(address)};;;;\r\n')
+    if birthday:
+      day, month, year = birthday.split('.')
+      f.write(f'BDAY:{year}-{month}-{day}\r\n')
+    f.write('END:VCARD\r\n')
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'vcf': write_vcard}
+
+
+def export_file(filename, fields, rows, fmt=None):
+  fmt = file_format(filename, fmt)
+  if fmt == 'vcf' and fields is not CONTACT_FIELDS:
+    raise ValueError('\nOnly contacts can be exported to vCard\n')
+  count = 0
+  def counted():
+    nonlocal count
+    for row in rows:
+      count += 1
+      yield row
+  tmp_filename = filename + '.tmp'
+  with open(tmp_filename, 'w', encoding='utf-8', newline='') as f:
+    WRITERS[fmt](f, fields, counted())
+  os.replace(tmp_filename, filename)
+  return count
+
+
+def parse_workers(args):
+  if '--workers' not in args:
+    return args, 0
+  position = args.index('--workers')
+  workers = args[position + 1] if position + 1 < len(args) else ''
+  if not workers.isdigit():
+    raise ValueError('\nUse: --workers <number of processes>\n')
+  return args[:position] + args[position + 2:], int(workers)
+
+
+@input_error
+def import_data(args, book, note_book):
+  args, workers = parse_workers(list(args))
+  kind, filename, *fmt = args
+  if kind == 'contacts':
+    imported, errors = import_file(filename, book, kind, *fmt, workers=workers)
+  elif kind == 'notes':
+    imported, errors = import_file(filename, note_book, kind, *fmt)
+  else:
+    raise ValueError('\nUse: import contacts|notes <file> [csv|jsonl|vcf] [--workers N]\n')
+  message = f'Imported {imported} {kind} from {filename}.'
+  if errors:
+    message += f' Skipped {errors} bad rows.'
+  return message
+
+
+@input_error
+def export_data(args, book, note_book):
+  kind, filename, *fmt = args
+  if kind == 'contacts':
+    count = export_file(filename, CONTACT_FIELDS, (contact_values(record) for record in book.values()), *fmt)
+  elif kind == 'notes':
+    count = export_file(filename, NOTE_FIELDS, (note_values(id, note_record) for id, note_record in note_book.items()), *fmt)
+  else:
+    raise ValueError('\nUse: export contacts|notes <file> [csv|jsonl|vcf]\n')
+  return f'Exported {count} {kind} to {filename}.'
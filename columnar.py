@@ -0,0 +1,358 @@
+import pickle
+import struct
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+from address_book_pickle import AddressBook, Record, Name, Phone, Email, Address, Birthday, field_value, save_data
+from note_book import NoteBook, NoteRecord, Note
+from bulk_io import gc_paused
+
+
+MAGIC = b'F2PCOL1\n'
+HEADER = struct.Struct('<8sBBBQI')
+VERSION = 2
+VERSIONS = (1, 2)
+CONTACTS = ord('C')
+NOTES = ord('N')
+SECTION = struct.Struct('<cQ')
+EPOCH = datetime(1, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+MAX_PHONE = 10 ** 10
+MAX_ORDINAL = date.max.toordinal()
+MAX_MICROSECONDS = (datetime.max - EPOCH) // MICROSECOND
+NAIVE = -2 ** 31
+MAX_OFFSET = 24 * 60 * 60
+ENTRY = struct.Struct('<cI')
+LEGACY_CLASSES = {
+  ('address_book_pickle', 'Record'), ('address_book_pickle', 'Name'), ('address_book_pickle', 'Phone'),
+  ('address_book_pickle', 'Email'), ('address_book_pickle', 'Address'), ('address_book_pickle', 'Birthday'),
+  ('note_book', 'NoteRecord'), ('note_book', 'Note'),
+  ('datetime', 'datetime'), ('datetime', 'timezone'), ('datetime', 'timedelta'),
+}
+
+
+class Writer:
+  def __init__(self):
+    self.parts = []
+
+  def array(self, typecode, values):
+    values = array(typecode, values)
+    if sys.byteorder == 'big':
+      values.byteswap()
+    self.parts.append(SECTION.pack(typecode.encode(), len(values)))
+    self.parts.append(values.tobytes())
+
+  def text(self, values):
+    self.array('I', (len(value) for value in values))
+    data = ''.join(values).encode('utf-8', 'surrogatepass')
+    self.parts.append(SECTION.pack(b's', len(data)))
+    self.parts.append(data)
+
+  def column(self, values):
+    table = {}
+    indexes = array('i', (-1 if value is None else table.setdefault(value, len(table)) for value in values))
+    self.text(list(table))
+    self.array('i', indexes)
+
+  def getvalue(self):
+    return b''.join(self.parts)
+
+
+class Reader:
+  def __init__(self, data):
+    self.view = memoryview(data)
+    self.offset = 0
+
+  def section(self, typecode, itemsize):
+    if self.offset + SECTION.size > len(self.view):
+      raise ValueError('Columnar book file is truncated')
+    code, count = SECTION.unpack_from(self.view, self.offset)
+    self.offset += SECTION.size
+    if code != typecode:
+      raise ValueError('Columnar book file is corrupt')
+    end = self.offset + count * itemsize
+    if end > len(self.view):
+      raise ValueError('Columnar book file is truncated')
+    data = self.view[self.offset:end]
+    self.offset = end
+    return data
+
+  def array(self, typecode):
+    values = array(typecode)
+    values.frombytes(self.section(typecode.encode(), values.itemsize))
+    if sys.byteorder == 'big':
+      values.byteswap()
+    return values
+
+  def text(self):
+    lengths = self.array('I')
+    data = str(self.section(b's', 1), 'utf-8', 'surrogatepass')
+    offsets = [0, *accumulate(lengths)]
+    if offsets[-1] != len(data):
+      raise ValueError('Columnar book file is corrupt')
+    return [data[start:end] for start, end in zip(offsets, offsets[1:])]
+
+  def column(self, count):
+    table = self.text()
+    indexes = self.array('i')
+    check_column(indexes, count, -1, len(table))
+    return [None if index < 0 else table[index] for index in indexes]
+
+
+def check_length(values, count):
+  if len(values) != count:
+    raise ValueError('Columnar book file is corrupt')
+
+
+def check_column(values, count, low, high):
+  check_length(values, count)
+  if values and (min(values) < low or max(values) >= high):
+    raise ValueError('Columnar book file is corrupt')
+
+
+def field(cls, value):
+  item = cls.__new__(cls)
+  field_value.__set__(item, value)
+  return item
+
+
+def encode_phone(phone, extra):
+  number = field_value.__get__(phone)
+  if isinstance(number, int):
+    return number
+  extra.append(number)
+  return -len(extra)
+
+
+def decode_phone(number, extra):
+  if number >= 0:
+    return field(Phone, number)
+  return field(Phone, extra[-number - 1])
+
+
+def write_contacts(book, writer):
+  records = list(book.data.values())
+  keys = list(book.data.keys())
+  writer.text(keys)
+  writer.text([record.name.value for record in records])
+  extra = []
+  writer.array('B', (len(record.phones) for record in records))
+  writer.array('q', (encode_phone(phone, extra) for record in records for phone in record.phones))
+  writer.text(extra)
+  writer.column([record.email.value if record.email else None for record in records])
+  writer.column([record.address.value if record.address else None for record in records])
+  writer.array('i', (field_value.__get__(record.birthday) if record.birthday else 0 for record in records))
+
+
+def read_contacts(book, reader):
+  keys = reader.text()
+  count = len(keys)
+  names = reader.text()
+  phone_counts = reader.array('B')
+  phones = reader.array('q')
+  extra = reader.text()
+  emails = reader.column(count)
+  addresses = reader.column(count)
+  birthdays = reader.array('i')
+  check_length(names, count)
+  check_column(phone_counts, count, 0, 256)
+  check_column(phones, sum(phone_counts), -len(extra), MAX_PHONE)
+  check_column(birthdays, count, 0, MAX_ORDINAL + 1)
+  data = book.data
+  position = 0
+  for key, name, phone_count, email, address, birthday in zip(keys, names, phone_counts, emails, addresses, birthdays):
+    record = Record.__new__(Record)
+    record._book = book
+    record._key = key
+    record.name = field(Name, name)
+    record.phones = [decode_phone(number, extra) for number in phones[position:position + phone_count]]
+    position += phone_count
+    record.email = field(Email, email) if email is not None else None
+    record.address = field(Address, sys.intern(address)) if address is not None else None
+    record.birthday = field(Birthday, birthday) if birthday else None
+    data[key] = record
+
+
+def utc_offset(created):
+  offset = created.utcoffset()
+  if offset is None:
+    return NAIVE
+  return offset // timedelta(seconds=1)
+
+
+def created_at(microseconds, offset):
+  created = EPOCH + microseconds * MICROSECOND
+  if offset == NAIVE:
+    return created
+  return created.replace(tzinfo=timezone(timedelta(seconds=offset)))
+
+
+def write_notes(book, writer):
+  records = list(book.data.values())
+  writer.array('q', book.data.keys())
+  writer.text([note_record.note.value for note_record in records])
+  writer.array('q', ((note_record.ctreated.replace(tzinfo=None) - EPOCH) // MICROSECOND for note_record in records))
+  writer.array('i', (utc_offset(note_record.ctreated) for note_record in records))
+  writer.array('I', (len(note_record.tags) for note_record in records))
+  writer.column([tag for note_record in records for tag in sorted(note_record.tags)])
+  writer.array('q', [book.last_id])
+
+
+def read_notes(book, reader, version=VERSION):
+  ids = reader.array('q')
+  count = len(ids)
+  notes = reader.text()
+  created = reader.array('q')
+  offsets = reader.array('i')
+  tag_counts = reader.array('I')
+  tags = reader.column(sum(tag_counts))
+  sequence = reader.array('q') if version > 1 else [0]
+  check_length(notes, count)
+  check_column(created, count, 0, MAX_MICROSECONDS + 1)
+  check_length(offsets, count)
+  if any(offset != NAIVE and not -MAX_OFFSET < offset < MAX_OFFSET for offset in offsets):
+    raise ValueError('Columnar book file is corrupt')
+  check_length(tag_counts, count)
+  if None in tags:
+    raise ValueError('Columnar book file is corrupt')
+  check_length(sequence, 1)
+  book.last_id = sequence[0]
+  data = book.data
+  position = 0
+  for id, note, microseconds, offset, tag_count in zip(ids, notes, created, offsets, tag_counts):
+    note_record = NoteRecord.__new__(NoteRecord)
+    note_record._book = book
+    note_record._key = id
+    note_record.note = field(Note, note)
+    note_record.tags = {sys.intern(tag) for tag in tags[position:position + tag_count]}
+    position += tag_count
+    note_record.ctreated = created_at(microseconds, offset)
+    data[id] = note_record
+
+
+def dump(book, level=0):
+  writer = Writer()
+  if isinstance(book, NoteBook):
+    kind = NOTES
+    write_notes(book, writer)
+  else:
+    kind = CONTACTS
+    write_contacts(book, writer)
+  body = writer.getvalue()
+  if level:
+    body = zlib.compress(body, level)
+  return HEADER.pack(MAGIC, VERSION, kind, level, len(body), zlib.crc32(body)) + body
+
+
+def load(data, factory):
+  if len(data) < HEADER.size:
+    raise ValueError('Not a columnar book file')
+  magic, version, kind, level, length, checksum = HEADER.unpack_from(data)
+  if magic != MAGIC:
+    raise ValueError('Not a columnar book file')
+  if version not in VERSIONS:
+    raise ValueError(f'Unsupported columnar book version {version}')
+  body = memoryview(data)[HEADER.size:]
+  if len(body) != length:
+    raise ValueError('Columnar book file is truncated')
+  if zlib.crc32(body) != checksum:
+    raise ValueError('Columnar book file is corrupt')
+  if level:
+    body = zlib.decompress(body)
+  book = factory()
+  if isinstance(book, NoteBook) != (kind == NOTES):
+    raise ValueError('Columnar book file holds a different kind of book')
+  reader = Reader(body)
+  with gc_paused():
+    if kind == NOTES:
+      book.text_index = None
+      read_notes(book, reader, version)
+    else:
+      read_contacts(book, reader)
+    if reader.offset != len(reader.view):
+      raise ValueError('Columnar book file is corrupt')
+    book.rebuild_index()
+  return book
+
+
+class ForbiddenClass(pickle.UnpicklingError):
+  pass
+
+
+class JournalUnpickler(pickle.Unpickler):
+  def find_class(self, module, name):
+    if (module, name) not in LEGACY_CLASSES:
+      raise ForbiddenClass(f'{module}.{name} is not allowed in a journal')
+    return super().find_class(module, name)
+
+
+def read_legacy_entries(f):
+  unpickler = JournalUnpickler(f)
+  while True:
+    try:
+      yield unpickler.load()
+    except ForbiddenClass:
+      raise
+    except (EOFError, ValueError, pickle.UnpicklingError):
+      return
+
+
+def dump_entry(entry):
+  op, key, record = entry
+  if op == 'put':
+    book = NoteBook() if isinstance(record, NoteRecord) else AddressBook()
+    book.data[key] = record
+    book.last_id = key if isinstance(book, NoteBook) else 0
+    payload = dump(book)
+  else:
+    payload = str(key).encode('utf-8', 'surrogatepass')
+  return ENTRY.pack(op[:1].encode(), len(payload)) + payload
+
+
+def read_entries(filename, factory):
+  notes = isinstance(factory(), NoteBook)
+  with open(filename, 'rb') as f:
+    if f.peek(1)[:1] == b'\x80':
+      yield from read_legacy_entries(f)
+      return
+    while True:
+      head = f.read(ENTRY.size)
+      if len(head) < ENTRY.size:
+        return
+      op, length = ENTRY.unpack(head)
+      payload = f.read(length)
+      if len(payload) < length:
+        return
+      if op == b'p':
+        try:
+          book = load(payload, factory)
+        except ValueError:
+          return
+        for key, record in book.data.items():
+          yield 'put', key, record
+      elif op == b'd':
+        key = payload.decode('utf-8', 'surrogatepass')
+        yield 'del', int(key) if notes else key, None
+      else:
+        return
+
+
+class ColumnarSnapshot:
+  def __init__(self, level=0):
+    self.level = level
+
+  def read(self, filename, factory):
+    try:
+      with open(filename, 'rb') as f:
+        data = f.read()
+    except FileNotFoundError:
+      return factory()
+    return load(data, factory)
+
+  def write(self, book, filename):
+    save_data(book, filename, lambda book, f: f.write(dump(book, self.level)))
+
+  dump_entry = staticmethod(dump_entry)
+  read_entries = staticmethod(read_entries)
@@ -0,0 +1,269 @@
+import re
+from bisect import bisect_left
+from itertools import chain, islice
+from address_book_pickle import DAYS_BEFORE_MONTH, input_error, normalize_address, day_of_year, contact_row, show_pages
+from pattern_index import PATTERN_FIELDS, PATTERN_LIMIT, field_values, fold, parse_pattern
+
+
+PREDICATE = re.compile(r'(name|phone|email|address|birthday):(.*)', re.IGNORECASE)
+BIRTHDAY_PATTERN = re.compile(r'(\d{1,2}|\*)(?:\.(\d{1,2}|\*)(?:\.(\d{4}|\*))?)?')
+EXACT_INDEXES = {'phone': 'phones_index', 'email': 'emails_index', 'address': 'addresses_index'}
+INTERSECT_RATIO = 4
+FILTER_SELECTIVITY = 0.1
+USAGE = '\nUse: search phone:067* AND birthday:03.* AND address:~Kyiv LIMIT 50\n'
+
+
+def matches_text(mode, text, value):
+  if mode == 'prefix':
+    return value.startswith(text)
+  if mode == 'suffix':
+    return value.endswith(text)
+  return text in value
+
+
+class ExactPredicate:
+  exact = True
+
+  def __init__(self, field, value):
+    self.field = field
+    self.text = f'{field}:{value}'
+    if field == 'name':
+      self.value = value.capitalize()
+      self.index = 'names'
+    else:
+      self.value = normalize_address(value) if field == 'address' else value
+      self.index = EXACT_INDEXES[field]
+
+  def postings(self, book):
+    if self.field == 'name':
+      return (self.value,) if self.value in book.data else ()
+    return getattr(book, self.index).get(self.value, {})
+
+  def estimate(self, book):
+    return len(self.postings(book))
+
+  def keys(self, book):
+    return iter(self.postings(book))
+
+  def test(self, record):
+    if self.field == 'name':
+      return record.name.value == self.value
+    if self.field == 'phone':
+      return any(phone.value == self.value for phone in record.phones)
+    if self.field == 'email':
+      return record.email is not None and record.email.value == self.value
+    return record.address is not None and normalize_address(record.address.value) == self.value
+
+
+class MatchPredicate:
+  exact = True
+
+  def __init__(self, field, mode, text, source):
+    self.field = field
+    self.mode = mode
+    self.text = f'{field}:{source}'
+    self.value = normalize_address(text) if field == 'address' else fold(field, text)
+    self.index = f'{field} {mode} table' if field in PATTERN_FIELDS and mode != 'contains' else None
+
+  def estimate(self, book):
+    return book.pattern_index(self.field).count(self.mode, self.value)
+
+  def keys(self, book):
+    seen = set()
+    for _, key in book.matches(self.field, self.mode, self.value):
+      if key not in seen:
+        seen.add(key)
+        yield key
+
+  def test(self, record):
+    if self.field == 'address':
+      values = [normalize_address(record.address.value)] if record.address else []
+    else:
+      values = [fold(self.field, value) for value in field_values(self.field, record)]
+    return any(matches_text(self.mode, self.value, value) for value in values)
+
+
+class BirthdayPredicate:
+  def __init__(self, value):
+    match = BIRTHDAY_PATTERN.fullmatch(value)
+    if not match:
+      raise ValueError('\nUse: birthday:dd.mm.yyyy, any part can be * (birthday:03.*, birthday:*.05)\n')
+    self.text = f'birthday:{value}'
+    self.day, self.month, self.year = (int(part) if part and part != '*' else None for part in match.groups())
+    if self.month is not None and not 1 <= self.month <= 12 or self.day is not None and not 1 <= self.day <= 31:
+      raise ValueError(f'\nNo such date: {value}\n')
+    if self.day is not None and self.month is not None:
+      self.index = 'birthdays_by_day'
+    elif self.month is not None:
+      self.index = 'birthdays_index'
+    elif self.day is not None:
+      self.index = 'birthdays_by_day, every month'
+    else:
+      self.index = None
+    self.exact = self.year is None
+
+  def month_range(self, book):
+    first = day_of_year(self.month, 1)
+    last = DAYS_BEFORE_MONTH[self.month + 1] if self.month < 12 else 366
+    index = book.birthdays_index
+    return bisect_left(index, (first,)), bisect_left(index, (last,))
+
+  def postings(self, book):
+    if self.month is not None:
+      return [book.birthdays_by_day.get((self.month, self.day), {})]
+    return [book.birthdays_by_day.get((month, self.day), {}) for month in range(1, 13)]
+
+  def estimate(self, book):
+    if self.day is None:
+      lo, hi = self.month_range(book)
+      return hi - lo
+    return sum(len(postings) for postings in self.postings(book))
+
+  def keys(self, book):
+    if self.day is None:
+      lo, hi = self.month_range(book)
+      return (key for _, key in book.birthdays_index[lo:hi])
+    return chain.from_iterable(self.postings(book))
+
+  def test(self, record):
+    if not record.birthday:
+      return False
+    birthday = record.birthday.value
+    return all(part is None or part == value for part, value in ((self.day, birthday.day), (self.month, birthday.month), (self.year, birthday.year)))
+
+
+def make_predicate(field, value):
+  value = value.strip()
+  if not value:
+    raise ValueError(f'\nGive me a value for {field}.\n')
+  if field == 'birthday':
+    return BirthdayPredicate(value)
+  if value.startswith('~') and len(value) > 1:
+    return MatchPredicate(field, 'contains', value[1:], value)
+  pattern = parse_pattern(value)
+  if pattern:
+    return MatchPredicate(field, *pattern, value)
+  return ExactPredicate(field, value)
+
+
+def parse_query(args):
+  terms = []
+  limit = PATTERN_LIMIT
+  args = list(args)
+  while args:
+    word = args.pop(0)
+    if word.upper() == 'AND':
+      if not terms or not args:
+        raise ValueError(USAGE)
+      continue
+    if word.upper() == 'LIMIT':
+      if not args or not args[0].isdigit():
+        raise ValueError(USAGE)
+      limit = int(args.pop(0))
+      continue
+    match = PREDICATE.fullmatch(word)
+    if match:
+      terms.append([match.group(1).lower(), match.group(2)])
+    elif terms:
+      terms[-1][1] += ' ' + word
+    else:
+      raise ValueError(USAGE)
+  if not terms:
+    raise ValueError(USAGE)
+  return [make_predicate(field, value) for field, value in terms], limit
+
+
+class Plan:
+  def __init__(self, book, predicates, limit=0):
+    if hasattr(book, 'load_all'):
+      book.load_all()
+    self.predicates = predicates
+    self.limit = limit
+    self.parts = getattr(book, 'shards', [book])
+    self.indexed = all(isinstance(getattr(part, 'phones_index', None), dict) for part in self.parts)
+    self.total = sum(len(part.data) for part in self.parts) if self.indexed else None
+    self.estimates = {}
+    if self.indexed:
+      for predicate in predicates:
+        if predicate.index is not None:
+          self.estimates[predicate] = sum(predicate.estimate(part) for part in self.parts)
+    indexed = sorted(self.estimates, key=self.estimates.get)
+    self.driver = indexed[0] if indexed else None
+    self.intersect = []
+    self.filters = []
+    rows = self.estimates[self.driver] if self.driver else self.total
+    for predicate in indexed[1:]:
+      if self.estimates[predicate] <= INTERSECT_RATIO * max(rows, 1):
+        self.intersect.append(predicate)
+        rows = min(rows, self.estimates[predicate])
+      else:
+        self.filters.append(predicate)
+    self.filters += [predicate for predicate in predicates if predicate not in self.estimates]
+    self.rechecks = [predicate for predicate in [self.driver, *self.intersect] if predicate is not None and not predicate.exact]
+
+  def part_records(self, part):
+    if self.driver is None:
+      candidates = part.values()
+    else:
+      postings = [set(predicate.keys(part)) for predicate in self.intersect]
+      candidates = (part.data[key] for key in self.driver.keys(part) if all(key in keys for keys in postings))
+    checks = self.rechecks + self.filters
+    for record in candidates:
+      if all(predicate.test(record) for predicate in checks):
+        yield record
+
+  def run(self):
+    records = chain.from_iterable(self.part_records(part) for part in self.parts)
+    return islice(records, self.limit) if self.limit else records
+
+  def steps(self):
+    if self.driver is None:
+      access = 'scan all contacts' if self.indexed else 'scan all contacts (this storage keeps no in-memory indexes)'
+      rows = self.total
+      yield 'all contacts', access, rows if rows is not None else '?'
+    else:
+      rows = self.estimates[self.driver]
+      yield self.driver.text, f'index {self.driver.index}', rows
+    for predicate in self.intersect:
+      rows = min(rows, self.estimates[predicate])
+      yield predicate.text, f'intersect with index {predicate.index} ({self.estimates[predicate]} keys)', f'<= {rows}'
+    for predicate in self.rechecks:
+      rows = rows * FILTER_SELECTIVITY
+      yield predicate.text, 'filter, the index has no year', f'~{rows:.0f}'
+    for predicate in self.filters:
+      if rows is None:
+        yield predicate.text, 'filter', '?'
+        continue
+      if predicate in self.estimates:
+        rows = rows * self.estimates[predicate] / max(self.total, 1)
+        access = f'filter, index {predicate.index} has {self.estimates[predicate]} keys'
+      else:
+        rows = rows * FILTER_SELECTIVITY
+        access = 'filter, no index'
+      yield predicate.text, access, f'~{rows:.0f}'
+    if self.limit:
+      yield f'LIMIT {self.limit}', 'stop early', ''
+
+  def explain(self):
+    from prettytable import PrettyTable
+    table = PrettyTable()
+    table.field_names = ['step', 'predicate', 'access', 'est. rows']
+    table.align = 'l'
+    for number, (predicate, access, rows) in enumerate(self.steps(), 1):
+      table.add_row([number, predicate, access, rows])
+    return table
+
+
+@input_error
+def search_query(args, book):
+  predicates, limit = parse_query(args)
+  records = Plan(book, predicates, limit).run()
+  return show_pages(['NAME', 'PHONES', 'EMAIL', 'ADDRESS', 'BIRTHDAY'], records, [], 'QUERY', empty='No contacts match the query.', row=contact_row)
+
+
+@input_error
+def explain(args, book):
+  if args and args[0].lower() == 'search':
+    args = args[1:]
+  predicates, limit = parse_query(args)
+  return Plan(book, predicates, limit).explain()
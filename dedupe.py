@@ -0,0 +1,263 @@
+import re
+import unicodedata
+from collections import deque
+from itertools import islice
+from fuzzywuzzy import fuzz
+from address_book_pickle import input_error, normalize_address, show_pages
+from bulk_io import gc_paused, parse_workers
+
+
+TOKEN = re.compile(r'\w+')
+SOUND_CODES = {char: digit for letters, digit in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')) for char in letters}
+MAX_BLOCK = 50
+WINDOW = 10
+MAX_PHONES = 2
+CHUNK_SIZE = 5000
+THRESHOLD = 70
+
+
+def sound(token):
+  last = SOUND_CODES.get(token[0])
+  code = [token[0]]
+  for char in token[1:]:
+    digit = SOUND_CODES.get(char)
+    if digit and digit != last:
+      code.append(digit)
+    if char not in 'hw':
+      last = digit
+  return ''.join(code[:6])
+
+
+def normalize_phone(phone):
+  digits = ''.join(str(unicodedata.digit(char, '')) for char in phone)
+  return digits[-9:]
+
+
+def features(record):
+  tokens = TOKEN.findall(record.name.value.lower())
+  email = record.email.value.lower() if record.email else None
+  local = email.split('@')[0].split('+')[0].replace('.', '') if email else None
+  return (
+    record.name.value,
+    ' '.join(sorted(tokens)),
+    ' '.join(sorted(sound(token) for token in tokens if not token.isdigit())),
+    frozenset(normalize_phone(phone.value) for phone in record.phones),
+    email,
+    local,
+    record.birthday.value.toordinal() if record.birthday else None,
+    normalize_address(record.address.value) if record.address else None,
+  )
+
+
+def blocking_keys(feature):
+  _, name, sounds, phones, _, local, _, _ = feature
+  yield 'name', name
+  if sounds:
+    yield 'sound', sounds
+  for phone in phones:
+    yield 'phone', phone
+  if local:
+    yield 'local', local
+
+
+def neighbour_order(table):
+  return lambda position: (table[position][1], sorted(table[position][3]), table[position][4] or '', position)
+
+
+def block_pairs(members, order):
+  if len(members) <= MAX_BLOCK:
+    for first in range(len(members)):
+      for second in range(first + 1, len(members)):
+        yield members[first], members[second]
+    return
+  members = sorted(members, key=order)
+  for first in range(len(members)):
+    for second in range(first + 1, min(first + 1 + WINDOW, len(members))):
+      yield min(members[first], members[second]), max(members[first], members[second])
+
+
+def candidate_pairs(table):
+  blocks = {}
+  for position, feature in enumerate(table):
+    for key in blocking_keys(feature):
+      blocks.setdefault(key, []).append(position)
+  order = neighbour_order(table)
+  seen = set()
+  for members in blocks.values():
+    if len(members) < 2:
+      continue
+    for pair in block_pairs(members, order):
+      if pair not in seen:
+        seen.add(pair)
+        yield pair
+
+
+def score(first, second):
+  name_score = 100 if first[1] == second[1] else fuzz.token_sort_ratio(first[1], second[1], force_ascii=False)
+  total = name_score * 0.6
+  reasons = [f'name {name_score}']
+  if first[1] == second[1]:
+    total += 10
+  if first[3] & second[3]:
+    total += 40
+    reasons.append('phone')
+  if first[4] and first[4] == second[4]:
+    total += 30
+    reasons.append('email')
+  elif first[5] and first[5] == second[5]:
+    total += 15
+    reasons.append('email name')
+  if first[6] and second[6]:
+    if first[6] == second[6]:
+      total += 10
+      reasons.append('birthday')
+    else:
+      total -= 30
+      reasons.append('other birthday')
+  if first[7] and first[7] == second[7]:
+    total += 10
+    reasons.append('address')
+  return min(round(total), 100), reasons
+
+
+def score_pairs(pairs, table, threshold):
+  matches = []
+  for first, second in pairs:
+    value, reasons = score(table[first], table[second])
+    if value >= threshold:
+      matches.append((first, second, value, reasons))
+  return matches
+
+
+def chunk_pairs(pairs, table):
+  pairs = iter(pairs)
+  while True:
+    chunk = list(islice(pairs, CHUNK_SIZE))
+    if not chunk:
+      return
+    positions = {position for pair in chunk for position in pair}
+    yield chunk, {position: table[position] for position in positions}
+
+
+def scored_chunks(chunks, threshold, workers=0):
+  if workers <= 1:
+    for pairs, table in chunks:
+      yield score_pairs(pairs, table, threshold)
+    return
+  from concurrent.futures import ProcessPoolExecutor
+  from sharded_book import pool_context
+  with ProcessPoolExecutor(workers, mp_context=pool_context()) as pool:
+    pending = deque()
+    for pairs, table in chunks:
+      pending.append(pool.submit(score_pairs, pairs, table, threshold))
+      if len(pending) >= workers * 2:
+        yield pending.popleft().result()
+    while pending:
+      yield pending.popleft().result()
+
+
+def find(parent, position):
+  while parent[position] != position:
+    parent[position] = parent[parent[position]]
+    position = parent[position]
+  return position
+
+
+def find_duplicates(book, threshold=THRESHOLD, workers=0):
+  with gc_paused():
+    table = [features(record) for record in book.values()]
+  parent = list(range(len(table)))
+  scores = {}
+  for matches in scored_chunks(chunk_pairs(candidate_pairs(table), table), threshold, workers):
+    for first, second, value, reasons in matches:
+      parent[find(parent, first)] = find(parent, second)
+      scores[first, second] = value, reasons
+  members, best = {}, {}
+  for (first, second), match in scores.items():
+    root = find(parent, first)
+    members.setdefault(root, set()).update((first, second))
+    best[root] = max(best.get(root, match), match)
+  result = [(best[root][0], sorted(table[position][0] for position in members[root]), best[root][1]) for root in members]
+  result.sort(key=lambda group: (-group[0], group[1]))
+  return result
+
+
+def richness(record):
+  return len(record.phones) + bool(record.email) + bool(record.address) + bool(record.birthday)
+
+
+def spelling(record):
+  name = record.name.value
+  return name != ' '.join(name.split()), name != name.strip().capitalize()
+
+
+def merge_group(book, names, threshold=THRESHOLD):
+  records = [record for record in (book.find(name) for name in names) if record is not None]
+  merged, kept, dropped = [], [], []
+  if len(records) < 2:
+    return None, merged, kept, dropped
+  primary = min(records, key=lambda record: (spelling(record), -richness(record), record.name.value))
+  for record in records:
+    if record is primary:
+      continue
+    value, reasons = score(features(primary), features(record))
+    if value < threshold or 'other birthday' in reasons:
+      kept.append(record.name.value)
+      continue
+    known = {normalize_phone(phone.value) for phone in primary.phones}
+    for phone in record.phones:
+      if normalize_phone(phone.value) in known:
+        continue
+      if len(primary.phones) >= MAX_PHONES:
+        dropped.append(phone.value)
+        continue
+      primary.add_phone(phone.value)
+      known.add(normalize_phone(phone.value))
+    if record.email and not primary.email:
+      primary.add_email(record.email.value)
+    if record.address and not primary.address:
+      primary.add_address(record.address.value)
+    if record.birthday and not primary.birthday:
+      primary.add_birthday(record.birthday.value.strftime('%d.%m.%Y'))
+    book.delete(record.name.value)
+    merged.append(record.name.value)
+  return primary.name.value, merged, kept, dropped
+
+
+def parse_dedupe_args(args):
+  args, workers = parse_workers(list(args))
+  threshold = THRESHOLD
+  merge = None
+  while args:
+    option = args.pop(0)
+    if option == '--threshold' and args and args[0].isdigit():
+      threshold = int(args.pop(0))
+    elif option == '--merge':
+      merge = set()
+      while args and args[0].isdigit():
+        merge.add(int(args.pop(0)))
+    else:
+      raise ValueError('\nUse: dedupe [--threshold N] [--workers N] [--merge [group numbers]]\n')
+  return threshold, workers, merge
+
+
+@input_error
+def dedupe(args, book):
+  threshold, workers, merge = parse_dedupe_args(args)
+  groups = find_duplicates(book, threshold, workers)
+  if not groups:
+    return f'No duplicate contacts scored {threshold} or more.'
+  if merge is None:
+    rows = ([number, best, '\n'.join(names), ', '.join(reasons)] for number, (best, names, reasons) in enumerate(groups, 1))
+    return show_pages(['#', 'SCORE', 'CONTACTS', 'MATCHED ON'], rows, [], 'POSSIBLE DUPLICATES')
+  chosen = [names for number, (_, names, _) in enumerate(groups, 1) if not merge or number in merge]
+  removed = 0
+  notes = []
+  for names in chosen:
+    primary, merged, kept, dropped = merge_group(book, names, threshold)
+    removed += len(merged)
+    if kept:
+      notes.append(f'{", ".join(kept)}: kept apart, no longer match {primary}')
+    if dropped:
+      notes.append(f'{primary}: max {MAX_PHONES} phones for contact, dropped {", ".join(dropped)}')
+  return '\n'.join([f'Merged {len(chosen)} groups, {removed} duplicate contacts removed.', *notes])
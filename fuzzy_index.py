@@ -0,0 +1,95 @@
+import heapq
+import math
+from fuzzywuzzy import fuzz, utils
+
+
+SCORE_CUTOFF = 60
+MIN_OVERLAP = 0.4
+
+
+def process_name(name):
+  return utils.full_process(utils.full_process(name), force_ascii=True)
+
+
+def grams(processed):
+  found = set()
+  for token in processed.split():
+    token = f'${token}$'
+    found.update(token[position:position + 3] for position in range(len(token) - 2))
+  return found
+
+
+class NameIndex:
+  def __init__(self):
+    self.names = {}
+    self.postings = {}
+
+  def __len__(self):
+    return len(self.names)
+
+  def add(self, name):
+    processed = process_name(name)
+    if not processed:
+      return
+    name_grams = grams(processed)
+    self.names[name] = (processed, name_grams)
+    for gram in name_grams:
+      self.postings.setdefault(gram, set()).add(name)
+
+  def remove(self, name):
+    entry = self.names.pop(name, None)
+    if entry is None:
+      return
+    for gram in entry[1]:
+      names = self.postings[gram]
+      names.discard(name)
+      if not names:
+        del self.postings[gram]
+
+  def candidates(self, processed):
+    query = grams(processed)
+    needed = max(1, math.ceil(len(query) * MIN_OVERLAP))
+    ordered = sorted(query, key=lambda gram: len(self.postings.get(gram, ())))
+    checked = set()
+    found = set()
+    for gram in ordered[:len(ordered) - needed + 1]:
+      for name in self.postings.get(gram, ()):
+        if name in checked:
+          continue
+        checked.add(name)
+        if len(query & self.names[name][1]) >= needed:
+          found.add(name)
+    return found
+
+  def extract(self, name, score_cutoff=SCORE_CUTOFF):
+    processed = process_name(name)
+    if not processed:
+      return []
+    matches = []
+    for candidate in self.candidates(processed):
+      score = fuzz.WRatio(processed, self.names[candidate][0], full_process=False)
+      if score >= score_cutoff:
+        matches.append((candidate, score))
+    return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+
+class CommandMatcher:
+  def __init__(self, commands, limit=5, cache_size=1024):
+    self.commands = [(command, process_name(command)) for command in commands]
+    self.limit = limit
+    self.cache_size = cache_size
+    self.cache = {}
+
+  def suggest(self, user_input):
+    if user_input in self.cache:
+      return self.cache[user_input]
+    processed = process_name(user_input)
+    scores = []
+    if processed:
+      scores = [(command, fuzz.WRatio(processed, choice, full_process=False)) for command, choice in self.commands]
+    best = heapq.nlargest(self.limit, scores, key=lambda match: match[1])
+    suggestions = [command for command, score in best if score > SCORE_CUTOFF]
+    if len(self.cache) >= self.cache_size:
+      self.cache.clear()
+    self.cache[user_input] = suggestions
+    return suggestions
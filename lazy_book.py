@@ -0,0 +1,293 @@
+import mmap
+import os
+import pickle
+import struct
+from array import array
+from collections.abc import MutableMapping
+from address_book_pickle import AddressBook, save_data
+from note_book import NoteBook
+from note_search import TextIndex
+
+
+MAGIC = b'F2PIDX2\n'
+FOOTER = struct.Struct('<BQQQQ')
+OLD_MAGIC = b'F2PIDX1\n'
+OLD_FOOTER = struct.Struct('<BQQQ')
+STR_KEYS = 0
+INT_KEYS = 1
+
+
+class IndexedFile:
+  def __init__(self, filename):
+    self.file = open(filename, 'rb')
+    self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic = self.map[:len(MAGIC)]
+    if magic not in (MAGIC, OLD_MAGIC) or self.map[-len(MAGIC):] != magic:
+      self.close()
+      raise ValueError(f'{filename} is not an indexed book file')
+    footer = FOOTER if magic == MAGIC else OLD_FOOTER
+    footer_start = len(self.map) - len(MAGIC) - footer.size
+    self.kind, self.count, self.keys_start, keys_length, *sequence = footer.unpack(self.map[footer_start:footer_start + footer.size])
+    self.sequence = sequence[0] if sequence else 0
+    view = self.view = memoryview(self.map)
+    position = self.keys_start + keys_length
+    self.key_offsets = view[position:position + (self.count + 1) * 8].cast('Q')
+    position += (self.count + 1) * 8
+    self.record_offsets = view[position:position + (self.count + 1) * 8].cast('Q')
+    position += (self.count + 1) * 8
+    self.order = view[position:position + self.count * 8].cast('Q')
+
+  def __len__(self):
+    return self.count
+
+  def close(self):
+    for name in ('order', 'record_offsets', 'key_offsets', 'view'):
+      view = self.__dict__.pop(name, None)
+      if view is not None:
+        view.release()
+    self.map.close()
+    self.file.close()
+
+  def key(self, position):
+    text = self.map[self.keys_start + self.key_offsets[position]:self.keys_start + self.key_offsets[position + 1]].decode()
+    return int(text) if self.kind == INT_KEYS else text
+
+  def keys(self):
+    for position in range(self.count):
+      yield self.key(position)
+
+  def last_id(self):
+    if self.kind != INT_KEYS or not self.count:
+      return self.sequence
+    return max(self.sequence, self.key(self.order[self.count - 1]))
+
+  def find(self, key):
+    if isinstance(key, int) != (self.kind == INT_KEYS):
+      return None
+    lo, hi = 0, self.count
+    while lo < hi:
+      middle = (lo + hi) // 2
+      if self.key(self.order[middle]) < key:
+        lo = middle + 1
+      else:
+        hi = middle
+    if lo < self.count and self.key(self.order[lo]) == key:
+      return self.order[lo]
+    return None
+
+  def raw(self, position):
+    return self.map[len(MAGIC) + self.record_offsets[position]:len(MAGIC) + self.record_offsets[position + 1]]
+
+  def record(self, position):
+    return pickle.loads(self.raw(position))
+
+
+def write_indexed(items, f, sequence=0):
+  keys = []
+  record_offsets = array('Q', [0])
+  f.write(MAGIC)
+  for key, raw in items:
+    f.write(raw)
+    record_offsets.append(record_offsets[-1] + len(raw))
+    keys.append(key)
+  kind = INT_KEYS if keys and isinstance(keys[0], int) else STR_KEYS
+  key_offsets = array('Q', [0])
+  keys_start = f.tell()
+  for key in keys:
+    encoded = str(key).encode()
+    f.write(encoded)
+    key_offsets.append(key_offsets[-1] + len(encoded))
+  order = array('Q', sorted(range(len(keys)), key=keys.__getitem__))
+  f.write(key_offsets.tobytes())
+  f.write(record_offsets.tobytes())
+  f.write(order.tobytes())
+  f.write(FOOTER.pack(kind, len(keys), keys_start, key_offsets[-1], sequence))
+  f.write(MAGIC)
+
+
+class LazyRecords(MutableMapping):
+  def __init__(self, table, book):
+    self.table = table
+    self.book = book
+    self.loaded = {}
+    self.added = {}
+    self.deleted = set()
+
+  def position(self, key):
+    if self.table is None or key in self.deleted:
+      return None
+    return self.table.find(key)
+
+  def link(self, key, record):
+    record._book = self.book
+    record._key = key
+    return record
+
+  def __getitem__(self, key):
+    if key in self.loaded:
+      return self.loaded[key]
+    position = self.position(key)
+    if position is None:
+      raise KeyError(key)
+    record = self.loaded[key] = self.link(key, self.table.record(position))
+    return record
+
+  def __contains__(self, key):
+    return key in self.loaded or self.position(key) is not None
+
+  def __setitem__(self, key, record):
+    if key in self.deleted:
+      self.deleted.discard(key)
+    elif key not in self.loaded and self.position(key) is None:
+      self.added[key] = None
+    self.loaded[key] = record
+
+  def __delitem__(self, key):
+    if key in self.added:
+      del self.added[key]
+    elif self.position(key) is not None:
+      self.deleted.add(key)
+    else:
+      raise KeyError(key)
+    self.loaded.pop(key, None)
+
+  def __iter__(self):
+    if self.table is not None:
+      for key in self.table.keys():
+        if key not in self.deleted:
+          yield key
+    yield from list(self.added)
+
+  def __len__(self):
+    return (len(self.table) if self.table is not None else 0) - len(self.deleted) + len(self.added)
+
+  def stream(self):
+    if self.table is not None:
+      for position in range(len(self.table)):
+        key = self.table.key(position)
+        if key in self.loaded:
+          yield key, self.loaded[key]
+        elif key not in self.deleted:
+          yield key, self.link(key, self.table.record(position))
+    for key in list(self.added):
+      yield key, self.loaded[key]
+
+  def values(self):
+    return (record for key, record in self.stream())
+
+  def items(self):
+    return self.stream()
+
+  def raw_items(self):
+    if self.table is not None:
+      for position in range(len(self.table)):
+        key = self.table.key(position)
+        if key in self.loaded:
+          yield key, pickle.dumps(self.loaded[key], protocol=pickle.HIGHEST_PROTOCOL)
+        elif key not in self.deleted:
+          yield key, self.table.raw(position)
+    for key in list(self.added):
+      yield key, pickle.dumps(self.loaded[key], protocol=pickle.HIGHEST_PROTOCOL)
+
+  def load_all(self):
+    for key in self:
+      self[key]
+
+  def close(self):
+    if self.table is not None:
+      self.table.close()
+      self.table = None
+
+
+class LazyBook:
+  loaded = False
+
+  def __init__(self, table=None):
+    super().__init__()
+    self.data = LazyRecords(table, self)
+
+  def index(self, record, **kwargs):
+    if self.loaded:
+      super().index(record, **kwargs)
+
+  def unindex(self, record):
+    if self.loaded:
+      super().unindex(record)
+
+  def after_change(self, record):
+    self.data.loaded[record._key] = record
+    super().after_change(record)
+
+  def load_all(self):
+    if self.loaded:
+      return
+    self.data.load_all()
+    self.loaded = True
+    self.rebuild_index()
+
+  def rebuild_index(self):
+    if self.loaded:
+      super().rebuild_index()
+
+  def close(self):
+    self.data.close()
+
+  def keys(self):
+    return iter(self.data)
+
+  def values(self):
+    return self.data.values()
+
+  def items(self):
+    return self.data.items()
+
+
+def loading(method):
+  def inner(self, *args, **kwargs):
+    self.load_all()
+    return method(self, *args, **kwargs)
+  return inner
+
+
+class LazyAddressBook(LazyBook, AddressBook):
+  suggest_names = loading(AddressBook.suggest_names)
+  pattern_index = loading(AddressBook.pattern_index)
+  find_by_phone = loading(AddressBook.find_by_phone)
+  find_by_mail = loading(AddressBook.find_by_mail)
+  find_by_addr = loading(AddressBook.find_by_addr)
+  find_by_brthd = loading(AddressBook.find_by_brthd)
+  get_upcoming_birthdays = loading(AddressBook.get_upcoming_birthdays)
+
+
+class LazyNoteBook(LazyBook, NoteBook):
+  def __init__(self, table=None):
+    super().__init__(table)
+    self.text_index = None
+    if table is not None:
+      self.last_id = table.last_id()
+
+  def load_all(self):
+    if not self.loaded:
+      self.text_index = TextIndex()
+    super().load_all()
+
+  tags_with_prefix = loading(NoteBook.tags_with_prefix)
+  find_by_tags = loading(NoteBook.find_by_tags)
+  tag_counts = loading(NoteBook.tag_counts)
+  search_notes = loading(NoteBook.search_notes)
+  notes_between = loading(NoteBook.notes_between)
+  latest_notes = loading(NoteBook.latest_notes)
+
+
+class IndexedSnapshot:
+  def read(self, filename, factory):
+    if not os.path.exists(filename):
+      return factory()
+    return factory(IndexedFile(filename))
+
+  def write(self, book, filename):
+    if isinstance(book.data, LazyRecords):
+      items = book.data.raw_items()
+    else:
+      items = ((key, pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)) for key, record in book.data.items())
+    save_data(items, filename, lambda items, f: write_indexed(items, f, getattr(book, 'last_id', 0)))
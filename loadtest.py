@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import random
+import time
+from server import END
+
+
+async def read_reply(reader):
+  size = 0
+  while True:
+    line = await reader.readline()
+    if not line:
+      raise ConnectionError('server closed the connection')
+    if line == END:
+      return size
+    size += len(line)
+
+
+async def client(number, options, latencies):
+  if options.socket:
+    reader, writer = await asyncio.open_unix_connection(options.socket)
+  else:
+    reader, writer = await asyncio.open_connection(options.host, options.port)
+  rng = random.Random(number)
+  await read_reply(reader)
+  name = f'Load{number}'
+  commands = [f'add {name} phone=0{number:09d}']
+  for step in range(options.commands):
+    roll = rng.random()
+    if roll < options.writes:
+      commands.append(f'add-note "note {step} from {name}"')
+    elif roll < 0.5:
+      commands.append(f'search name {name}')
+    elif roll < 0.8:
+      commands.append(f'search-notes {name}')
+    else:
+      commands.append(f'all --page {rng.randrange(1, 5)}')
+  commands.append(f'delete {name}')
+  for command in commands:
+    start = time.perf_counter()
+    writer.write(command.encode() + b'\n')
+    await writer.drain()
+    await read_reply(reader)
+    latencies.append(time.perf_counter() - start)
+  writer.write(b'exit\n')
+  await read_reply(reader)
+  writer.close()
+
+
+def percentile(values, fraction):
+  return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run(options):
+  latencies = []
+  start = time.perf_counter()
+  await asyncio.gather(*(client(number, options, latencies) for number in range(options.clients)))
+  elapsed = time.perf_counter() - start
+  latencies.sort()
+  print(f'{options.clients} clients, {len(latencies)} commands in {elapsed:.2f}s: {len(latencies) / elapsed:.0f} commands/s')
+  print(f'latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms')
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Load test for the assistant bot server')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--socket', metavar='PATH')
+  parser.add_argument('--clients', type=int, default=200)
+  parser.add_argument('--commands', type=int, default=20, help='commands per client')
+  parser.add_argument('--writes', type=float, default=0.2, help='share of commands that change data')
+  return parser.parse_args()
+
+
+if __name__ == "__main__":
+  asyncio.run(run(parse_args()))
@@ -1,6 +1,15 @@
-import pickle
-from address_book_pickle import load_data, AddressBook, parse_input, suggest_command, save_data, add_all, remove_contact_info, edit_contact_info, remove_contact,show_all, birthdays, search
-from note_book import NoteBook, add_note, show_notes, delete_note, add_tag, find_by_tag
+import argparse
+import os
+import shlex
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import nullcontext
+from address_book_pickle import AddressBook, parse_input, suggest_command, add_all, remove_contact_info, edit_contact_info, remove_contact,show_all, birthdays, search, add_contact, edit_contact, remove_contact_field, set_interactive, CommandError
+from note_book import NoteBook, add_note, show_notes, delete_note, add_tag, find_by_tag, tag_counts, search_notes
+from storage import WRITE_LOCK, JournalStorage, Autosave, BackgroundLoad
+from query_index import READ_ONLY_COMMANDS, build, is_current, open_query_index
+from profiling import PROFILE_ENV, profiler, profiling_requested, stats
 
 
 COMMANDS = [
@@ -16,10 +25,17 @@ COMMANDS = [
   'show-birthday',
   'birthdays',
   'search',
+  'explain',
   'show-all-notes',
   'delete-note',
   'add-tag',
   'find-tag',
+  'tag-counts',
+  'search-notes',
+  'import',
+  'export',
+  'dedupe',
+  'stats',
   'exit',
   'close'
 ]
@@ -28,29 +44,356 @@ COMMANDS = [
 HELP = [
   'hello',
   'help',
-  'add - <enter the name of a contact to add>',
-  'remove - <to remove a contact, enter the name of the contact>',
-  'edit - <this command is for editing a contact. Please type the name of the contact to edit>',
-  'delete - <to delete a contact, type the contact`s name>',
-  'all - <to see all contacts, enter this command>',
-  'birthdays [Days] - <to see upcoming birthdays within the specified range, enter the number of days>',
-  'search [Name|Phone|Birthday|Email|Address] [Value] - <this command allows you to find a contact using one of these parameters>',
+  'add [Name] [phone=...] [email=...] [address=...] [birthday=...] - <enter the name of a contact to add. Without arguments the bot asks for every field>',
+  'remove [Name] [phone|email|address|birthday] [Phone] - <to remove a contact, enter the name of the contact>',
+  'edit [Name] [name|phone|email|address|birthday] [Value] - <this command is for editing a contact. Please type the name of the contact to edit. Phone takes the old and the new number>',
+  'delete [Name] - <to delete a contact, type the contact`s name>',
+  'all [--page N] [--size K] - <to see all contacts, enter this command. Long lists are shown page by page>',
+  'birthdays [Days] [--page N] [--size K] - <to see upcoming birthdays within the specified range, enter the number of days>',
+  'search [Name|Phone|Birthday|Email|Address] [Value] [--limit N] - <this command allows you to find a contact using one of these parameters. Name, phone and email also take Ol* (starts with), *@corp.ua (ends with) or *enko* (contains), showing the first 1000 matches unless --limit says otherwise, 0 for all>',
+  'search [field:value AND field:value ...] [LIMIT N] - <to combine conditions, e.g. search phone:067* AND birthday:03.* AND address:~Kyiv LIMIT 50. ~ means contains, * in a birthday matches any day, month or year>',
+  'explain [Query] - <to see how a search query will run: which index it starts from, which indexes it intersects, what is left to filter and how many rows each step is expected to give>',
   'add-note [Note] - <to add a note, just use this command :) Type the command and the note, then hit the Enter/Return button>',
-  'show-all-notes - <to see all notes, simply type: show-all-notes>',
+  'show-all-notes [--latest N | --from ID --to ID] [--page N] [--size K] - <to see all notes, simply type: show-all-notes. --latest N shows the newest N notes, --from/--to show a range of note IDs>',
   'delete-note [ID] - <to delete a note, type: delete-note followed by its numeric ID>',
   'add-tag [Tag] - <to add a tag to your note, type this command and the tag you want to add>',
-  'find-tag [Tag] - <to find a note by tag, type this command and the tag>',
+  'find-tag [Tag] [Tag...] - <to find notes by tag. Several tags must all match, put "or" between them to match any, end a tag with * to match by prefix>',
+  'tag-counts - <to see how many notes use each tag>',
+  'search-notes [Words] - <to search note text. Best matches come first, use "quotes" for a phrase and word* for a prefix>',
+  'import [contacts|notes] [File] [csv|jsonl|vcf] [--workers N] - <to load contacts or notes from a file. The format is taken from the file extension, bad rows are reported and skipped. --workers N checks contacts in N processes>',
+  'export [contacts|notes] [File] [csv|jsonl|vcf] - <to save contacts or notes to a file>',
+  'dedupe [--threshold N] [--workers N] [--merge [Group...]] - <to find contacts that look like the same person (same phone, email name or a close name). --merge merges every listed group, or only the given group numbers, into the most complete contact>',
+  'stats - <to see p50/p99 time per command and where it goes. Works when the bot runs with --profile>',
   'exit - <if you`re fed up with this assistant, stay cool and just type: exit =)>',
   'close - <to take a break, type: close>',
 ]
 
 
+def open_storages(backend, compress=0, shards=None, tenant=None):
+  if backend == 'sharded':
+    from sharded_book import ShardedStorage, prepare
+    directory = os.path.join('tenants', tenant) if tenant else '.'
+    return ShardedStorage(directory, prepare(directory, shards)), JournalStorage(os.path.join(directory, "notebook.pkl"), NoteBook)
+  if backend == 'sqlite':
+    from sqlite_book import SQLiteStorage, SQLiteAddressBook, SQLiteNoteBook, migrate
+    if not os.path.exists('assistant.db'):
+      migrate('assistant.db')
+    return SQLiteStorage('assistant.db', SQLiteAddressBook), SQLiteStorage('assistant.db', SQLiteNoteBook)
+  if backend == 'lazy':
+    from lazy_book import IndexedSnapshot, LazyAddressBook, LazyNoteBook
+    storages = []
+    for filename, factory, lazy_factory in (("addressbook", AddressBook, LazyAddressBook), ("notebook", NoteBook, LazyNoteBook)):
+      if not os.path.exists(f"{filename}.idx"):
+        source = JournalStorage(f"{filename}.pkl", factory)
+        IndexedSnapshot().write(source.load(), f"{filename}.idx")
+        source.close()
+      storages.append(JournalStorage(f"{filename}.idx", lazy_factory, snapshot=IndexedSnapshot()))
+    return storages
+  if backend == 'columnar':
+    from columnar import ColumnarSnapshot
+    storages = []
+    for filename, factory in (("addressbook", AddressBook), ("notebook", NoteBook)):
+      if not os.path.exists(f"{filename}.col"):
+        source = JournalStorage(f"{filename}.pkl", factory)
+        ColumnarSnapshot(compress).write(source.load(), f"{filename}.col")
+        source.close()
+      storages.append(JournalStorage(f"{filename}.col", factory, snapshot=ColumnarSnapshot(compress)))
+    return storages
+  return JournalStorage("addressbook.pkl", AddressBook), JournalStorage("notebook.pkl", NoteBook)
+
+
+def storage_files(backend, shards=None, tenant=None):
+  if backend == 'sharded':
+    from sharded_book import read_count, shard_path
+    directory = os.path.join('tenants', tenant) if tenant else '.'
+    count = read_count(directory)
+    if count is None or shards not in (None, count):
+      return None
+    return [shard_path(directory, shard, count) for shard in range(count)] + [os.path.join(directory, "notebook.pkl")]
+  if backend == 'sqlite':
+    files = ['assistant.db']
+  elif backend in ('lazy', 'columnar'):
+    extension = 'idx' if backend == 'lazy' else 'col'
+    files = [f"addressbook.{extension}", f"notebook.{extension}"]
+  else:
+    return ["addressbook.pkl", "notebook.pkl"]
+  return files if all(os.path.exists(filename) for filename in files) else None
+
+
+BOOK_FREE_COMMANDS = {'hello', 'help', 'stats'}
+STARTUP_TRACE_ENV = 'ASSISTANT_STARTUP_TRACE'
+
+
+def open_books(options):
+  if options.read_only:
+    if not is_current(options.read_only, options.storage, options.shards, options.tenant):
+      build(options.storage, options.read_only, options.compress, options.shards, options.tenant)
+    return (), open_query_index(options.read_only)
+  storages = open_storages(options.storage, options.compress, options.shards, options.tenant)
+  return storages, tuple(storage.load() for storage in storages)
+
+
+def import_data(args, book, note_book):
+  import bulk_io
+  return bulk_io.import_data(args, book, note_book)
+
+
+def export_data(args, book, note_book):
+  import bulk_io
+  return bulk_io.export_data(args, book, note_book)
+
+
+def explain_query(args, book, note_book):
+  from contact_query import explain
+  return explain(args, book)
+
+
+def dedupe_contacts(args, book, note_book):
+  from dedupe import dedupe
+  return dedupe(args, book)
+
+
+def show_help():
+  return "Available commands:\n" + "\n".join(f"- {cmd}" for cmd in HELP)
+
+
+HANDLERS = {
+  'hello': lambda args, book, note_book: "How can I help you?",
+  'help': lambda args, book, note_book: show_help(),
+  'add': lambda args, book, note_book: add_contact(args, book) if args else add_all(book),
+  'remove': lambda args, book, note_book: remove_contact_field(args, book) if args else remove_contact_info(book),
+  'edit': lambda args, book, note_book: edit_contact(args, book) if args else edit_contact_info(book),
+  'delete': lambda args, book, note_book: remove_contact(book, args),
+  'all': lambda args, book, note_book: show_all(book, args),
+  'birthdays': lambda args, book, note_book: birthdays(args, book),
+  'search': lambda args, book, note_book: search(args, book),
+  'explain': explain_query,
+  'add-note': lambda args, book, note_book: add_note(args, note_book),
+  'show-all-notes': lambda args, book, note_book: show_notes(note_book, args),
+  'delete-note': lambda args, book, note_book: delete_note(args, note_book),
+  'add-tag': lambda args, book, note_book: add_tag(args, note_book),
+  'find-tag': lambda args, book, note_book: find_by_tag(args, note_book),
+  'tag-counts': lambda args, book, note_book: tag_counts(note_book),
+  'search-notes': lambda args, book, note_book: search_notes(args, note_book),
+  'import': import_data,
+  'export': export_data,
+  'dedupe': dedupe_contacts,
+  'stats': stats,
+}
+
+
+def dispatch(command, args, book, note_book):
+  handler = HANDLERS.get(command)
+  if handler is None:
+    return CommandError("Invalid command. Please try again.")
+  if getattr(book, 'read_only', False) and command not in READ_ONLY_COMMANDS:
+    return CommandError(f"{command} is not available in read-only mode.")
+  return handler(args, book, note_book)
+
+
+def show(output):
+  if isinstance(output, Iterator):
+    for page in output:
+      with profiler.paused():
+        print('\n' + page)
+  else:
+    text = str(output)
+    with profiler.paused():
+      print(text)
+
+
+def execute(command, args, books):
+  measure = nullcontext() if command in PROMPTING and not args else profiler.command(command)
+  with WRITE_LOCK, measure:
+    output = dispatch(command, args, *books)
+    show(output)
+  return not isinstance(output, CommandError)
+
+
+def save_all(storages, books):
+  for storage, data in zip(storages, books):
+    storage.save(data)
+
+
+def close_all(storages, books):
+  save_all(storages, books)
+  for storage in storages:
+    storage.close()
+
+
+PROMPTING = {'add', 'remove', 'edit', 'delete'}
+
+
+def command_error(command, args):
+  if command not in HANDLERS:
+    return f'unknown command {command}'
+  if command in PROMPTING and not args:
+    return f'{command} needs arguments when there is no prompt'
+  return None
+
+
+def run_batch(lines, storages, books, save_every=0):
+  set_interactive(False)
+  errors = 0
+  executed = 0
+  for number, line in enumerate(lines, 1):
+    line = line.strip()
+    if not line or line.startswith('#'):
+      continue
+    try:
+      command, *args = shlex.split(line)
+    except ValueError as e:
+      print(f'line {number}: {e}')
+      errors += 1
+      continue
+    command = command.lower()
+    if command in ["close", "exit"]:
+      break
+    error = command_error(command, args)
+    if error:
+      print(f'line {number}: {error}')
+      errors += 1
+      continue
+    try:
+      if not execute(command, args, books):
+        print(f'line {number}: {command} failed')
+        errors += 1
+        continue
+    except Exception as e:
+      print(f'line {number}: {e}')
+      errors += 1
+      continue
+    executed += 1
+    if save_every and executed % save_every == 0:
+      save_all(storages, books)
+  close_all(storages, books)
+  print(f'{executed} commands executed, {errors} failed', file=sys.stderr)
+  return errors
+
+
+def tenant_name(name):
+  if not name or name.startswith('.') or os.sep in name or (os.altsep and os.altsep in name):
+    raise argparse.ArgumentTypeError(f'bad tenant name {name!r}')
+  return name
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Assistant bot')
+  parser.add_argument('--storage', choices=['journal', 'sqlite', 'lazy', 'columnar', 'sharded'], default='journal', help='where contacts and notes are kept')
+  parser.add_argument('--compress', metavar='LEVEL', type=int, choices=range(10), default=0, help='zlib level for columnar files, 0 stores them uncompressed')
+  parser.add_argument('--shards', metavar='N', type=int, help='number of shard files for sharded storage, changing it reshards the contacts (default: as before, or 8)')
+  parser.add_argument('--tenant', metavar='NAME', type=tenant_name, help='keep sharded contacts and notes in tenants/NAME')
+  parser.add_argument('--read-only', metavar='INDEX', nargs='?', const='assistant.qidx', help='answer search, birthdays and find-tag from a memory-mapped query index (rebuilt from --storage when missing or older than the data)')
+  parser.add_argument('--batch', metavar='FILE', nargs='?', const='-', help='run commands from FILE (or stdin with -) without prompts')
+  parser.add_argument('--save-every', metavar='N', type=int, default=0, help='in batch mode also save after every N commands')
+  parser.add_argument('--autosave', metavar='SECONDS', type=int, default=30, help='take a snapshot in the background this often while there are unsaved changes, 0 turns autosave off')
+  parser.add_argument('--autosave-changes', metavar='N', type=int, default=100, help='also take a snapshot after every N changes')
+  parser.add_argument('--startup-trace', action='store_true', help='run the bot once with -X importtime and report where the startup time goes')
+  parser.add_argument('--profile', action='store_true', help=f'time every command, see them with the stats command (also {PROFILE_ENV}=1)')
+  parser.add_argument('--profile-output', metavar='FILE', help='also write cProfile stats for the session to FILE')
+  parser.add_argument('--flamegraph', metavar='FILE', help='also write sampled stacks for the session to FILE in collapsed flamegraph format')
+  return parser.parse_args()
+
+
 def main():
-  filedata = load_data()
-  book = filedata if filedata else AddressBook()
-  filedata = load_data(filename="notebook.pkl")
-  note_book = filedata if filedata else NoteBook()
+  options = parse_args()
+  if options.startup_trace:
+    sys.exit(startup_trace([arg for arg in sys.argv[1:] if arg != '--startup-trace']))
+  if options.read_only:
+    options.autosave = 0
+    if options.storage == 'sharded' and options.tenant and options.read_only == 'assistant.qidx':
+      options.read_only = os.path.join('tenants', options.tenant, 'assistant.qidx')
+  if options.profile or options.profile_output or options.flamegraph or profiling_requested():
+    profiler.enable(options.profile_output, options.flamegraph)
+  loader = BackgroundLoad(lambda: open_books(options))
+  if options.batch:
+    loader.run()
+    storages, books = loaded(loader)
+    trace('loaded', loader.loaded_at)
+    lines = sys.stdin if options.batch == '-' else open(options.batch, encoding='utf-8')
+    with lines:
+      errors = run_batch(lines, storages, books, options.save_every)
+    finish_profiling()
+    trace('exit')
+    sys.exit(1 if errors else 0)
+  loader.start()
+  autosave = None
+
+  def load_books():
+    nonlocal autosave
+    storages, books = loader.result()
+    if autosave is None and options.autosave > 0:
+      autosave = Autosave(storages, books, options.autosave, options.autosave_changes)
+      autosave.start()
+    return books
+
+  try:
+    run_interactive(load_books)
+  except (KeyboardInterrupt, EOFError):
+    print("\nGood bye!\nSaving data...")
+  storages, books = loaded(loader)
+  trace('loaded', loader.loaded_at)
+  if autosave is not None:
+    autosave.stop()
+  close_all(storages, books)
+  finish_profiling()
+  trace('exit')
+
+
+def loaded(loader):
+  try:
+    return loader.result()
+  except Exception as e:
+    print(f'{e}')
+    sys.exit(1)
+
+
+def trace(event, at=None):
+  started = os.environ.get(STARTUP_TRACE_ENV)
+  if started:
+    print(f'startup: {event} {((at or time.time()) - float(started)) * 1000:.1f}', file=sys.stderr)
+
+
+def startup_trace(args):
+  import subprocess
+  from prettytable import PrettyTable
+  env = dict(os.environ, **{STARTUP_TRACE_ENV: repr(time.time())})
+  if '--batch' not in args:
+    args = [*args, '--autosave', '0']
+  result = subprocess.run([sys.executable, '-X', 'importtime', os.path.abspath(__file__), *args], env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+  imports = []
+  events = []
+  for line in result.stderr.splitlines():
+    if line.startswith('import time:') and not line.endswith('imported package'):
+      own, cumulative, name = line[len('import time:'):].split('|')
+      imports.append((int(cumulative), int(own), name.rstrip()))
+    elif line.startswith('startup: '):
+      event, elapsed = line[len('startup: '):].rsplit(' ', 1)
+      events.append((event, float(elapsed)))
+  top_level = [item for item in imports if not item[2].startswith('  ')]
+  table = PrettyTable()
+  table.title = f'imports: {sum(item[0] for item in top_level) / 1000:.1f} ms'
+  table.field_names = ['module', 'self ms', 'cumulative ms']
+  table.align = 'r'
+  table.align['module'] = 'l'
+  for cumulative, own, name in sorted(imports, reverse=True)[:20]:
+    table.add_row([name[1:], f'{own / 1000:.1f}', f'{cumulative / 1000:.1f}'])
+  print(table)
+  for event, elapsed in events:
+    print(f'{event}: {elapsed:.1f} ms after start')
+  return result.returncode
+
+
+def finish_profiling():
+  if profiler.enabled:
+    profiler.finish()
+    if profiler.timings:
+      print(profiler.report(), file=sys.stderr)
+
+
+def run_interactive(load_books):
   print("\nWelcome to the assistant bot!\nIf you need help, type 'help'.\n")
+  trace('prompt')
   while True:
     user_input = input("Enter a command: ")
     command, *args = parse_input(user_input)
@@ -77,43 +420,12 @@ def main():
             
     try:
       if command in ["close", "exit"]:
-        save_data(book)
-        save_data(note_book, filename="notebook.pkl")
         print("Good bye!\nSaving data...")
         break
-      elif command == "hello":
-        print("How can I help you?")
-      elif command == "add":
-        print(add_all(book))
-      elif command == "remove":
-        print(remove_contact_info(book))
-      elif command == "edit":
-        print(edit_contact_info(book))    
-      elif command == "delete":
-        print(remove_contact(book))
-      elif command == "all":
-        print(show_all(book))
-      elif command == "birthdays":
-        print(birthdays(args, book))         
-      elif command == 'search':
-        print(search(args, book))
-      elif command == "add-note":
-        print(add_note(args, note_book))
-      elif command == "show-all-notes":
-        print(show_notes(note_book))  
-      elif command == "delete-note":
-        print(delete_note(args, note_book))  
-      elif command == "add-tag":
-        print(add_tag(args, note_book))  
-      elif command == "find-tag":
-        print(find_by_tag(args, note_book))
-      elif command == 'help':
-        print("Available commands:")
-        for cmd in HELP:
-          print(f"- {cmd}")
+      execute(command, args, (None, None) if command in BOOK_FREE_COMMANDS else load_books())
     except Exception as e:
       print(f'{e}')
           
 
 if __name__ == "__main__":
-  main()
\ No newline at end of file
+  main()
@@ -1,39 +1,223 @@
-from prettytable import PrettyTable
-from collections import UserDict
-from address_book_pickle import Field
+import sys
+import threading
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+from address_book_pickle import Field, Entry, Book, tracked, index_add, index_discard
 from datetime import datetime
-from address_book_pickle import input_error
+from address_book_pickle import input_error, show_pages
+from note_search import TextIndex
 
 class Note(Field):
-  pass
+  __slots__ = ()
+
+class NoteRecord(Entry):
+  __slots__ = ('note', 'tags', 'ctreated')
+  fields = __slots__
 
-class NoteRecord:
   def __init__(self, note):
+    super().__init__()
     self.note = Note(note)
-    self.tags = []
+    self.tags = set()
     self.ctreated = datetime.now()
 
   def __str__(self):
     return f"note: {self.note}"
+
+  def __setstate__(self, state):
+    super().__setstate__(state)
+    self.tags = {sys.intern(tag) for tag in self.tags or ()}
   
+  @tracked
   def edit_note(self, note):
     self.note = Note(note)
 
+  @tracked
   def add_tag(self, tag):
-    self.tags.append(tag)
+    self.tags.add(sys.intern(tag))
   
 
-class NoteBook(UserDict):
+def tag_prefix(term):
+  if term.endswith('*'):
+    return term[:-1]
+  return None
+
+
+COMPACT_MIN = 1000
+
+
+class NoteBook(Book):
+  transient = Book.transient + ('tags_index', 'tag_names', 'note_ids', 'compactor', 'ids_lock')
+  last_id = 0
+  compactor = None
+
+  def __init__(self, *args, **kwargs):
+    self.text_index = TextIndex()
+    self.ids_lock = threading.Lock()
+    super().__init__(*args, **kwargs)
+
+  def __setstate__(self, state):
+    text_index = state.pop('text_index', None)
+    self.text_index = None
+    self.ids_lock = threading.Lock()
+    super().__setstate__(state)
+    self.text_index = self.build_text_index() if text_index is None else text_index
+
+  def build_text_index(self):
+    text_index = TextIndex()
+    for id, note_record in self.data.items():
+      text_index.add(id, note_record.note.value)
+    return text_index
+
+  def reset_index(self):
+    self.tags_index = {}
+    self.tag_names = []
+    self.note_ids = []
+
+  def rebuild_index(self):
+    if self.text_index is not None:
+      self.text_index = TextIndex()
+    super().rebuild_index()
+    if self.note_ids and self.note_ids[-1] > self.last_id:
+      self.last_id = self.note_ids[-1]
+
+  def _put(self, key, note_record):
+    if key > self.last_id:
+      self.last_id = key
+    super()._put(key, note_record)
+
+  def put_many(self, items):
+    items = list(items)
+    self.last_id = max([self.last_id, *(key for key, _ in items)])
+    return super().put_many(items)
+
+  def add_id(self, key):
+    with self.ids_lock:
+      ids = self.note_ids
+      if not ids or key > ids[-1]:
+        ids.append(key)
+        return
+      position = bisect_left(ids, key)
+      if position == len(ids) or ids[position] != key:
+        self.note_ids = ids[:position] + [key] + ids[position:]
+
+  def tombstones(self):
+    return len(self.note_ids) - len(self.data)
+
+  def compact_ids(self):
+    with self.ids_lock:
+      ids = self.note_ids
+      count = len(ids)
+    data = self.data
+    live, dropped = [], []
+    for key in ids[:count]:
+      (live if key in data else dropped).append(key)
+    with self.ids_lock:
+      if self.note_ids is ids:
+        revived = [key for key in dropped if key in data]
+        if revived:
+          live = list(merge(live, revived))
+        self.note_ids = live + ids[count:]
+
+  def maybe_compact(self):
+    if self.tombstones() > max(COMPACT_MIN, len(self.data)) and (self.compactor is None or not self.compactor.is_alive()):
+      self.compactor = threading.Thread(target=self.compact_ids, daemon=True)
+      self.compactor.start()
+
+  def index(self, note_record: NoteRecord):
+    for tag in note_record.tags:
+      if tag not in self.tags_index:
+        insort(self.tag_names, tag)
+      index_add(self.tags_index, tag, note_record._key, note_record)
+    if self.text_index is not None:
+      self.text_index.add(note_record._key, note_record.note.value)
+    self.add_id(note_record._key)
+
+  def unindex(self, note_record: NoteRecord):
+    for tag in note_record.tags:
+      index_discard(self.tags_index, tag, note_record._key)
+      if tag not in self.tags_index:
+        position = bisect_left(self.tag_names, tag)
+        if position < len(self.tag_names) and self.tag_names[position] == tag:
+          del self.tag_names[position]
+    if self.text_index is not None:
+      self.text_index.remove(note_record._key, note_record.note.value)
+    self.maybe_compact()
+
+  def next_id(self):
+    return self.last_id + 1
+
   def add_note(self, note_record: NoteRecord):
-    id = len(self.data) + 1
-    self.data[id] = note_record
+    id = self.next_id()
+    self._put(id, note_record)
+    self.log('put', id, note_record)
     return id
 
   def find_note(self, id_):
     return self.data.get(id_, None)
 
+  def notes_between(self, first=None, last=None):
+    ids, data = self.note_ids, self.data
+    start = 0 if first is None else bisect_left(ids, first)
+    end = len(ids) if last is None else bisect_right(ids, last)
+    for position in range(start, end):
+      note_record = data.get(ids[position])
+      if note_record is not None:
+        yield ids[position], note_record
+
+  def latest_notes(self, count):
+    ids, data = self.note_ids, self.data
+    found = []
+    for position in range(len(ids) - 1, -1, -1):
+      if len(found) >= count:
+        break
+      note_record = data.get(ids[position])
+      if note_record is not None:
+        found.append((ids[position], note_record))
+    return found
+
+  def tags_with_prefix(self, prefix):
+    position = bisect_left(self.tag_names, prefix)
+    while position < len(self.tag_names) and self.tag_names[position].startswith(prefix):
+      yield self.tag_names[position]
+      position += 1
+
+  def find_tag_term(self, term):
+    prefix = tag_prefix(term)
+    if prefix is None:
+      return self.tags_index.get(term, {})
+    notes = {}
+    for tag in self.tags_with_prefix(prefix):
+      notes.update(self.tags_index[tag])
+    return notes
+
+  def find_by_tags(self, terms, match_any=False):
+    matches = sorted((self.find_tag_term(term) for term in terms), key=len)
+    if not matches:
+      return []
+    if match_any:
+      notes = {}
+      for match in matches:
+        notes.update(match)
+    else:
+      notes = {id: note_record for id, note_record in matches[0].items() if all(id in match for match in matches[1:])}
+    return sorted(notes.items(), key=lambda item: item[0])
+
+  def find_by_tag(self, tag):
+    return self.find_by_tags([tag])
+
+  def search_notes(self, query, limit=None):
+    if self.text_index is None:
+      self.text_index = self.build_text_index()
+    return [(id, self.data[id], score) for score, id in self.text_index.search(query, limit)]
+
+  def tag_counts(self):
+    return sorted(((tag, len(notes)) for tag, notes in self.tags_index.items()), key=lambda item: (-item[1], item[0]))
+
   def delete_note(self, id_):
-    return self.data.pop(id_, None)
+    note_record = self._pop(id_)
+    if note_record is not None:
+      self.log('del', id_)
+    return note_record
 
 @input_error
 def add_note(args, note_book: NoteBook):
@@ -60,25 +244,78 @@ def add_tag(args, note_book: NoteBook):
   return 'Note not found'
 
 
-def show_notes(note_book: NoteBook):
-  table = PrettyTable()
-  table.field_names = ['id', 'note text', 'added at', 'tags']
-  for id, note_record in note_book.items():
-    tags_text = '\n'.join(note_record.tags)
-    table.add_row([id, note_record.note.value, note_record.ctreated.strftime('%d.%m.%Y %H:%M:%S'), tags_text])
-  return table
+def note_row(id, note_record):
+  return [id, note_record.note.value, note_record.ctreated.strftime('%d.%m.%Y %H:%M:%S'), '\n'.join(sorted(note_record.tags))]
+
+
+def parse_note_range(args):
+  args = list(args)
+  paging = []
+  latest = first = last = None
+  while args:
+    option = args.pop(0)
+    if option in ('--latest', '--from', '--to'):
+      if not args or not args[0].isdigit():
+        raise ValueError('\nUse: show-all-notes [--latest N | --from ID --to ID] [--page N] [--size K]\n')
+      value = int(args.pop(0))
+      if option == '--latest':
+        latest = value
+      elif option == '--from':
+        first = value
+      else:
+        last = value
+    else:
+      paging.append(option)
+  return latest, first, last, paging
+
+
+@input_error
+def show_notes(note_book: NoteBook, args=()):
+  latest, first, last, args = parse_note_range(args)
+  if latest is not None:
+    notes = note_book.latest_notes(latest)
+  elif first is not None or last is not None:
+    notes = note_book.notes_between(first, last)
+  else:
+    notes = note_book.notes_between()
+  return show_pages(['id', 'note text', 'added at', 'tags'], notes, args, empty='\nNo notes found\n', row=lambda item: note_row(*item))
 
 @input_error
 def find_by_tag(args, note_book):
+  options = [index for index, arg in enumerate(args) if arg.startswith('--')]
+  paging = args[options[0]:] if options else []
+  args = args[:options[0]] if options else args
   if len(args) < 1:
     raise ValueError('Please enter tag!')
-  tag = args[0]
+  match_any = any(arg.lower() == 'or' for arg in args)
+  terms = [arg for arg in args if arg.lower() not in ('and', 'or')]
+  notes = note_book.find_by_tags(terms, match_any)
+  return show_pages(['id', 'note text', 'added at', 'tags'], notes, paging, empty='\nNo notes found\n', row=lambda item: note_row(*item))
+
+@input_error
+def search_notes(args, note_book):
+  if not args:
+    raise ValueError('Please enter words to search for!')
+  results = note_book.search_notes(' '.join(args), limit=50)
+  if not results:
+    return 'No notes found'
+  from prettytable import PrettyTable
+  table = PrettyTable()
+  table.field_names = ['id', 'score', 'note text', 'tags']
+  for id, note_record, score in results:
+    table.add_row([id, f'{score:.2f}', note_record.note.value, '\n'.join(sorted(note_record.tags))])
+  return table
+
+@input_error
+def tag_counts(note_book):
+  counts = note_book.tag_counts()
+  if not counts:
+    return 'No tags yet'
+  from prettytable import PrettyTable
   table = PrettyTable()
-  table.field_names = ['id', 'note text', 'added at', 'tags']
-  for id, note_record in note_book.items():
-    if tag in note_record.tags:
-      tags_text = '\n'.join(note_record.tags)
-      table.add_row([id, note_record.note.value, note_record.ctreated.strftime('%d.%m.%Y %H:%M:%S'), tags_text])
+  table.field_names = ['tag', 'notes']
+  for tag, count in counts:
+    table.add_row([tag, count])
   return table
 
 @input_error
@@ -0,0 +1,120 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+
+
+TOKEN = re.compile(r'\w+')
+QUERY = re.compile(r'"([^"]*)"|(\S+)')
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+  return TOKEN.findall(text.lower())
+
+
+def parse_query(query):
+  clauses = []
+  for phrase, word in QUERY.findall(query):
+    tokens = tokenize(phrase or word)
+    if not tokens:
+      continue
+    if len(tokens) > 1:
+      clauses.append(('phrase', tokens))
+    elif word.endswith('*'):
+      clauses.append(('prefix', tokens[0]))
+    else:
+      clauses.append(('term', tokens[0]))
+  return clauses
+
+
+class TextIndex:
+  def __init__(self):
+    self.postings = {}
+    self.terms = []
+    self.lengths = {}
+    self.total_length = 0
+
+  def add(self, id, text):
+    tokens = tokenize(text)
+    for position, token in enumerate(tokens):
+      postings = self.postings.get(token)
+      if postings is None:
+        postings = self.postings[token] = {}
+        insort(self.terms, token)
+      postings.setdefault(id, []).append(position)
+    self.lengths[id] = len(tokens)
+    self.total_length += len(tokens)
+
+  def remove(self, id, text):
+    for token in set(tokenize(text)):
+      postings = self.postings.get(token)
+      if postings is None:
+        continue
+      postings.pop(id, None)
+      if not postings:
+        del self.postings[token]
+        position = bisect_left(self.terms, token)
+        if position < len(self.terms) and self.terms[position] == token:
+          del self.terms[position]
+    self.total_length -= self.lengths.pop(id, 0)
+
+  def terms_with_prefix(self, prefix):
+    position = bisect_left(self.terms, prefix)
+    while position < len(self.terms) and self.terms[position].startswith(prefix):
+      yield self.terms[position]
+      position += 1
+
+  def match_term(self, term):
+    return {id: [(term, len(positions))] for id, positions in self.postings.get(term, {}).items()}
+
+  def match_prefix(self, prefix):
+    matches = {}
+    for term in self.terms_with_prefix(prefix):
+      for id, positions in self.postings[term].items():
+        matches.setdefault(id, []).append((term, len(positions)))
+    return matches
+
+  def match_phrase(self, words):
+    postings = [self.postings.get(word, {}) for word in words]
+    matches = {}
+    for id in min(postings, key=len):
+      if not all(id in word_postings for word_postings in postings):
+        continue
+      following = [set(word_postings[id]) for word_postings in postings[1:]]
+      hits = sum(1 for start in postings[0][id] if all(start + offset + 1 in positions for offset, positions in enumerate(following)))
+      if hits:
+        matches[id] = [(word, hits) for word in words]
+    return matches
+
+  def match(self, clause):
+    kind, value = clause
+    if kind == 'term':
+      return self.match_term(value)
+    if kind == 'prefix':
+      return self.match_prefix(value)
+    return self.match_phrase(value)
+
+  def idf(self, term):
+    documents = len(self.postings.get(term, ()))
+    return math.log(1 + (len(self.lengths) - documents + 0.5) / (documents + 0.5))
+
+  def search(self, query, limit=None):
+    clauses = parse_query(query)
+    if not clauses or not self.lengths:
+      return []
+    matches = sorted((self.match(clause) for clause in clauses), key=len)
+    average_length = self.total_length / len(self.lengths)
+    results = []
+    for id, contributions in matches[0].items():
+      if not all(id in match for match in matches[1:]):
+        continue
+      for match in matches[1:]:
+        contributions = contributions + match[id]
+      norm = K1 * (1 - B + B * self.lengths[id] / average_length)
+      score = sum(self.idf(term) * count * (K1 + 1) / (count + norm) for term, count in contributions)
+      results.append((score, id))
+    if limit is not None:
+      return heapq.nlargest(limit, results, key=lambda result: (result[0], -result[1]))
+    return sorted(results, key=lambda result: (-result[0], result[1]))
@@ -0,0 +1,106 @@
+from bisect import bisect_left, insort
+
+
+PATTERN_FIELDS = ('name', 'phone', 'email')
+PATTERN_LIMIT = 1000
+
+
+def parse_pattern(pattern):
+  text = pattern.strip('*')
+  if text == pattern:
+    return None
+  if not text or '*' in text:
+    raise ValueError('\nUse: Ol* (starts with), *@corp.ua (ends with) or *enko* (contains)\n')
+  if pattern.startswith('*') and pattern.endswith('*'):
+    return 'contains', text
+  if pattern.endswith('*'):
+    return 'prefix', text
+  return 'suffix', text
+
+
+def fold(field, value):
+  return value if field == 'phone' else value.lower()
+
+
+def field_values(field, record):
+  if field == 'name':
+    return [record.name.value]
+  if field == 'phone':
+    return [phone.value for phone in record.phones]
+  return [record.email.value] if record.email else []
+
+
+class SortedPairs:
+  def __init__(self):
+    self.pairs = []
+
+  def add(self, value, key):
+    insort(self.pairs, (value, key))
+
+  def remove(self, value, key):
+    pairs = self.pairs
+    position = bisect_left(pairs, (value, key))
+    if position < len(pairs) and pairs[position] == (value, key):
+      del pairs[position]
+
+  def fill(self, pairs):
+    pairs.sort()
+    self.pairs = pairs
+
+  def count(self, text):
+    return bisect_left(self.pairs, (text + '\U0010ffff',)) - bisect_left(self.pairs, (text,))
+
+  def prefix(self, text):
+    pairs = self.pairs
+    position = bisect_left(pairs, (text,))
+    while position < len(pairs) and pairs[position][0].startswith(text):
+      yield pairs[position]
+      position += 1
+
+  def contains(self, text):
+    for value, key in self.pairs:
+      if text in value:
+        yield value, key
+
+
+class PatternIndex:
+  def __init__(self, field):
+    self.field = field
+    self.forward = SortedPairs()
+    self.backward = SortedPairs()
+
+  def add(self, key, record):
+    for value in field_values(self.field, record):
+      value = fold(self.field, value)
+      self.forward.add(value, key)
+      self.backward.add(value[::-1], key)
+
+  def remove(self, key, record):
+    for value in field_values(self.field, record):
+      value = fold(self.field, value)
+      self.forward.remove(value, key)
+      self.backward.remove(value[::-1], key)
+
+  def build(self, items):
+    from bulk_io import gc_paused
+    field = self.field
+    with gc_paused():
+      pairs = [(fold(field, value), key) for key, record in items for value in field_values(field, record)]
+      self.backward.fill([(value[::-1], key) for value, key in pairs])
+      self.forward.fill(pairs)
+    return self
+
+  def count(self, mode, text):
+    text = fold(self.field, text)
+    pairs = self.backward if mode == 'suffix' else self.forward
+    if mode == 'suffix':
+      text = text[::-1]
+    return pairs.count(text)
+
+  def matches(self, mode, text):
+    text = fold(self.field, text)
+    if mode == 'prefix':
+      return self.forward.prefix(text)
+    if mode == 'suffix':
+      return self.backward.prefix(text[::-1])
+    return self.forward.contains(text)
@@ -0,0 +1,216 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+PROFILE_ENV = 'ASSISTANT_PROFILE'
+PHASES = ('lookup', 'fuzzy', 'render', 'persist')
+SAMPLE_INTERVAL = 0.001
+
+
+def percentile(values, share):
+  ordered = sorted(values)
+  return ordered[min(int(share * len(ordered)), len(ordered) - 1)]
+
+
+class Sampler(threading.Thread):
+  def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+    super().__init__(daemon=True)
+    self.thread_id = thread_id
+    self.interval = interval
+    self.stacks = Counter()
+    self.stopped = threading.Event()
+
+  def run(self):
+    while not self.stopped.wait(self.interval):
+      frame = sys._current_frames().get(self.thread_id)
+      stack = []
+      while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+      if stack:
+        self.stacks[';'.join(reversed(stack))] += 1
+
+  def stop(self):
+    self.stopped.set()
+    self.join()
+
+  def write(self, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+      for stack, count in sorted(self.stacks.items()):
+        f.write(f'{stack} {count}\n')
+
+
+class Profiler:
+  def __init__(self):
+    self.enabled = False
+    self.timings = {}
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    self.cprofile = None
+    self.cprofile_output = None
+    self.sampler = None
+    self.flamegraph_output = None
+    self.tracemalloc = None
+
+  def enable(self, cprofile_output=None, flamegraph_output=None, allocations=True):
+    if not self.enabled:
+      install(self)
+    self.enabled = True
+    if allocations:
+      import tracemalloc
+      self.tracemalloc = tracemalloc
+      if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if cprofile_output:
+      self.cprofile_output = cprofile_output
+      import cProfile
+      self.cprofile = cProfile.Profile()
+      self.cprofile.enable()
+    if flamegraph_output:
+      self.flamegraph_output = flamegraph_output
+      self.sampler = Sampler(threading.get_ident())
+      self.sampler.start()
+
+  def finish(self):
+    if self.cprofile is not None:
+      self.cprofile.disable()
+      self.cprofile.dump_stats(self.cprofile_output)
+      self.cprofile = None
+    if self.sampler is not None:
+      self.sampler.stop()
+      self.sampler.write(self.flamegraph_output)
+      self.sampler = None
+
+  @contextmanager
+  def command(self, name):
+    if not self.enabled or getattr(self.local, 'phases', None) is not None:
+      yield
+      return
+    self.local.phases = dict.fromkeys(PHASES, 0.0)
+    self.local.phase = None
+    self.local.paused = 0.0
+    tracemalloc = self.tracemalloc
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+    if tracing:
+      tracemalloc.reset_peak()
+      allocated_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - start - self.local.paused
+      allocated, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+      if tracing:
+        allocated -= allocated_before
+        peak -= allocated_before
+      with self.lock:
+        self.timings.setdefault(name, []).append((elapsed, self.local.phases, allocated, peak))
+      self.local.phases = None
+
+  @contextmanager
+  def phase(self, name):
+    phases = getattr(self.local, 'phases', None)
+    if phases is None or self.local.phase is not None:
+      yield
+      return
+    self.local.phase = name
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      phases[name] += time.perf_counter() - start
+      self.local.phase = None
+
+  @contextmanager
+  def paused(self):
+    if getattr(self.local, 'phases', None) is None:
+      yield
+      return
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.local.paused += time.perf_counter() - start
+
+  def timed(self, phase, function):
+    @functools.wraps(function)
+    def inner(*args, **kwargs):
+      with self.phase(phase):
+        return function(*args, **kwargs)
+    return inner
+
+  def report(self):
+    from prettytable import PrettyTable
+    table = PrettyTable()
+    table.field_names = ['command', 'runs', 'p50 ms', 'p99 ms', 'max ms'] + [f'{phase} ms' for phase in PHASES] + ['alloc KB', 'peak KB']
+    table.align = 'r'
+    with self.lock:
+      timings = {name: list(runs) for name, runs in self.timings.items()}
+    for name, runs in sorted(timings.items(), key=lambda item: -sum(run[0] for run in item[1])):
+      elapsed = [run[0] for run in runs]
+      phases = [sum(run[1][phase] for run in runs) / len(runs) * 1000 for phase in PHASES]
+      allocated = sum(run[2] for run in runs) / len(runs) / 1024
+      peak = max(run[3] for run in runs) / 1024
+      table.add_row([name, len(runs), f'{percentile(elapsed, 0.5) * 1000:.2f}', f'{percentile(elapsed, 0.99) * 1000:.2f}', f'{max(elapsed) * 1000:.2f}'] + [f'{value:.2f}' for value in phases] + [f'{allocated:.1f}', f'{peak:.1f}'])
+    return table
+
+
+INSTRUMENTED = {
+  'lookup': [
+    ('address_book_pickle', 'AddressBook', ['find', 'find_by_phone', 'find_by_brthd', 'find_by_mail', 'find_by_addr', 'get_upcoming_birthdays']),
+    ('note_book', 'NoteBook', ['find_note', 'find_by_tags', 'search_notes', 'tag_counts']),
+    ('sharded_book', 'ShardedAddressBook', ['find', 'find_by_phone', 'find_by_brthd', 'find_by_mail', 'find_by_addr', 'get_upcoming_birthdays']),
+    ('query_index', 'MappedAddressBook', ['find', 'find_by_phone', 'find_by_brthd', 'find_by_mail', 'find_by_addr', 'find_matching', 'get_upcoming_birthdays']),
+    ('query_index', 'MappedNoteBook', ['find_by_tags', 'notes_between', 'latest_notes']),
+  ],
+  'fuzzy': [
+    ('fuzzy_index', 'NameIndex', ['extract']),
+    ('fuzzy_index', 'CommandMatcher', ['suggest']),
+    ('sharded_book', 'ShardedAddressBook', ['name_matches']),
+  ],
+  'render': [
+    ('prettytable', 'PrettyTable', ['get_string']),
+  ],
+  'persist': [
+    ('storage', 'PickleStorage', ['append', 'append_many', 'save', 'checkpoint', 'close']),
+    ('storage', 'JournalStorage', ['append', 'append_many', 'save', 'checkpoint', 'close']),
+    ('sqlite_book', 'SQLiteStorage', ['save', 'checkpoint', 'close']),
+    ('sharded_book', 'ShardedStorage', ['save', 'checkpoint', 'close']),
+  ],
+}
+
+
+def subclasses(cls):
+  yield cls
+  for subclass in cls.__subclasses__():
+    yield from subclasses(subclass)
+
+
+def install(profiler):
+  for phase, targets in INSTRUMENTED.items():
+    for module_name, class_name, methods in targets:
+      for cls in set(subclasses(getattr(__import__(module_name), class_name))):
+        for method in methods:
+          if method in cls.__dict__:
+            setattr(cls, method, profiler.timed(phase, cls.__dict__[method]))
+
+
+profiler = Profiler()
+
+
+def profiling_requested():
+  return os.environ.get(PROFILE_ENV, '') not in ('', '0')
+
+
+def stats(args, book, note_book):
+  if not profiler.enabled:
+    return f'Profiling is off. Start the bot with --profile or {PROFILE_ENV}=1.'
+  if not profiler.timings:
+    return 'No commands measured yet.'
+  return profiler.report()
@@ -0,0 +1,381 @@
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from itertools import takewhile
+from address_book_pickle import Record, Phone, Email, Address, Birthday, BIRTHDAY_QUERY, field_value, normalize_address, day_of_year, birthday_ranges, next_birthday, save_data
+from note_book import NoteRecord, Note, tag_prefix
+from pattern_index import PATTERN_FIELDS, field_values, fold
+
+
+MAGIC = b'F2PQRY1\n'
+VERSION = 3
+PATTERN_SECTIONS = tuple(f'{field}_{direction}{suffix}' for field in PATTERN_FIELDS for direction in ('forward', 'backward') for suffix in ('', '_rows'))
+SECTIONS = (
+  'names', 'phones', 'emails', 'addresses', 'birthdays', 'added',
+  'phone_keys', 'phone_rows', 'email_keys', 'email_rows', 'address_keys', 'address_rows', 'birthday_days', 'birthday_rows',
+  'note_ids', 'note_texts', 'note_created', 'note_tags', 'tag_names', 'tag_offsets', 'tag_rows',
+) + PATTERN_SECTIONS
+PREFIX = struct.Struct('<8sIQ')
+HEADER = struct.Struct(f'<8sIQ{2 * len(SECTIONS)}Q')
+STRINGS = {'names', 'phones', 'emails', 'addresses', 'phone_keys', 'email_keys', 'address_keys', 'note_texts', 'note_tags', 'tag_names'}
+STRINGS.update(name for name in PATTERN_SECTIONS if not name.endswith('_rows'))
+TYPECODES = {
+  'birthdays': 'i', 'added': 'I', 'phone_rows': 'I', 'email_rows': 'I', 'address_rows': 'I', 'birthday_days': 'H', 'birthday_rows': 'I',
+  'note_ids': 'q', 'note_created': 'q', 'tag_offsets': 'Q', 'tag_rows': 'I',
+}
+TYPECODES.update((name, 'I') for name in PATTERN_SECTIONS if name.endswith('_rows'))
+EPOCH = datetime(1, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+READ_ONLY_COMMANDS = {'hello', 'help', 'search', 'explain', 'birthdays', 'find-tag', 'show-all-notes', 'stats'}
+
+
+class Strings:
+  def __init__(self, view):
+    count = int.from_bytes(view[:8], 'little')
+    self.offsets = view[8:8 + (count + 1) * 8].cast('Q')
+    self.blob = view[8 + (count + 1) * 8:]
+    if self.offsets[-1] > len(self.blob):
+      raise ValueError('Query index file is corrupt')
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, position):
+    return str(self.blob[self.offsets[position]:self.offsets[position + 1]], 'utf-8')
+
+
+def pack_strings(values):
+  offsets = array('Q', [0])
+  blob = []
+  for value in values:
+    encoded = value.encode()
+    blob.append(encoded)
+    offsets.append(offsets[-1] + len(encoded))
+  return (len(offsets) - 1).to_bytes(8, 'little') + offsets.tobytes() + b''.join(blob)
+
+
+def sorted_pairs(pairs):
+  pairs = sorted(pairs)
+  return [value for value, _ in pairs], array('I', (row for _, row in pairs))
+
+
+def contact_columns(book):
+  names = sorted(book.data)
+  added = {name: position for position, name in enumerate(book.data)}
+  records = [book.data[name] for name in names]
+  phones = [(phone.value, row) for row, record in enumerate(records) for phone in record.phones]
+  emails = [(record.email.value, row) for row, record in enumerate(records) if record.email]
+  addresses = [(normalize_address(record.address.value), row) for row, record in enumerate(records) if record.address]
+  birthdays = sorted((day_of_year(record.birthday.value.month, record.birthday.value.day), row) for row, record in enumerate(records) if record.birthday)
+  phone_keys, phone_rows = sorted_pairs(phones)
+  email_keys, email_rows = sorted_pairs(emails)
+  address_keys, address_rows = sorted_pairs(addresses)
+  patterns = {}
+  for field in PATTERN_FIELDS:
+    values = [(fold(field, value), row) for row, record in enumerate(records) for value in field_values(field, record)]
+    patterns[f'{field}_forward'], patterns[f'{field}_forward_rows'] = sorted_pairs(values)
+    patterns[f'{field}_backward'], patterns[f'{field}_backward_rows'] = sorted_pairs((value[::-1], row) for value, row in values)
+  return {
+    **patterns,
+    'names': names,
+    'phones': ['\n'.join(phone.value for phone in record.phones) for record in records],
+    'emails': [record.email.value if record.email else '' for record in records],
+    'addresses': [record.address.value if record.address else '' for record in records],
+    'birthdays': array('i', (field_value.__get__(record.birthday) if record.birthday else 0 for record in records)),
+    'added': array('I', (added[name] for name in names)),
+    'phone_keys': phone_keys, 'phone_rows': phone_rows,
+    'email_keys': email_keys, 'email_rows': email_rows,
+    'address_keys': address_keys, 'address_rows': address_rows,
+    'birthday_days': array('H', (day for day, _ in birthdays)),
+    'birthday_rows': array('I', (row for _, row in birthdays)),
+  }
+
+
+def note_columns(note_book):
+  ids = sorted(note_book.data)
+  note_records = [note_book.data[id] for id in ids]
+  postings = {}
+  for row, note_record in enumerate(note_records):
+    for tag in note_record.tags:
+      postings.setdefault(tag, array('I')).append(row)
+  tag_names = sorted(postings)
+  tag_offsets = array('Q', [0])
+  tag_rows = array('I')
+  for tag in tag_names:
+    tag_rows.extend(postings[tag])
+    tag_offsets.append(len(tag_rows))
+  return {
+    'note_ids': array('q', ids),
+    'note_texts': [note_record.note.value for note_record in note_records],
+    'note_created': array('q', ((note_record.ctreated.replace(tzinfo=None) - EPOCH) // MICROSECOND for note_record in note_records)),
+    'note_tags': ['\n'.join(sorted(note_record.tags)) for note_record in note_records],
+    'tag_names': tag_names,
+    'tag_offsets': tag_offsets,
+    'tag_rows': tag_rows,
+  }
+
+
+def source_files(filenames):
+  for filename in filenames:
+    yield filename
+    yield filename + '-wal'
+    directory = os.path.dirname(filename) or '.'
+    prefix = os.path.basename(filename) + '.journal.'
+    if os.path.isdir(directory):
+      for entry in os.listdir(directory):
+        if entry.startswith(prefix) and entry[len(prefix):].isdigit():
+          yield os.path.join(directory, entry)
+
+
+def source_stamp(filenames):
+  stamp = 0
+  for filename in sorted(set(source_files(filenames))):
+    try:
+      stat = os.stat(filename)
+    except FileNotFoundError:
+      continue
+    stamp = zlib.crc32(f'{filename}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8', 'surrogatepass'), stamp)
+  return stamp
+
+
+def write_sections(columns, f, source):
+  spans = []
+  f.write(b'\0' * HEADER.size)
+  for name in SECTIONS:
+    data = pack_strings(columns[name]) if name in STRINGS else columns[name].tobytes()
+    f.write(b'\0' * (-f.tell() % 8))
+    spans.extend((f.tell(), len(data)))
+    f.write(data)
+  f.seek(0)
+  f.write(HEADER.pack(MAGIC, VERSION, source, *spans))
+
+
+def write_query_index(book, note_book, filename, source=0):
+  columns = {**contact_columns(book), **note_columns(note_book)}
+  save_data(columns, filename, lambda columns, f: write_sections(columns, f, source))
+
+
+class QueryIndex:
+  def __init__(self, filename):
+    with open(filename, 'rb') as f:
+      self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(self.map) < HEADER.size:
+      raise ValueError(f'{filename} is not a query index file')
+    if hasattr(mmap, 'MADV_RANDOM'):
+      self.map.madvise(mmap.MADV_RANDOM)
+    magic, version, self.source, *spans = HEADER.unpack_from(self.map)
+    if magic != MAGIC:
+      raise ValueError(f'{filename} is not a query index file')
+    if version != VERSION:
+      raise ValueError(f'{filename} was built by another version, rebuild it with python query_index.py')
+    view = memoryview(self.map)
+    for name, start, length in zip(SECTIONS, spans[::2], spans[1::2]):
+      if start + length > len(self.map):
+        raise ValueError(f'{filename} is truncated')
+      section = view[start:start + length]
+      setattr(self, name, Strings(section) if name in STRINGS else section.cast(TYPECODES[name]))
+
+
+def lookup(keys, rows, value):
+  position = bisect_left(keys, value)
+  if position < len(keys) and keys[position] == value:
+    return rows[position]
+  return None
+
+
+class MappedAddressBook:
+  read_only = True
+
+  def __init__(self, index):
+    self.index = index
+
+  def contact(self, row):
+    index = self.index
+    record = Record(index.names[row])
+    record.phones = [Phone(phone) for phone in index.phones[row].split('\n') if phone]
+    email, address, birthday = index.emails[row], index.addresses[row], index.birthdays[row]
+    if email:
+      record.email = Email(email)
+    if address:
+      record.address = Address(address)
+    if birthday:
+      record.birthday = Birthday.__new__(Birthday)
+      field_value.__set__(record.birthday, birthday)
+    return record
+
+  def values(self):
+    return (self.contact(row) for row in range(len(self.index.names)))
+
+  def find(self, name):
+    row = lookup(self.index.names, range(len(self.index.names)), name)
+    return self.contact(row) if row is not None else None
+
+  def find_by_phone(self, phone):
+    row = lookup(self.index.phone_keys, self.index.phone_rows, phone)
+    return self.contact(row) if row is not None else None
+
+  def find_by_mail(self, email):
+    row = lookup(self.index.email_keys, self.index.email_rows, email)
+    return self.contact(row) if row is not None else None
+
+  def find_by_addr(self, address):
+    row = lookup(self.index.address_keys, self.index.address_rows, normalize_address(address))
+    return self.contact(row) if row is not None else None
+
+  def find_matching(self, field, mode, text):
+    text = fold(field, text)
+    direction = 'backward' if mode == 'suffix' else 'forward'
+    keys = getattr(self.index, f'{field}_{direction}')
+    rows = getattr(self.index, f'{field}_{direction}_rows')
+    if mode == 'contains':
+      positions = (position for position in range(len(keys)) if text in keys[position])
+    else:
+      if mode == 'suffix':
+        text = text[::-1]
+      positions = takewhile(lambda position: keys[position].startswith(text), range(bisect_left(keys, text), len(keys)))
+    seen = set()
+    for position in positions:
+      row = rows[position]
+      if row not in seen:
+        seen.add(row)
+        yield self.contact(row)
+
+  def birthday_rows(self, first_day, last_day):
+    days = self.index.birthday_days
+    return self.index.birthday_rows[bisect_left(days, first_day):bisect_right(days, last_day)]
+
+  def find_by_brthd(self, birthday):
+    match = BIRTHDAY_QUERY.fullmatch(birthday)
+    if not match:
+      return []
+    day, month, year = match.groups()
+    day_number = day_of_year(int(month), int(day))
+    rows = sorted(self.birthday_rows(day_number, day_number), key=self.index.added.__getitem__)
+    return [self.contact(row) for row in rows if not year or date.fromordinal(self.index.birthdays[row]).year == int(year)]
+
+  def get_upcoming_birthdays(self, days):
+    today = datetime.today().date()
+    end_date = today + timedelta(days=days)
+    list_of_birthdays = []
+    for start, end in birthday_ranges(today, end_date):
+      for row in self.birthday_rows(day_of_year(*start), day_of_year(*end)):
+        birthday_this_year = next_birthday(date.fromordinal(self.index.birthdays[row]), today)
+        if birthday_this_year <= end_date:
+          list_of_birthdays.append({
+            "name": self.index.names[row],
+            "birthday": birthday_this_year.strftime("%Y-%m-%d")
+          })
+    return list_of_birthdays
+
+
+class MappedNoteBook:
+  read_only = True
+
+  def __init__(self, index):
+    self.index = index
+
+  def note(self, row):
+    index = self.index
+    note_record = NoteRecord.__new__(NoteRecord)
+    note_record._book = None
+    note_record._key = index.note_ids[row]
+    note_record.note = Note(index.note_texts[row])
+    note_record.tags = set(filter(None, index.note_tags[row].split('\n')))
+    note_record.ctreated = EPOCH + index.note_created[row] * MICROSECOND
+    return note_record
+
+  def rows(self, start, end):
+    note_ids = self.index.note_ids
+    return ((note_ids[row], self.note(row)) for row in range(start, end))
+
+  def items(self):
+    return self.rows(0, len(self.index.note_ids))
+
+  def notes_between(self, first=None, last=None):
+    note_ids = self.index.note_ids
+    start = 0 if first is None else bisect_left(note_ids, first)
+    end = len(note_ids) if last is None else bisect_right(note_ids, last)
+    return self.rows(start, end)
+
+  def latest_notes(self, count):
+    end = len(self.index.note_ids)
+    return list(self.rows(max(end - count, 0), end))[::-1]
+
+  def tag_rows(self, position):
+    offsets = self.index.tag_offsets
+    return self.index.tag_rows[offsets[position]:offsets[position + 1]]
+
+  def find_tag_term(self, term):
+    tag_names = self.index.tag_names
+    prefix = tag_prefix(term)
+    if prefix is None:
+      position = bisect_left(tag_names, term)
+      if position < len(tag_names) and tag_names[position] == term:
+        return set(self.tag_rows(position))
+      return set()
+    rows = set()
+    position = bisect_left(tag_names, prefix)
+    while position < len(tag_names) and tag_names[position].startswith(prefix):
+      rows.update(self.tag_rows(position))
+      position += 1
+    return rows
+
+  def find_by_tags(self, terms, match_any=False):
+    matches = sorted((self.find_tag_term(term) for term in terms), key=len)
+    if not matches:
+      return []
+    rows = set().union(*matches) if match_any else matches[0].intersection(*matches[1:])
+    return [(self.index.note_ids[row], self.note(row)) for row in sorted(rows)]
+
+
+def open_query_index(filename='assistant.qidx'):
+  index = QueryIndex(filename)
+  return MappedAddressBook(index), MappedNoteBook(index)
+
+
+def is_current(filename, backend='journal', shards=None, tenant=None):
+  from main import storage_files
+  files = storage_files(backend, shards, tenant)
+  if files is None:
+    return False
+  try:
+    with open(filename, 'rb') as f:
+      magic, version, source = PREFIX.unpack(f.read(PREFIX.size))
+  except (FileNotFoundError, struct.error):
+    return False
+  return magic == MAGIC and version == VERSION and source == source_stamp(files)
+
+
+def build(backend='journal', filename='assistant.qidx', compress=0, shards=None, tenant=None):
+  from main import open_storages, storage_files
+  storages = open_storages(backend, compress, shards, tenant)
+  source = source_stamp(storage_files(backend, shards, tenant))
+  books = [storage.load() for storage in storages]
+  for book in books:
+    if hasattr(book, 'load_all'):
+      book.load_all()
+  write_query_index(*books, filename, source)
+  for storage in storages:
+    storage.close()
+
+
+def main():
+  from main import tenant_name
+  parser = argparse.ArgumentParser(description='Build the read-only query index')
+  parser.add_argument('--storage', choices=['journal', 'sqlite', 'lazy', 'columnar', 'sharded'], default='journal', help='where contacts and notes are kept')
+  parser.add_argument('--compress', metavar='LEVEL', type=int, choices=range(10), default=0, help='zlib level for columnar files, 0 stores them uncompressed')
+  parser.add_argument('--shards', metavar='N', type=int, help='number of shard files for sharded storage')
+  parser.add_argument('--tenant', metavar='NAME', type=tenant_name, help='index the sharded contacts and notes in tenants/NAME')
+  parser.add_argument('filename', nargs='?', default='assistant.qidx')
+  options = parser.parse_args()
+  build(options.storage, options.filename, options.compress, options.shards, options.tenant)
+  print(f'Query index written to {options.filename}')
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import itertools
+import shlex
+import signal
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from address_book_pickle import set_interactive, suggest_command
+from main import COMMANDS, open_storages, dispatch, command_error, close_all, tenant_name
+
+
+WRITE_COMMANDS = {'add', 'remove', 'edit', 'delete', 'add-note', 'add-tag', 'delete-note', 'dedupe'}
+LOCAL_COMMANDS = {'import', 'export'}
+SERVER_COMMANDS = [command for command in COMMANDS if command not in LOCAL_COMMANDS]
+WELCOME = "Welcome to the assistant bot!\nIf you need help, type 'help'."
+END = b'.\n'
+BACKLOG = 1024
+
+
+class ReadWriteLock:
+  def __init__(self):
+    self.readers = 0
+    self.writer = False
+    self.waiting_writers = 0
+    self.condition = asyncio.Condition()
+
+  @asynccontextmanager
+  async def read(self):
+    async with self.condition:
+      await self.condition.wait_for(lambda: not self.writer and not self.waiting_writers)
+      self.readers += 1
+    try:
+      yield
+    finally:
+      async with self.condition:
+        self.readers -= 1
+        self.condition.notify_all()
+
+  @asynccontextmanager
+  async def write(self):
+    async with self.condition:
+      self.waiting_writers += 1
+      await self.condition.wait_for(lambda: not self.writer and not self.readers)
+      self.waiting_writers -= 1
+      self.writer = True
+    try:
+      yield
+    finally:
+      async with self.condition:
+        self.writer = False
+        self.condition.notify_all()
+
+
+def frame(text):
+  lines = str(text).split('\n')
+  return ''.join(f'.{line}\n' if line.startswith('.') else f'{line}\n' for line in lines).encode()
+
+
+class Session:
+  numbers = itertools.count(1)
+
+  def __init__(self, writer):
+    self.number = next(self.numbers)
+    self.writer = writer
+
+  async def send(self, text):
+    self.writer.write(frame(text))
+    await self.writer.drain()
+
+  async def send_end(self):
+    self.writer.write(END)
+    await self.writer.drain()
+
+  async def reply(self, text):
+    await self.send(text)
+    await self.send_end()
+
+
+class AssistantServer:
+  def __init__(self, storages, books, workers=8, save_interval=30):
+    self.storages = storages
+    self.books = books
+    self.lock = ReadWriteLock()
+    self.executor = ThreadPoolExecutor(workers)
+    self.save_interval = save_interval
+
+  async def run_command(self, command, args):
+    loop = asyncio.get_running_loop()
+    lock = self.lock.write() if command in WRITE_COMMANDS else self.lock.read()
+    async with lock:
+      return await loop.run_in_executor(self.executor, dispatch, command, args, *self.books)
+
+  async def stream(self, session, pages):
+    loop = asyncio.get_running_loop()
+    while True:
+      page = await loop.run_in_executor(self.executor, next, pages, None)
+      if page is None:
+        break
+      await session.send('\n' + page)
+    await session.send_end()
+
+  async def execute(self, session, line):
+    try:
+      command, *args = shlex.split(line)
+    except ValueError as e:
+      return await session.reply(str(e))
+    command = command.lower()
+    if command in LOCAL_COMMANDS:
+      return await session.reply(f'{command} reads and writes server files, run it with main.py instead')
+    error = command_error(command, args)
+    if error:
+      suggestions = suggest_command(command, SERVER_COMMANDS) if command not in COMMANDS else []
+      if suggestions:
+        error += f". Did you mean: {', '.join(suggestions)}?"
+      return await session.reply(error)
+    try:
+      output = await self.run_command(command, args)
+    except Exception as e:
+      return await session.reply(str(e))
+    if isinstance(output, Iterator):
+      return await self.stream(session, output)
+    await session.reply(output)
+
+  async def handle(self, reader, writer):
+    session = Session(writer)
+    try:
+      await session.reply(WELCOME)
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        line = line.decode('utf-8', errors='replace').strip()
+        if not line:
+          continue
+        if line.lower() in ('exit', 'close'):
+          await session.reply('Good bye!')
+          break
+        await self.execute(session, line)
+    except (ConnectionError, asyncio.CancelledError):
+      pass
+    finally:
+      writer.close()
+
+  def checkpoint(self):
+    for storage, book in zip(self.storages, self.books):
+      storage.checkpoint(book)
+
+  async def save(self):
+    loop = asyncio.get_running_loop()
+    async with self.lock.write():
+      await loop.run_in_executor(self.executor, self.checkpoint)
+
+  async def autosave(self):
+    while True:
+      await asyncio.sleep(self.save_interval)
+      await self.save()
+
+  async def serve(self, host='127.0.0.1', port=8765, path=None):
+    if path:
+      server = await asyncio.start_unix_server(self.handle, path, backlog=BACKLOG)
+    else:
+      server = await asyncio.start_server(self.handle, host, port, backlog=BACKLOG)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+      loop.add_signal_handler(sig, asyncio.current_task().cancel)
+    autosave = asyncio.create_task(self.autosave())
+    try:
+      async with server:
+        await server.serve_forever()
+    finally:
+      autosave.cancel()
+      async with self.lock.write():
+        await loop.run_in_executor(self.executor, close_all, self.storages, self.books)
+      self.executor.shutdown()
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description='Assistant bot server')
+  parser.add_argument('--storage', choices=['journal', 'sqlite', 'lazy', 'columnar', 'sharded'], default='journal', help='where contacts and notes are kept')
+  parser.add_argument('--compress', metavar='LEVEL', type=int, choices=range(10), default=0, help='zlib level for columnar files, 0 stores them uncompressed')
+  parser.add_argument('--shards', metavar='N', type=int, help='number of shard files for sharded storage')
+  parser.add_argument('--tenant', metavar='NAME', type=tenant_name, help='keep sharded contacts and notes in tenants/NAME')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--socket', metavar='PATH', help='listen on a Unix socket instead of TCP')
+  parser.add_argument('--workers', type=int, default=8, help='threads that run commands')
+  parser.add_argument('--save-interval', type=int, default=30, help='seconds between saves')
+  return parser.parse_args()
+
+
+def main():
+  options = parse_args()
+  set_interactive(False)
+  storages = open_storages(options.storage, options.compress, options.shards, options.tenant)
+  books = tuple(storage.load() for storage in storages)
+  for book in books:
+    if hasattr(book, 'load_all'):
+      book.load_all()
+  server = AssistantServer(storages, books, options.workers, options.save_interval)
+  where = options.socket or f'{options.host}:{options.port}'
+  print(f'Serving the assistant bot on {where}')
+  try:
+    asyncio.run(server.serve(options.host, options.port, options.socket))
+  except (KeyboardInterrupt, asyncio.CancelledError):
+    print('Good bye!\nSaving data...')
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,269 @@
+import heapq
+import os
+import threading
+import zlib
+from collections.abc import Mapping
+from itertools import chain
+from address_book_pickle import AddressBook, save_data
+from storage import JournalStorage
+
+
+DEFAULT_SHARDS = 8
+MANIFEST = 'addressbook.shards'
+PARALLEL_MIN = 20_000
+
+
+def shard_of(name, count):
+  return zlib.crc32(name.encode('utf-8', 'surrogatepass')) % count
+
+
+def shard_path(directory, shard, count):
+  return os.path.join(directory, f'addressbook.{shard:03d}-of-{count:03d}.pkl')
+
+
+def read_count(directory):
+  try:
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+      return int(f.read())
+  except FileNotFoundError:
+    return None
+
+
+def write_count(directory, count):
+  save_data(count, os.path.join(directory, MANIFEST), lambda count, f: f.write(f'{count}\n'.encode()))
+
+
+def remove_shards(directory, count):
+  for shard in range(count):
+    storage = JournalStorage(shard_path(directory, shard, count), AddressBook)
+    for segment in storage.segments():
+      os.remove(storage.segment_path(segment))
+    if os.path.exists(storage.filename):
+      os.remove(storage.filename)
+
+
+def write_shards(book, directory, count):
+  remove_shards(directory, count)
+  shards = [AddressBook() for _ in range(count)]
+  for key, record in book.items():
+    shards[shard_of(key, count)].data[key] = record
+  for shard, data in enumerate(shards):
+    save_data(data, shard_path(directory, shard, count))
+  write_count(directory, count)
+
+
+def prepare(directory, count=None, source='addressbook.pkl'):
+  os.makedirs(directory, exist_ok=True)
+  current = read_count(directory)
+  if count is None:
+    count = current or DEFAULT_SHARDS
+  if count < 1:
+    raise ValueError('Sharded storage needs at least one shard')
+  if current == count:
+    return count
+  if current is None:
+    storage = JournalStorage(os.path.join(directory, source), AddressBook)
+    write_shards(storage.load(), directory, count)
+    storage.close()
+    return count
+  storage = ShardedStorage(directory, current)
+  write_shards(storage.load(), directory, count)
+  storage.close()
+  remove_shards(directory, current)
+  return count
+
+
+def read_shard(filename):
+  storage = JournalStorage(filename, AddressBook)
+  while True:
+    listed = storage.segments()
+    book = storage.snapshot.read(filename, AddressBook)
+    try:
+      return storage.replay(book, sorted(set(listed).union(storage.segments())))
+    except FileNotFoundError:
+      continue
+
+
+cached = {}
+
+
+def worker_shard(filename, version):
+  entry = cached.get(filename)
+  if entry is None or entry[0] != version:
+    entry = cached[filename] = version, read_shard(filename)
+  return entry[1]
+
+
+def on_shard(query, filename, version, *args):
+  return query(worker_shard(filename, version), *args)
+
+
+def pool_context():
+  import multiprocessing
+  method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+  return multiprocessing.get_context(method)
+
+
+def first(records):
+  return next((record for record in records if record), None)
+
+
+def upcoming_birthdays(book, days):
+  return book.get_upcoming_birthdays(days)
+
+
+def name_matches(book, name):
+  return book.name_matches(name)
+
+
+class Shards(Mapping):
+  def __init__(self, shards):
+    self.shards = shards
+
+  def __getitem__(self, key):
+    return self.shards[shard_of(key, len(self.shards))].data[key]
+
+  def __contains__(self, key):
+    return key in self.shards[shard_of(key, len(self.shards))].data
+
+  def __iter__(self):
+    return chain.from_iterable(shard.data for shard in self.shards)
+
+  def __len__(self):
+    return sum(len(shard.data) for shard in self.shards)
+
+
+class ShardedAddressBook:
+  def __init__(self, shards, workers=None, parallel_min=PARALLEL_MIN):
+    self.shards = shards
+    self.data = Shards(shards)
+    self.workers = workers or os.cpu_count() or 1
+    self.parallel_min = parallel_min
+    self.executors = None
+    self.lock = threading.Lock()
+
+  @property
+  def changes(self):
+    return sum(shard.changes for shard in self.shards)
+
+  def shard(self, name):
+    return self.shards[shard_of(name, len(self.shards))]
+
+  def keys(self):
+    return self.data.keys()
+
+  def values(self):
+    return self.data.values()
+
+  def items(self):
+    return self.data.items()
+
+  def add_record(self, record):
+    self.shard(record.name.value).add_record(record)
+
+  def find(self, name):
+    return self.shard(name).find(name)
+
+  def delete(self, name):
+    self.shard(name).delete(name)
+
+  def put_many(self, items):
+    groups = [[] for _ in self.shards]
+    for key, record in items:
+      groups[shard_of(key, len(self.shards))].append((key, record))
+    return sum(shard.put_many(group) for shard, group in zip(self.shards, groups) if group)
+
+  def rebuild_index(self):
+    for shard in self.shards:
+      shard.rebuild_index()
+
+  def find_by_phone(self, phone):
+    return first(shard.find_by_phone(phone) for shard in self.shards)
+
+  def find_by_mail(self, email):
+    return first(shard.find_by_mail(email) for shard in self.shards)
+
+  def find_by_addr(self, address):
+    return first(shard.find_by_addr(address) for shard in self.shards)
+
+  def find_by_brthd(self, birthday):
+    return [record for shard in self.shards for record in shard.find_by_brthd(birthday)]
+
+  def matches(self, field, mode, text):
+    return heapq.merge(*(shard.matches(field, mode, text) for shard in self.shards))
+
+  find_matching = AddressBook.find_matching
+
+  def get_upcoming_birthdays(self, days):
+    found = chain.from_iterable(self.fan_out(upcoming_birthdays, days))
+    return sorted(found, key=lambda entry: (entry['birthday'], entry['name']))
+
+  def name_matches(self, name):
+    found = chain.from_iterable(self.fan_out(name_matches, name))
+    return sorted(found, key=lambda match: (-match[1], match[0]))
+
+  def suggest_names(self, name):
+    return [key for key, score in self.name_matches(name)]
+
+  def fan_out(self, query, *args):
+    if self.workers < 2 or len(self.data) < self.parallel_min or any(shard.storage is None for shard in self.shards):
+      return [query(shard, *args) for shard in self.shards]
+    executors = self.start()
+    futures = [
+      executors[position % len(executors)].submit(on_shard, query, shard.storage.filename, shard.changes, *args)
+      for position, shard in enumerate(self.shards)
+    ]
+    return [future.result() for future in futures]
+
+  def start(self):
+    with self.lock:
+      if self.executors is None:
+        from concurrent.futures import ProcessPoolExecutor
+        context = pool_context()
+        self.executors = [ProcessPoolExecutor(1, mp_context=context) for _ in range(min(self.workers, len(self.shards)))]
+      return self.executors
+
+  def shutdown(self):
+    with self.lock:
+      for executor in self.executors or ():
+        executor.shutdown()
+      self.executors = None
+
+
+class ShardedStorage:
+  def __init__(self, directory, count):
+    self.directory = directory
+    self.storages = [JournalStorage(shard_path(directory, shard, count), AddressBook) for shard in range(count)]
+    self.saved = [0] * count
+    self.book = None
+
+  def load(self):
+    self.book = ShardedAddressBook([storage.load() for storage in self.storages])
+    self.saved = [shard.changes for shard in self.book.shards]
+    return self.book
+
+  def append(self, op, key, record=None):
+    pass
+
+  def append_many(self, entries):
+    pass
+
+  def dirty(self, book):
+    for position, (storage, shard) in enumerate(zip(self.storages, book.shards)):
+      if shard.changes != self.saved[position]:
+        self.saved[position] = shard.changes
+        yield storage, shard
+
+  def checkpoint(self, book):
+    for storage, shard in self.dirty(book):
+      storage.checkpoint(shard)
+
+  def save(self, book):
+    for storage, shard in zip(self.storages, book.shards):
+      storage.save(shard)
+
+  def close(self):
+    if self.book is not None:
+      self.book.shutdown()
+    for storage in self.storages:
+      storage.close()
@@ -0,0 +1,479 @@
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from address_book_pickle import AddressBook, Record, Phone, Email, Address, Birthday, BIRTHDAY_QUERY, birthday_ranges, next_birthday, normalize_address
+from note_book import NoteBook, NoteRecord, tag_prefix
+from note_search import parse_query
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contacts (
+  name TEXT PRIMARY KEY,
+  email TEXT,
+  address TEXT,
+  address_key TEXT,
+  birthday TEXT,
+  bday_month INTEGER,
+  bday_day INTEGER
+);
+CREATE TABLE IF NOT EXISTS phones (
+  phone TEXT NOT NULL,
+  name TEXT NOT NULL REFERENCES contacts(name) ON DELETE CASCADE,
+  position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones(phone);
+CREATE INDEX IF NOT EXISTS phones_name ON phones(name, position);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts(email);
+CREATE INDEX IF NOT EXISTS contacts_birthday ON contacts(bday_month, bday_day);
+CREATE TABLE IF NOT EXISTS notes (
+  id INTEGER PRIMARY KEY,
+  note TEXT NOT NULL,
+  created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS note_tags (
+  id INTEGER NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+  tag TEXT NOT NULL,
+  position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS note_tags_tag ON note_tags(tag);
+CREATE INDEX IF NOT EXISTS note_tags_id ON note_tags(id, position);
+CREATE TABLE IF NOT EXISTS sequences (
+  name TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS notes_sequence AFTER INSERT ON notes BEGIN
+  INSERT OR REPLACE INTO sequences (name, value)
+    VALUES ('notes', max(new.id, coalesce((SELECT value FROM sequences WHERE name = 'notes'), 0)));
+END;
+'''
+
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE notes_fts USING fts5(note, content='notes', content_rowid='id');
+CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN
+  INSERT INTO notes_fts(rowid, note) VALUES (new.id, new.note);
+END;
+CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes BEGIN
+  INSERT INTO notes_fts(notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+END;
+CREATE TRIGGER notes_fts_update AFTER UPDATE OF note ON notes BEGIN
+  INSERT INTO notes_fts(notes_fts, rowid, note) VALUES ('delete', old.id, old.note);
+  INSERT INTO notes_fts(rowid, note) VALUES (new.id, new.note);
+END;
+INSERT INTO notes_fts(notes_fts) VALUES ('rebuild');
+'''
+
+CONTACT_COLUMNS = '''
+  SELECT c.name, c.email, c.address, c.birthday,
+    (SELECT group_concat(phone, ' ') FROM (SELECT phone FROM phones WHERE name = c.name ORDER BY position))
+  FROM contacts c
+'''
+
+NOTE_COLUMNS = '''
+  SELECT n.id, n.note, n.created,
+    (SELECT group_concat(tag, char(10)) FROM (SELECT tag FROM note_tags WHERE id = n.id ORDER BY position))
+  FROM notes n
+'''
+
+LIKE_PATTERNS = {'prefix': '{}%', 'suffix': '%{}', 'contains': '%{}%'}
+MATCH_WHERE = {
+  'name': "WHERE fold(c.name) LIKE ? ESCAPE '\\' ORDER BY c.rowid",
+  'email': "WHERE fold(c.email) LIKE ? ESCAPE '\\' ORDER BY c.rowid",
+  'phone': "WHERE c.name IN (SELECT name FROM phones WHERE phone LIKE ? ESCAPE '\\') ORDER BY c.rowid",
+}
+
+
+def fold(value):
+  return value.lower() if value is not None else None
+
+
+def like_pattern(mode, text):
+  return LIKE_PATTERNS[mode].format(text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+
+
+def open_connection(filename):
+  conn = sqlite3.connect(filename, check_same_thread=False)
+  conn.create_function('fold', 1, fold, deterministic=True)
+  conn.execute('PRAGMA foreign_keys=ON')
+  return conn
+
+
+def connect(filename='assistant.db'):
+  conn = open_connection(filename)
+  conn.execute('PRAGMA journal_mode=WAL')
+  conn.executescript(SCHEMA)
+  if 'address_key' not in {column[1] for column in conn.execute('PRAGMA table_info(contacts)')}:
+    with conn:
+      conn.execute('ALTER TABLE contacts ADD COLUMN address_key TEXT')
+      conn.executemany('UPDATE contacts SET address_key = ? WHERE name = ?',
+        [(normalize_address(address), name) for name, address in conn.execute('SELECT name, address FROM contacts WHERE address IS NOT NULL').fetchall()])
+      conn.execute('DROP INDEX IF EXISTS contacts_address')
+  conn.execute('CREATE INDEX IF NOT EXISTS contacts_address_key ON contacts(address_key)')
+  if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'").fetchone() is None:
+    conn.executescript(FTS_SCHEMA)
+  return conn
+
+
+class Connections:
+  def __init__(self, filename):
+    self.filename = filename
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    self.opened = [connect(filename)]
+    self.local.conn = self.opened[0]
+
+  def get(self):
+    conn = getattr(self.local, 'conn', None)
+    if conn is None:
+      conn = self.local.conn = open_connection(self.filename)
+      with self.lock:
+        self.opened.append(conn)
+    return conn
+
+  def execute(self, *args):
+    return self.get().execute(*args)
+
+  def executemany(self, *args):
+    return self.get().executemany(*args)
+
+  def __enter__(self):
+    return self.get().__enter__()
+
+  def __exit__(self, *exc_info):
+    return self.get().__exit__(*exc_info)
+
+  def commit(self):
+    with self.lock:
+      for conn in self.opened:
+        conn.commit()
+
+  def close(self):
+    with self.lock:
+      for conn in self.opened:
+        conn.close()
+      self.opened = []
+
+
+class Table(MutableMapping):
+  def __init__(self, conn, book):
+    self.conn = conn
+    self.book = book
+    self.loaded = {}
+
+  def link(self, key, record):
+    record._book = self.book
+    record._key = key
+    self.loaded[key] = record
+    return record
+
+  def fetch(self, where='', params=()):
+    for row in self.conn.execute(self.columns + where, params):
+      key = row[0]
+      if key in self.loaded:
+        yield self.loaded[key]
+      else:
+        yield self.link(key, self.from_row(row))
+
+  def __getitem__(self, key):
+    if key in self.loaded:
+      return self.loaded[key]
+    for record in self.fetch(f'WHERE {self.key_column} = ?', (key,)):
+      return record
+    raise KeyError(key)
+
+  def __contains__(self, key):
+    if key in self.loaded:
+      return True
+    return self.conn.execute(f'SELECT 1 FROM {self.table} WHERE {self.key_column} = ?', (key,)).fetchone() is not None
+
+  def __setitem__(self, key, record):
+    with self.conn:
+      self.write(key, record)
+    self.link(key, record)
+
+  def __delitem__(self, key):
+    with self.conn:
+      cursor = self.conn.execute(f'DELETE FROM {self.table} WHERE {self.key_column} = ?', (key,))
+    self.loaded.pop(key, None)
+    if not cursor.rowcount:
+      raise KeyError(key)
+
+  def __iter__(self):
+    for row in self.conn.execute(f'SELECT {self.key_column} FROM {self.table} ORDER BY rowid'):
+      yield row[0]
+
+  def __len__(self):
+    return self.conn.execute(f'SELECT count(*) FROM {self.table}').fetchone()[0]
+
+  def keys(self):
+    return iter(self)
+
+  def values(self):
+    return self.fetch('ORDER BY rowid')
+
+  def items(self):
+    return ((record._key, record) for record in self.values())
+
+
+class ContactTable(Table):
+  table = 'contacts'
+  key_column = 'name'
+  columns = CONTACT_COLUMNS
+
+  def from_row(self, row):
+    name, email, address, birthday, phones = row
+    record = Record(name)
+    record.phones = [Phone(phone) for phone in phones.split(' ')] if phones else []
+    record.email = Email(email) if email else None
+    record.address = Address(address) if address else None
+    record.birthday = Birthday(birthday) if birthday else None
+    return record
+
+  def write(self, key, record):
+    birthday = record.birthday.value if record.birthday else None
+    self.conn.execute(
+      'INSERT OR REPLACE INTO contacts (name, email, address, address_key, birthday, bday_month, bday_day) VALUES (?, ?, ?, ?, ?, ?, ?)',
+      (key,
+       record.email.value if record.email else None,
+       record.address.value if record.address else None,
+       normalize_address(record.address.value) if record.address else None,
+       birthday.strftime('%d.%m.%Y') if birthday else None,
+       birthday.month if birthday else None,
+       birthday.day if birthday else None))
+    self.conn.execute('DELETE FROM phones WHERE name = ?', (key,))
+    self.conn.executemany(
+      'INSERT INTO phones (phone, name, position) VALUES (?, ?, ?)',
+      [(phone.value, key, position) for position, phone in enumerate(record.phones)])
+
+
+class NoteTable(Table):
+  table = 'notes'
+  key_column = 'id'
+  columns = NOTE_COLUMNS
+
+  def from_row(self, row):
+    id, note, created, tags = row
+    note_record = NoteRecord(note)
+    note_record.tags = set(tags.split('\n')) if tags else set()
+    note_record.ctreated = datetime.fromisoformat(created)
+    return note_record
+
+  def write(self, key, note_record):
+    self.conn.execute(
+      'INSERT INTO notes (id, note, created) VALUES (?, ?, ?) '
+      'ON CONFLICT(id) DO UPDATE SET note = excluded.note, created = excluded.created',
+      (key, note_record.note.value, note_record.ctreated.isoformat()))
+    self.conn.execute('DELETE FROM note_tags WHERE id = ?', (key,))
+    self.conn.executemany(
+      'INSERT INTO note_tags (id, tag, position) VALUES (?, ?, ?)',
+      [(key, tag, position) for position, tag in enumerate(sorted(note_record.tags))])
+
+
+class SQLiteBook:
+  def reset_index(self):
+    pass
+
+  def rebuild_index(self):
+    pass
+
+  def index(self, record):
+    pass
+
+  def unindex(self, record):
+    pass
+
+  def after_change(self, record):
+    self.data[record._key] = record
+
+  def put_many(self, items):
+    count = 0
+    with self.data.conn:
+      for key, record in items:
+        self.data.write(key, record)
+        self.data.loaded.pop(key, None)
+        count += 1
+    return count
+
+  def keys(self):
+    return self.data.keys()
+
+  def values(self):
+    return self.data.values()
+
+  def items(self):
+    return self.data.items()
+
+
+class SQLiteAddressBook(SQLiteBook, AddressBook):
+  name_index = None
+  name_stamp = None
+
+  def __init__(self, conn):
+    self.data = ContactTable(conn, self)
+
+  def find_one(self, where, params):
+    for record in self.data.fetch(where + ' LIMIT 1', params):
+      return record
+    return None
+
+  def find(self, name) -> Record:
+    return self.data.get(name)
+
+  def name_matches(self, name):
+    stamp = self.data.conn.execute('SELECT count(*), total(rowid), max(rowid) FROM contacts').fetchone()
+    if self.name_index is None:
+      from fuzzy_index import NameIndex
+      self.name_index = NameIndex()
+      self.name_keys = set()
+    if stamp != self.name_stamp:
+      keys = set(self.data.keys())
+      for key in self.name_keys - keys:
+        self.name_index.remove(key)
+      for key in keys - self.name_keys:
+        self.name_index.add(key)
+      self.name_keys, self.name_stamp = keys, stamp
+    return self.name_index.extract(name)
+
+  def find_matching(self, field, mode, text):
+    if field == 'phone' and mode == 'prefix':
+      return self.data.fetch('WHERE c.name IN (SELECT name FROM phones WHERE phone >= ? AND phone < ?) ORDER BY c.rowid', (text, text + '\U0010ffff'))
+    return self.data.fetch(MATCH_WHERE[field], (like_pattern(mode, fold(text)),))
+
+  def find_by_phone(self, phone) -> Record:
+    return self.find_one('WHERE c.name = (SELECT name FROM phones WHERE phone = ?)', (phone,))
+
+  def find_by_mail(self, email) -> Record:
+    return self.find_one('WHERE c.email = ?', (email,))
+
+  def find_by_addr(self, address) -> Record:
+    return self.find_one('WHERE c.address_key = ? ORDER BY c.rowid', (normalize_address(address),))
+
+  def find_by_brthd(self, birthday) -> Record:
+    match = BIRTHDAY_QUERY.fullmatch(birthday)
+    if not match:
+      return []
+    day, month, year = match.groups()
+    if year:
+      return list(self.data.fetch('WHERE c.birthday = ? ORDER BY c.rowid', (birthday,)))
+    return list(self.data.fetch('WHERE c.bday_month = ? AND c.bday_day = ? ORDER BY c.rowid', (int(month), int(day))))
+
+  def get_upcoming_birthdays(self, days):
+    today = datetime.today().date()
+    end_date = today + timedelta(days=days)
+    list_of_birthdays = []
+    for start, end in birthday_ranges(today, end_date):
+      where = 'WHERE (c.bday_month, c.bday_day) BETWEEN (?, ?) AND (?, ?) ORDER BY c.bday_month, c.bday_day'
+      for record in self.data.fetch(where, start + end):
+        birthday_this_year = next_birthday(record.birthday.value, today)
+        if birthday_this_year <= end_date:
+          list_of_birthdays.append({
+            "name": record.name.value,
+            "birthday": birthday_this_year.strftime("%Y-%m-%d")
+          })
+    return list_of_birthdays
+
+
+class SQLiteNoteBook(SQLiteBook, NoteBook):
+  def __init__(self, conn):
+    self.data = NoteTable(conn, self)
+
+  def next_id(self):
+    return self.data.conn.execute(
+      "SELECT max(coalesce((SELECT value FROM sequences WHERE name = 'notes'), 0), coalesce((SELECT max(id) FROM notes), 0)) + 1"
+    ).fetchone()[0]
+
+  def notes_between(self, first=None, last=None):
+    where = 'WHERE n.id BETWEEN ? AND ? ORDER BY n.id'
+    return ((note_record._key, note_record) for note_record in self.data.fetch(where, (first or 0, last if last is not None else 2 ** 63 - 1)))
+
+  def latest_notes(self, count):
+    return [(note_record._key, note_record) for note_record in self.data.fetch('ORDER BY n.id DESC LIMIT ?', (count,))]
+
+  def tags_with_prefix(self, prefix):
+    for row in self.data.conn.execute('SELECT DISTINCT tag FROM note_tags WHERE tag >= ? AND tag < ? ORDER BY tag', (prefix, prefix + '\U0010ffff')):
+      yield row[0]
+
+  def find_by_tags(self, terms, match_any=False):
+    if not terms:
+      return []
+    selects = []
+    params = []
+    for term in terms:
+      prefix = tag_prefix(term)
+      if prefix is None:
+        selects.append('SELECT id FROM note_tags WHERE tag = ?')
+        params.append(term)
+      else:
+        selects.append('SELECT id FROM note_tags WHERE tag >= ? AND tag < ?')
+        params.extend((prefix, prefix + '\U0010ffff'))
+    query = (' UNION ' if match_any else ' INTERSECT ').join(selects)
+    return [(note_record._key, note_record) for note_record in self.data.fetch(f'WHERE n.id IN ({query}) ORDER BY n.id', params)]
+
+  def search_notes(self, query, limit=None):
+    clauses = []
+    for kind, value in parse_query(query):
+      if kind == 'phrase':
+        clauses.append('"' + ' '.join(value) + '"')
+      elif kind == 'prefix':
+        clauses.append(f'"{value}" *')
+      else:
+        clauses.append(f'"{value}"')
+    if not clauses:
+      return []
+    rows = self.data.conn.execute(
+      'SELECT rowid, -bm25(notes_fts) FROM notes_fts WHERE notes_fts MATCH ? ORDER BY bm25(notes_fts), rowid LIMIT ?',
+      (' '.join(clauses), -1 if limit is None else limit)).fetchall()
+    return [(id, self.data[id], score) for id, score in rows]
+
+  def tag_counts(self):
+    return self.data.conn.execute('SELECT tag, count(*) FROM note_tags GROUP BY tag ORDER BY count(*) DESC, tag').fetchall()
+
+
+class SQLiteStorage:
+  def __init__(self, filename, factory):
+    self.filename = filename
+    self.factory = factory
+    self.conn = None
+
+  def load(self):
+    self.conn = Connections(self.filename)
+    return self.factory(self.conn)
+
+  def save(self, book):
+    self.conn.commit()
+
+  def checkpoint(self, book):
+    self.conn.commit()
+
+  def close(self):
+    if self.conn is not None:
+      self.conn.close()
+      self.conn = None
+
+
+def migrate(filename='assistant.db', contacts_filename='addressbook.pkl', notes_filename='notebook.pkl'):
+  from storage import JournalStorage
+  conn = connect(filename)
+  contacts = ContactTable(conn, None)
+  notes = NoteTable(conn, None)
+  with conn:
+    storage = JournalStorage(contacts_filename, AddressBook)
+    for name, record in storage.load().items():
+      contacts.write(name, record)
+    storage.close()
+    storage = JournalStorage(notes_filename, NoteBook)
+    note_book = storage.load()
+    for id, note_record in note_book.items():
+      notes.write(id, note_record)
+    conn.execute("INSERT OR REPLACE INTO sequences (name, value) VALUES ('notes', ?)", (note_book.last_id,))
+    storage.close()
+  conn.close()
+
+
+if __name__ == "__main__":
+  if os.path.exists('assistant.db'):
+    print('assistant.db already exists, nothing to migrate.')
+  else:
+    migrate()
+    print('Migrated addressbook.pkl and notebook.pkl to assistant.db')
@@ -0,0 +1,284 @@
+import os
+import pickle
+import threading
+import time
+from address_book_pickle import save_data, load_data
+
+
+WRITE_LOCK = threading.RLock()
+
+def read_journal(filename, factory=None):
+  with open(filename, 'rb') as f:
+    while True:
+      try:
+        yield pickle.load(f)
+      except (EOFError, pickle.UnpicklingError, ValueError):
+        return
+
+
+def dump_entry(entry):
+  return pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def write_snapshot(book, filename):
+  save_data(book, filename)
+
+
+def fork_snapshot(snapshot, book, filename):
+  with WRITE_LOCK:
+    pid = os.fork()
+  if pid == 0:
+    status = 1
+    try:
+      snapshot.write(book, filename)
+      status = 0
+    finally:
+      os._exit(status)
+  return pid
+
+
+def wait_snapshot(pid):
+  _, status = os.waitpid(pid, 0)
+  return os.waitstatus_to_exitcode(status) == 0
+
+
+class PickleSnapshot:
+  def read(self, filename, factory):
+    book = load_data(filename)
+    return book if book else factory()
+
+  def write(self, book, filename):
+    write_snapshot(book, filename)
+
+
+class PickleStorage:
+  def __init__(self, filename, factory):
+    self.filename = filename
+    self.factory = factory
+
+  def load(self):
+    book = load_data(self.filename)
+    return book if book else self.factory()
+
+  def append(self, op, key, record=None):
+    pass
+
+  def append_many(self, entries):
+    pass
+
+  def save(self, book):
+    save_data(book, self.filename)
+
+  def checkpoint(self, book):
+    if hasattr(os, 'fork'):
+      wait_snapshot(fork_snapshot(PickleSnapshot(), book, self.filename))
+    else:
+      save_data(book, self.filename)
+
+  def close(self):
+    pass
+
+
+def close_book(book):
+  close = getattr(book, 'close', None)
+  if close is not None:
+    close()
+
+
+class JournalStorage:
+  def __init__(self, filename, factory, compact_after=1000, fsync=False, snapshot=None, compact_bytes=256 * 1024):
+    self.filename = filename
+    self.factory = factory
+    self.snapshot = snapshot if snapshot else PickleSnapshot()
+    self.dump_entry = getattr(self.snapshot, 'dump_entry', dump_entry)
+    self.read_entries = getattr(self.snapshot, 'read_entries', read_journal)
+    self.compact_after = compact_after
+    self.compact_bytes = compact_bytes
+    self.fsync = fsync
+    self.journal = None
+    self.segment = 1
+    self.entries = 0
+    self.compactor = None
+    self.book = None
+    self.lock = threading.RLock()
+
+  def segment_path(self, segment):
+    return f'{self.filename}.journal.{segment}'
+
+  def segments(self):
+    dirname = os.path.dirname(self.filename) or '.'
+    prefix = os.path.basename(self.filename) + '.journal.'
+    segments = []
+    for entry in os.listdir(dirname):
+      if entry.startswith(prefix) and entry[len(prefix):].isdigit():
+        segments.append(int(entry[len(prefix):]))
+    return sorted(segments)
+
+  def replay(self, book, segments):
+    for segment in segments:
+      for op, key, record in self.read_entries(self.segment_path(segment), self.factory):
+        book.apply(op, key, record)
+    return book
+
+  def load(self):
+    book = self.snapshot.read(self.filename, self.factory)
+    segments = self.segments()
+    self.replay(book, segments)
+    if segments:
+      self.segment = segments[-1] + 1
+    book.storage = self
+    self.book = book
+    if len(segments) > 1:
+      self.compact()
+    return book
+
+  def append(self, op, key, record=None):
+    with self.lock:
+      if self.journal is None:
+        self.journal = open(self.segment_path(self.segment), 'ab')
+      self.journal.write(self.dump_entry((op, key, record)))
+      self.journal.flush()
+      if self.fsync:
+        os.fsync(self.journal.fileno())
+      self.entries += 1
+      full = self.entries >= self.compact_after
+    if full:
+      self.compact()
+
+  def append_many(self, entries):
+    if not entries:
+      return
+    with self.lock:
+      if self.journal is None:
+        self.journal = open(self.segment_path(self.segment), 'ab')
+      self.journal.write(b''.join(self.dump_entry(entry) for entry in entries))
+      self.journal.flush()
+      if self.fsync:
+        os.fsync(self.journal.fileno())
+      self.entries += len(entries)
+      full = self.entries >= self.compact_after
+    if full:
+      self.compact()
+
+  def rotate(self):
+    with self.lock:
+      if self.journal is None:
+        return
+      self.journal.close()
+      self.journal = None
+      self.segment += 1
+      self.entries = 0
+
+  def journal_bytes(self):
+    total = 0
+    for segment in self.segments():
+      try:
+        total += os.path.getsize(self.segment_path(segment))
+      except FileNotFoundError:
+        pass
+    return total
+
+  def compact(self, wait=False):
+    with WRITE_LOCK, self.lock:
+      self.rotate()
+      if self.compactor is None or not self.compactor.is_alive():
+        if self.book is not None and hasattr(os, 'fork'):
+          pid = fork_snapshot(self.snapshot, self.book, self.filename)
+          self.compactor = threading.Thread(target=self._reap, args=(pid, self.segment), daemon=True)
+        else:
+          self.compactor = threading.Thread(target=self._compact, args=(self.segment,), daemon=True)
+        self.compactor.start()
+    if wait:
+      self.compactor.join()
+
+  def remove_segments(self, upto):
+    for segment in self.segments():
+      if segment < upto:
+        os.remove(self.segment_path(segment))
+
+  def _reap(self, pid, upto):
+    if wait_snapshot(pid):
+      self.remove_segments(upto)
+
+  def _compact(self, upto):
+    segments = [segment for segment in self.segments() if segment < upto]
+    if not segments:
+      return
+    book = self.snapshot.read(self.filename, self.factory)
+    try:
+      self.replay(book, segments)
+      self.snapshot.write(book, self.filename)
+    finally:
+      close_book(book)
+    self.remove_segments(upto)
+
+  def checkpoint(self, book):
+    with self.lock:
+      if self.journal is not None and not self.fsync:
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+    snapshot_bytes = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+    if self.journal_bytes() >= max(self.compact_bytes, snapshot_bytes // 4):
+      self.compact()
+
+  def save(self, book):
+    self.rotate()
+
+  def close(self):
+    self.rotate()
+    if self.compactor is not None:
+      self.compactor.join()
+    if self.book is not None:
+      close_book(self.book)
+
+
+class BackgroundLoad(threading.Thread):
+  def __init__(self, open_books):
+    super().__init__(daemon=True)
+    self.open_books = open_books
+    self.storages = self.books = self.error = None
+    self.loaded_at = None
+    self.done = threading.Event()
+
+  def run(self):
+    try:
+      self.storages, self.books = self.open_books()
+    except BaseException as e:
+      self.error = e
+    finally:
+      self.loaded_at = time.time()
+      self.done.set()
+
+  def result(self):
+    self.done.wait()
+    if self.error is not None:
+      raise self.error
+    return self.storages, self.books
+
+
+class Autosave(threading.Thread):
+  def __init__(self, storages, books, interval=30, changes=100):
+    super().__init__(daemon=True)
+    self.pairs = list(zip(storages, books))
+    self.interval = interval
+    self.changes = changes
+    self.saved = [book.changes for book in books]
+    self.saved_at = [time.monotonic()] * len(self.pairs)
+    self.stopped = threading.Event()
+
+  def run(self):
+    while not self.stopped.wait(min(self.interval, 1)):
+      self.check()
+
+  def check(self):
+    for position, (storage, book) in enumerate(self.pairs):
+      changes = book.changes
+      pending = changes - self.saved[position]
+      if pending and (pending >= self.changes or time.monotonic() - self.saved_at[position] >= self.interval):
+        storage.checkpoint(book)
+        self.saved[position] = changes
+        self.saved_at[position] = time.monotonic()
+
+  def stop(self):
+    self.stopped.set()
+    self.join()
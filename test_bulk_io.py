@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from address_book_pickle import AddressBook
+from bench import build_contacts, build_notes
+from bulk_io import CONTACT_FIELDS, NOTE_FIELDS, contact_values, export_file, import_file, note_values
+from note_book import NoteBook
+
+
+BAD_ROWS = 'Bad Phone,123,,,\nBad Email,0501234567,not-an-email,,\nBad Birthday,,,,31.02.2000\n'
+
+
+def contacts(book):
+  return sorted(map(contact_values, book.values()))
+
+
+class ImportExportTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.book = build_contacts(500, 24)
+    cls.note_book = build_notes(200, 24)
+
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = directory.name
+
+  def import_contacts(self, filename, workers=0):
+    book = AddressBook()
+    output = io.StringIO()
+    with redirect_stdout(output):
+      result = import_file(filename, book, 'contacts', workers=workers)
+    return book, result, output.getvalue()
+
+  def test_contact_round_trips(self):
+    for fmt in ('csv', 'jsonl', 'vcf'):
+      with self.subTest(fmt=fmt):
+        filename = os.path.join(self.path, f'contacts.{fmt}')
+        self.assertEqual(export_file(filename, CONTACT_FIELDS, map(contact_values, self.book.values())), len(self.book))
+        book, result, _ = self.import_contacts(filename)
+        self.assertEqual(result, (len(self.book), 0))
+        self.assertEqual(contacts(book), contacts(self.book))
+
+  def test_note_round_trip(self):
+    for fmt in ('csv', 'jsonl'):
+      with self.subTest(fmt=fmt):
+        filename = os.path.join(self.path, f'notes.{fmt}')
+        export_file(filename, NOTE_FIELDS, (note_values(id, note_record) for id, note_record in self.note_book.items()))
+        note_book = NoteBook()
+        with redirect_stdout(io.StringIO()):
+          self.assertEqual(import_file(filename, note_book, 'notes'), (len(self.note_book), 0))
+        self.assertEqual([note_values(*item)[1:] for item in note_book.notes_between()], [note_values(*item)[1:] for item in self.note_book.notes_between()])
+
+  def test_worker_processes_validate_like_the_main_process(self):
+    filename = os.path.join(self.path, 'contacts.csv')
+    export_file(filename, CONTACT_FIELDS, map(contact_values, self.book.values()))
+    with open(filename, 'a', encoding='utf-8', newline='') as f:
+      f.write(BAD_ROWS)
+    serial, serial_result, serial_output = self.import_contacts(filename)
+    parallel, parallel_result, parallel_output = self.import_contacts(filename, workers=2)
+    self.assertEqual(serial_result, (len(self.book), 3))
+    self.assertEqual(parallel_result, serial_result)
+    self.assertEqual(parallel_output, serial_output)
+    self.assertEqual(contacts(parallel), contacts(serial))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,50 @@
+import random
+import unittest
+from bench import build_contacts
+from contact_query import Plan, parse_query
+
+
+QUERIES = [
+  'birthday:*.05.1960',
+  'birthday:03.05.1960',
+  'birthday:*.*.1975',
+  'birthday:*.05',
+  'birthday:03.*',
+  'birthday:12.*.1980',
+  'phone:067* AND birthday:*.03.1990',
+  'name:O* AND birthday:*.05',
+  'email:*@gmail.com AND birthday:15.*',
+  'address:~Kyiv AND birthday:*.07.1985',
+]
+
+
+def brute_force(book, query):
+  predicates, _ = parse_query(query.split())
+  return sorted(key for key, record in book.items() if all(predicate.test(record) for predicate in predicates))
+
+
+def planned(book, query):
+  predicates, _ = parse_query(query.split())
+  return sorted(record.name.value for record in Plan(book, predicates).run())
+
+
+class PlanTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.book = build_contacts(3000, 7)
+
+  def test_matches_brute_force(self):
+    for query in QUERIES:
+      with self.subTest(query=query):
+        self.assertEqual(planned(self.book, query), brute_force(self.book, query))
+
+  def test_year_is_checked_when_birthday_drives(self):
+    record = random.Random(1).choice([record for record in self.book.values() if record.birthday])
+    birthday = record.birthday.value
+    query = f'birthday:{birthday.day:02d}.{birthday.month:02d}.{birthday.year + 1}'
+    self.assertNotIn(record.name.value, planned(self.book, query))
+    self.assertEqual(planned(self.book, query), brute_force(self.book, query))
+
+
+if __name__ == '__main__':
+  unittest.main()
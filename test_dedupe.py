@@ -0,0 +1,36 @@
+import unittest
+from address_book_pickle import Record
+from bench import build_contacts
+from dedupe import find_duplicates
+
+
+def planted(book):
+  pairs = []
+  for record in list(book.values())[:20]:
+    copy = Record(f'{record.name.value.upper()}  ')
+    copy.phones = list(record.phones)
+    if record.email:
+      copy.add_email(record.email.value)
+    book.add_record(copy)
+    pairs.append({record.name.value, copy.name.value})
+  return pairs
+
+
+class FindDuplicatesTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.book = build_contacts(1500, 13)
+    cls.pairs = planted(cls.book)
+
+  def test_finds_planted_duplicates(self):
+    groups = [set(names) for _, names, _ in find_duplicates(self.book)]
+    for pair in self.pairs:
+      with self.subTest(pair=pair):
+        self.assertTrue(any(pair <= group for group in groups))
+
+  def test_worker_processes_score_like_the_main_process(self):
+    self.assertEqual(find_duplicates(self.book, workers=2), find_duplicates(self.book))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,95 @@
+import os
+import random
+import tempfile
+import unittest
+from fuzzywuzzy import process
+from bench import build_contacts, misspell
+from fuzzy_index import NameIndex, process_name
+
+
+def extracted(name, names):
+  return {match: score for match, score in process.extract(name, names, limit=None) if score >= 60}
+
+
+def queries(names, rng):
+  for name in rng.sample(names, 10):
+    first, last = name.split()[:2]
+    yield name, misspell(name, rng)
+    yield name, misspell(misspell(name, rng), rng)
+    yield name, misspell(last, rng)
+    yield name, f'{last} {first}'
+    yield name, name.replace(' ', '')
+    yield name, name[:5].upper()
+
+
+def unique_names(count, rng):
+  names = set()
+  while len(names) < count:
+    names.add(' '.join(''.join(rng.choice('bdfghklmnprstvz') + rng.choice('aeiou') for _ in range(rng.randint(3, 4))) for _ in range(2)).capitalize())
+  return sorted(names)
+
+
+def build_index(names):
+  index = NameIndex()
+  for name in names:
+    index.add(name)
+  return index
+
+
+class NameIndexTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.names = list(build_contacts(300, 5).keys())
+
+  def check(self, index, names, rng):
+    for name, query in queries(names, rng):
+      with self.subTest(query=query):
+        found = dict(index.extract(query))
+        expected = extracted(query, names)
+        self.assertIn(name, found)
+        self.assertLessEqual(found.items(), expected.items())
+
+  def test_extract_finds_the_name_with_process_extract_scores(self):
+    self.check(build_index(self.names), self.names, random.Random(5))
+    for query in ('Olena Olena', 'ivan-2', 'x'):
+      with self.subTest(query=query):
+        self.assertLessEqual(dict(build_index(self.names).extract(query)).items(), extracted(query, self.names).items())
+
+  def test_removed_names_are_not_suggested(self):
+    index = build_index(self.names)
+    removed = set(self.names[::3])
+    for name in removed:
+      index.remove(name)
+    kept = [name for name in self.names if name not in removed]
+    self.check(index, kept, random.Random(6))
+    self.assertFalse(removed & set(index.names))
+
+  def test_candidates_do_not_grow_with_the_book(self):
+    averages = []
+    for size in (1000, 16000):
+      rng = random.Random(size)
+      names = unique_names(size, rng)
+      index = build_index(names)
+      sample = [misspell(name, rng) for name in rng.sample(names, 50)]
+      averages.append(sum(len(index.candidates(process_name(query))) for query in sample) / len(sample))
+    self.assertLess(averages[1], 4 * averages[0])
+
+  def test_sqlite_suggest_names(self):
+    from sqlite_book import SQLiteAddressBook, SQLiteStorage
+    book = build_contacts(100, 7)
+    names = list(book.keys())
+    query = misspell(names[0], random.Random(7))
+    with tempfile.TemporaryDirectory() as directory:
+      storage = SQLiteStorage(os.path.join(directory, 'assistant.db'), SQLiteAddressBook)
+      sqlite_book = storage.load()
+      sqlite_book.put_many(book.items())
+      self.assertEqual(sqlite_book.suggest_names(query), book.suggest_names(query))
+      self.assertIn(names[0], sqlite_book.suggest_names(query))
+      sqlite_book.delete(names[0])
+      book.delete(names[0])
+      self.assertEqual(sqlite_book.suggest_names(query), book.suggest_names(query))
+      storage.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,78 @@
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from address_book_pickle import AddressBook, CommandError, set_interactive
+from main import dispatch, run_batch
+from note_book import NoteBook
+
+
+class CountingStorage:
+  def __init__(self):
+    self.saves = 0
+
+  def save(self, book):
+    self.saves += 1
+
+  def close(self):
+    pass
+
+
+class RunBatchTest(unittest.TestCase):
+  def setUp(self):
+    self.addCleanup(set_interactive, True)
+    self.books = AddressBook(), NoteBook()
+
+  def run_lines(self, lines, storages=(), save_every=0):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+      errors = run_batch(lines, storages, self.books, save_every)
+    return errors, stdout.getvalue(), stderr.getvalue()
+
+  def test_failed_commands_are_counted_apart(self):
+    errors, stdout, stderr = self.run_lines([
+      'add Ann phone=1234567890',
+      'add Bob phone=12',
+      'bogus',
+      'add "Unclosed',
+      'edit Ann',
+      '# comment',
+      'add-note hello',
+    ])
+    self.assertEqual(errors, 4)
+    self.assertIn('line 2: add failed', stdout)
+    self.assertIn('line 5: edit failed', stdout)
+    self.assertIn('2 commands executed, 4 failed', stderr)
+    self.assertIsNone(self.books[0].find('Bob'))
+
+  def test_save_every_counts_executed_commands(self):
+    storage = CountingStorage()
+    errors, _, _ = self.run_lines(['add Ann phone=1234567890', 'add Bob phone=1', 'add Bob phone=1234567899', 'add-note hi'], (storage,), 2)
+    self.assertEqual(errors, 1)
+    self.assertEqual(storage.saves, 2)
+
+  def test_rename_onto_an_existing_contact_fails(self):
+    errors, _, _ = self.run_lines(['add Ann phone=1234567890', 'add Bob phone=1234567899', 'edit Ann name Bob'])
+    self.assertEqual(errors, 1)
+    self.assertEqual(self.books[0].find('Ann').phones[0].value, '1234567890')
+    self.assertEqual(self.books[0].find('Bob').phones[0].value, '1234567899')
+
+  def test_dispatch_marks_errors(self):
+    self.assertIsInstance(dispatch('nope', [], *self.books), CommandError)
+    self.assertIsInstance(dispatch('add-note', [], *self.books), CommandError)
+    self.assertNotIsInstance(dispatch('add-note', ['text'], *self.books), CommandError)
+
+  def test_exit_status(self):
+    main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    with tempfile.TemporaryDirectory() as directory:
+      for commands, status in (('add Ann phone=1234567890\n', 0), ('add Bob phone=12\n', 1)):
+        with self.subTest(commands=commands):
+          result = subprocess.run([sys.executable, main, '--batch', '-'], input=commands, capture_output=True, text=True, cwd=directory)
+          self.assertEqual(result.returncode, status)
+
+
+if __name__ == '__main__':
+  unittest.main()
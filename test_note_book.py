@@ -0,0 +1,83 @@
+import pickle
+import re
+import unittest
+from note_book import COMPACT_MIN, NoteBook, NoteRecord, show_notes
+
+
+def build(ids):
+  note_book = NoteBook()
+  note_book.put_many((id, NoteRecord(f'note {id}')) for id in ids)
+  return note_book
+
+
+def shown_ids(output):
+  return [int(id) for id in re.findall(r'^\|\s*(\d+)\s*\|', output, re.M)]
+
+
+class NoteIdsTest(unittest.TestCase):
+  def test_ranges_follow_id_order(self):
+    ids = [40, 3, 17, 8, 25, 1, 33]
+    note_book = build(ids)
+    self.assertEqual([id for id, _ in note_book.notes_between()], sorted(ids))
+    self.assertEqual([id for id, _ in note_book.notes_between(8, 33)], [8, 17, 25, 33])
+    self.assertEqual([id for id, _ in note_book.latest_notes(3)], [40, 33, 25])
+    self.assertEqual(note_book.next_id(), 41)
+
+  def test_show_notes_lists_by_id(self):
+    note_book = build([5, 2, 9])
+    note_book.add_note(NoteRecord('added'))
+    self.assertEqual(shown_ids(show_notes(note_book, ['--page', '1'])), [2, 5, 9, 10])
+    self.assertEqual(shown_ids(show_notes(note_book, ['--from', '3', '--to', '9', '--page', '1'])), [5, 9])
+    self.assertEqual(shown_ids(show_notes(note_book, ['--latest', '2', '--page', '1'])), [10, 9])
+
+  def test_deleted_ids_are_skipped_and_not_reused(self):
+    note_book = build(range(1, 11))
+    for id in (2, 5, 10):
+      note_book.delete_note(id)
+    self.assertEqual(note_book.tombstones(), 3)
+    self.assertEqual([id for id, _ in note_book.notes_between()], [1, 3, 4, 6, 7, 8, 9])
+    self.assertEqual([id for id, _ in note_book.latest_notes(2)], [9, 8])
+    self.assertEqual(note_book.add_note(NoteRecord('next')), 11)
+    note_book.put_many([(5, NoteRecord('again'))])
+    self.assertEqual(note_book.tombstones(), 2)
+    self.assertEqual([id for id, _ in note_book.notes_between(4, 6)], [4, 5, 6])
+
+  def test_tombstones_are_compacted(self):
+    count = COMPACT_MIN * 3
+    note_book = build(range(1, count + 1))
+    for id in range(1, count, 2):
+      note_book.delete_note(id)
+    for id in range(2, count, 4):
+      note_book.delete_note(id)
+    note_book.compactor.join()
+    note_book.compact_ids()
+    self.assertEqual(note_book.tombstones(), 0)
+    self.assertEqual(note_book.note_ids, sorted(note_book.keys()))
+
+  def test_compaction_keeps_ids_put_back_during_the_scan(self):
+    note_book = build([2, 5, 9])
+    note_book.delete_note(2)
+    note_book.delete_note(5)
+
+    class Data(dict):
+      def __contains__(self, key):
+        found = dict.__contains__(self, key)
+        if key == 9 and not dict.__contains__(self, 5):
+          note_book.put_many([(5, NoteRecord('again'))])
+        return found
+
+    note_book.data = Data(note_book.data)
+    note_book.compact_ids()
+    self.assertEqual(note_book.note_ids, [5, 9])
+    self.assertEqual([id for id, _ in note_book.notes_between()], [5, 9])
+
+  def test_ids_lock_is_per_book(self):
+    first, second = NoteBook(), NoteBook()
+    self.assertIsNot(first.ids_lock, second.ids_lock)
+    restored = pickle.loads(pickle.dumps(build([3, 1, 2])))
+    self.assertIsNot(restored.ids_lock, first.ids_lock)
+    self.assertEqual([id for id, _ in restored.notes_between()], [1, 2, 3])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,110 @@
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import unittest
+from bench import build_contacts, build_notes
+from query_index import build, is_current, open_query_index, write_query_index
+
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def names(records):
+  return sorted(record.name.value for record in records)
+
+
+def listing(directory):
+  found = {}
+  for root, _, files in os.walk(directory):
+    for filename in files:
+      path = os.path.join(root, filename)
+      found[path] = os.stat(path).st_mtime_ns
+  return found
+
+
+class ReadOnlyTest(unittest.TestCase):
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = directory.name
+    self.addCleanup(os.chdir, os.getcwd())
+    os.chdir(self.path)
+
+  def run_batch(self, *args, commands):
+    return subprocess.run([sys.executable, MAIN, *args, '--batch', '-'], input='\n'.join(commands) + '\n', capture_output=True, text=True, cwd=self.path)
+
+  def test_tenant_index_answers_from_the_tenant(self):
+    self.run_batch('--storage', 'sharded', '--tenant', 'teamA', '--shards', '2', commands=['add Alice phone=1234567890'])
+    self.run_batch('--storage', 'sharded', commands=['add Bob phone=1234567899'])
+    tenant = self.run_batch('--storage', 'sharded', '--tenant', 'teamA', '--read-only', commands=['search name Alice', 'search name Bob'])
+    self.assertIn('Alice', tenant.stdout)
+    self.assertNotIn('Bob', tenant.stdout)
+    self.assertTrue(os.path.exists(os.path.join('tenants', 'teamA', 'assistant.qidx')))
+    self.assertEqual(len([entry for entry in os.listdir(os.path.join('tenants', 'teamA')) if entry.endswith('.pkl')]), 2)
+    default = self.run_batch('--storage', 'sharded', '--read-only', commands=['search name Bob', 'search name Alice'])
+    self.assertIn('Bob', default.stdout)
+    self.assertNotIn('Alice', default.stdout)
+
+  def test_freshness_check_opens_nothing(self):
+    self.run_batch(commands=['add Alice phone=1234567890', 'add-note first #tag'])
+    build('journal', 'assistant.qidx')
+    self.assertTrue(is_current('assistant.qidx'))
+    before = listing(self.path)
+    self.assertFalse(is_current('assistant.qidx', 'lazy'))
+    self.assertFalse(is_current('assistant.qidx', 'columnar'))
+    self.assertFalse(is_current('assistant.qidx', 'sqlite'))
+    self.assertFalse(is_current('assistant.qidx', 'sharded', 4, 'teamA'))
+    self.assertEqual(listing(self.path), before)
+    self.run_batch(commands=['add Bob phone=1234567899'])
+    self.assertFalse(is_current('assistant.qidx'))
+    build('journal', 'assistant.qidx')
+    book, _ = open_query_index('assistant.qidx')
+    self.assertIsNotNone(book.find('Bob'))
+
+  def test_sharded_index_goes_stale_on_other_shard_counts(self):
+    self.run_batch('--storage', 'sharded', '--shards', '3', commands=['add Alice phone=1234567890'])
+    build('sharded', 'assistant.qidx', shards=3)
+    before = listing(self.path)
+    self.assertTrue(is_current('assistant.qidx', 'sharded'))
+    self.assertTrue(is_current('assistant.qidx', 'sharded', 3))
+    self.assertFalse(is_current('assistant.qidx', 'sharded', 5))
+    self.assertEqual(listing(self.path), before)
+
+
+class MappedBookTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.book = build_contacts(400, 17)
+    cls.note_book = build_notes(200, 17)
+    filename = os.path.join(cls.directory.name, 'assistant.qidx')
+    write_query_index(cls.book, cls.note_book, filename)
+    cls.mapped_book, cls.mapped_note_book = open_query_index(filename)
+
+  @classmethod
+  def tearDownClass(cls):
+    del cls.mapped_book, cls.mapped_note_book
+    cls.directory.cleanup()
+
+  def test_lookups_match_the_book(self):
+    records = random.Random(17).sample(list(self.book.values()), 40)
+    for record in records:
+      if record.birthday:
+        birthday = record.birthday.value.strftime('%d.%m.%Y')
+        for query in (birthday, birthday[:5], birthday + 'x', birthday[:5] + '.'):
+          with self.subTest(birthday=query):
+            self.assertEqual(names(self.mapped_book.find_by_brthd(query)), names(self.book.find_by_brthd(query)))
+      if record.address:
+        for query in (record.address.value, record.address.value.upper(), f' {record.address.value} '):
+          with self.subTest(address=query):
+            self.assertEqual(self.mapped_book.find_by_addr(query).address.value, self.book.find_by_addr(query).address.value)
+    for days in (7, 60):
+      with self.subTest(days=days):
+        key = lambda entry: (entry['birthday'], entry['name'])
+        self.assertEqual(sorted(self.mapped_book.get_upcoming_birthdays(days), key=key), sorted(self.book.get_upcoming_birthdays(days), key=key))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from address_book_pickle import AddressBook
+from note_book import NoteBook
+from server import AssistantServer, Session
+
+
+class Writer:
+  def __init__(self):
+    self.data = bytearray()
+
+  def write(self, data):
+    self.data += data
+
+  async def drain(self):
+    pass
+
+
+class ServerCommandsTest(unittest.TestCase):
+  def setUp(self):
+    self.server = AssistantServer((), (AddressBook(), NoteBook()), workers=2)
+    self.addCleanup(self.server.executor.shutdown)
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = directory.name
+
+  def execute(self, line):
+    writer = Writer()
+    asyncio.run(self.server.execute(Session(writer), line))
+    return writer.data.decode()
+
+  def test_import_and_export_are_refused(self):
+    self.execute('add Ann phone=1234567890')
+    csv = os.path.join(self.path, 'contacts.csv')
+    reply = self.execute(f'export contacts {csv}')
+    self.assertIn('main.py', reply)
+    self.assertFalse(os.path.exists(csv))
+    with open(csv, 'w', encoding='utf-8') as f:
+      f.write('name,phones\nBob,1234567899\n')
+    self.assertIn('main.py', self.execute(f'import contacts {csv}'))
+    self.assertIsNone(self.server.books[0].find('Bob'))
+
+  def test_other_commands_still_run(self):
+    self.assertIn('added', self.execute('add Ann phone=1234567890'))
+    self.assertIn('1234567890', self.execute('search name Ann'))
+    self.assertNotIn('export', self.execute('exprt contacts x.csv'))
+
+
+if __name__ == '__main__':
+  unittest.main()
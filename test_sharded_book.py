@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+import unittest
+from address_book_pickle import AddressBook, Record
+from bench import build_contacts, misspell
+from bulk_io import contact_values
+from sharded_book import MANIFEST, ShardedStorage, prepare, read_count, shard_of, shard_path
+from storage import JournalStorage
+
+
+def contacts(book):
+  return sorted(map(contact_values, book.values()))
+
+
+class ShardedStorageTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.path = self.directory.name
+    self.book = build_contacts(400, 21)
+    storage = JournalStorage(os.path.join(self.path, 'addressbook.pkl'), AddressBook)
+    storage.load().put_many(self.book.items())
+    storage.close()
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def open(self, count, **kwargs):
+    storage = ShardedStorage(self.path, prepare(self.path, count))
+    self.addCleanup(storage.close)
+    book = storage.load()
+    for option, value in kwargs.items():
+      setattr(book, option, value)
+    return storage, book
+
+  def shard_files(self):
+    return sorted(entry for entry in os.listdir(self.path) if '-of-' in entry)
+
+  def test_migrates_into_shards(self):
+    storage, book = self.open(4)
+    self.assertEqual(read_count(self.path), 4)
+    self.assertEqual(contacts(book), contacts(self.book))
+    for number, shard in enumerate(book.shards):
+      self.assertTrue(all(shard_of(key, 4) == number for key in shard.keys()))
+    self.assertEqual(self.shard_files(), [os.path.basename(shard_path(self.path, shard, 4)) for shard in range(4)])
+
+  def test_repartitions_with_pending_journals(self):
+    storage, book = self.open(4)
+    names = sorted(book.keys())
+    book.delete(names[0])
+    book.find(names[1]).add_phone('0501234567')
+    book.add_record(Record('Added Before Resharding'))
+    expected = contacts(book)
+    storage.close()
+    self.assertTrue(any('.journal.' in entry for entry in self.shard_files()))
+    storage, book = self.open(3)
+    self.assertEqual(contacts(book), expected)
+    self.assertEqual(read_count(self.path), 3)
+    self.assertTrue(all('-of-003' in entry for entry in self.shard_files()))
+    for number, shard in enumerate(book.shards):
+      self.assertTrue(all(shard_of(key, 3) == number for key in shard.keys()))
+
+  def test_same_count_keeps_the_files(self):
+    self.open(4)[0].close()
+    before = {entry: os.stat(os.path.join(self.path, entry)).st_mtime_ns for entry in self.shard_files() + [MANIFEST]}
+    self.assertEqual(prepare(self.path, 4), 4)
+    self.assertEqual(prepare(self.path), 4)
+    self.assertEqual({entry: os.stat(os.path.join(self.path, entry)).st_mtime_ns for entry in before}, before)
+
+  def test_rejects_zero_shards(self):
+    with self.assertRaises(ValueError):
+      prepare(self.path, 0)
+
+  def test_queries_match_a_single_book(self):
+    record = next(record for record in self.book.values() if record.birthday and record.email)
+    birthday = record.birthday.value.strftime('%d.%m.%Y')
+    query = misspell(record.name.value, random.Random(21))
+    for workers in (1, 2):
+      with self.subTest(workers=workers):
+        storage, book = self.open(4, workers=workers, parallel_min=0)
+        self.assertEqual(book.find_by_phone(record.phones[0].value).name.value, record.name.value)
+        self.assertEqual(book.find_by_mail(record.email.value).name.value, record.name.value)
+        self.assertEqual(sorted(r.name.value for r in book.find_by_brthd(birthday[:5])), sorted(r.name.value for r in self.book.find_by_brthd(birthday[:5])))
+        self.assertEqual(sorted(r.name.value for r in book.find_matching('name', 'prefix', 'ol')), sorted(r.name.value for r in self.book.find_matching('name', 'prefix', 'ol')))
+        upcoming = sorted(self.book.get_upcoming_birthdays(60), key=lambda entry: (entry['birthday'], entry['name']))
+        self.assertEqual(book.get_upcoming_birthdays(60), upcoming)
+        self.assertEqual(sorted(book.suggest_names(query)), sorted(self.book.suggest_names(query)))
+        storage.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
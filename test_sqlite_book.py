@@ -0,0 +1,131 @@
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from address_book_pickle import AddressBook, Record
+from bench import build_contacts, build_notes
+from bulk_io import contact_values, note_values
+from note_book import NoteBook, NoteRecord
+from sqlite_book import SQLiteAddressBook, SQLiteNoteBook, SQLiteStorage, migrate
+from storage import JournalStorage
+
+
+def names(records):
+  return [record.name.value for record in records]
+
+
+def name(record):
+  return record.name.value if record else None
+
+
+def note_ids(items):
+  return [id for id, _ in items]
+
+
+def upcoming(book, days):
+  return sorted(book.get_upcoming_birthdays(days), key=lambda item: (item['birthday'], item['name']))
+
+
+class SQLiteParityTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.book = build_contacts(500, 11)
+    record = Record('Shared Address')
+    record.add_address(next(record.address.value for record in cls.book.values() if record.address))
+    cls.book.add_record(record)
+    cls.note_book = build_notes(300, 11)
+    for id in range(10, 60, 7):
+      cls.note_book.delete_note(id)
+    for filename, factory, source in (('addressbook.pkl', AddressBook, cls.book), ('notebook.pkl', NoteBook, cls.note_book)):
+      storage = JournalStorage(os.path.join(cls.directory.name, filename), factory)
+      storage.load().put_many(source.items())
+      storage.close()
+    cls.filename = os.path.join(cls.directory.name, 'assistant.db')
+    migrate(cls.filename, os.path.join(cls.directory.name, 'addressbook.pkl'), os.path.join(cls.directory.name, 'notebook.pkl'))
+    cls.contacts = SQLiteStorage(cls.filename, SQLiteAddressBook)
+    cls.notes = SQLiteStorage(cls.filename, SQLiteNoteBook)
+    cls.sqlite_book = cls.contacts.load()
+    cls.sqlite_note_book = cls.notes.load()
+    cls.rng = random.Random(11)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.contacts.close()
+    cls.notes.close()
+    cls.directory.cleanup()
+
+  def sample(self, field):
+    return [record for record in self.rng.sample(list(self.book.values()), 40) if getattr(record, field)]
+
+  def test_migrated_contacts_and_notes(self):
+    self.assertEqual(sorted(map(contact_values, self.sqlite_book.values())), sorted(map(contact_values, self.book.values())))
+    self.assertEqual([note_values(*item) for item in self.sqlite_note_book.notes_between()], [note_values(*item) for item in self.note_book.notes_between()])
+    self.assertEqual(self.sqlite_note_book.next_id(), self.note_book.next_id())
+
+  def test_lookups(self):
+    for record in self.sample('phones'):
+      with self.subTest(phone=record.phones[0].value):
+        self.assertEqual(name(self.sqlite_book.find_by_phone(record.phones[0].value)), name(self.book.find_by_phone(record.phones[0].value)))
+    for record in self.sample('email'):
+      with self.subTest(email=record.email.value):
+        self.assertEqual(name(self.sqlite_book.find_by_mail(record.email.value)), name(self.book.find_by_mail(record.email.value)))
+    addresses = [record.address.value for record in self.sample('address')] + [self.book.find('Shared Address').address.value]
+    for address in addresses:
+      for query in (address, address.upper(), f'  {address.replace(" ", "   ")} '):
+        with self.subTest(address=query):
+          self.assertIsNotNone(self.book.find_by_addr(query))
+          self.assertEqual(name(self.sqlite_book.find_by_addr(query)), name(self.book.find_by_addr(query)))
+
+  def test_birthdays(self):
+    for record in self.sample('birthday'):
+      birthday = record.birthday.value.strftime('%d.%m.%Y')
+      for query in (birthday, birthday[:5], birthday + 'x', birthday[:5] + '.', ' ' + birthday):
+        with self.subTest(birthday=query):
+          self.assertEqual(names(self.sqlite_book.find_by_brthd(query)), names(self.book.find_by_brthd(query)))
+    for days in (0, 7, 60, 365):
+      with self.subTest(days=days):
+        self.assertEqual(upcoming(self.sqlite_book, days), upcoming(self.book, days))
+
+  def test_patterns(self):
+    for field, mode, text in (('name', 'prefix', 'ol'), ('name', 'suffix', 'ko'), ('email', 'suffix', '@gmail.com'), ('phone', 'prefix', '067'), ('phone', 'contains', '55')):
+      with self.subTest(field=field, mode=mode, text=text):
+        self.assertEqual(sorted(names(self.sqlite_book.find_matching(field, mode, text))), sorted(names(self.book.find_matching(field, mode, text))))
+
+  def test_notes(self):
+    for first, last in ((None, None), (5, 80), (200, None), (None, 3)):
+      with self.subTest(first=first, last=last):
+        self.assertEqual(note_ids(self.sqlite_note_book.notes_between(first, last)), note_ids(self.note_book.notes_between(first, last)))
+    self.assertEqual(note_ids(self.sqlite_note_book.latest_notes(15)), note_ids(self.note_book.latest_notes(15)))
+    self.assertEqual(self.sqlite_note_book.tag_counts(), self.note_book.tag_counts())
+    tags = [tag for tag, _ in self.note_book.tag_counts()[:3]]
+    for terms, match_any in (([tags[0]], False), (tags[:2], False), (tags[:2], True), ([tags[0][:2] + '*'], False)):
+      with self.subTest(terms=terms, match_any=match_any):
+        self.assertEqual(note_ids(self.sqlite_note_book.find_by_tags(terms, match_any)), note_ids(self.note_book.find_by_tags(terms, match_any)))
+
+  def test_address_key_is_added_to_old_databases(self):
+    filename = os.path.join(self.directory.name, 'old.db')
+    conn = sqlite3.connect(filename)
+    conn.execute('CREATE TABLE contacts (name TEXT PRIMARY KEY, email TEXT, address TEXT, birthday TEXT, bday_month INTEGER, bday_day INTEGER)')
+    conn.execute('CREATE INDEX contacts_address ON contacts(address)')
+    conn.execute("INSERT INTO contacts (name, address) VALUES ('Ann', 'Kyiv,  Main St 1')")
+    conn.commit()
+    conn.close()
+    storage = SQLiteStorage(filename, SQLiteAddressBook)
+    self.assertEqual(name(storage.load().find_by_addr('kyiv, main st 1')), 'Ann')
+    storage.close()
+
+  def test_deleted_note_ids_are_not_reused(self):
+    filename = os.path.join(self.directory.name, 'notes.db')
+    storage = SQLiteStorage(filename, SQLiteNoteBook)
+    note_book = storage.load()
+    for text in ('first', 'second', 'third'):
+      note_book.add_note(NoteRecord(text))
+    note_book.delete_note(3)
+    self.assertEqual(note_book.add_note(NoteRecord('fourth')), 4)
+    storage.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
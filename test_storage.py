@@ -0,0 +1,163 @@
+import os
+import tempfile
+import unittest
+from address_book_pickle import AddressBook, Record
+from bench import build_contacts, build_notes
+from bulk_io import contact_values, note_values
+from columnar import ColumnarSnapshot
+from lazy_book import IndexedSnapshot, LazyAddressBook, LazyNoteBook
+from note_book import NoteBook, NoteRecord
+from storage import JournalStorage
+
+
+def contacts(book):
+  return {key: contact_values(record) for key, record in book.items()}
+
+
+def notes(note_book):
+  return [note_values(id, note_record) for id, note_record in sorted(note_book.items())]
+
+
+class JournalStorageTest(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.filename = os.path.join(self.directory.name, 'addressbook.pkl')
+    self.storages = []
+
+  def tearDown(self):
+    for storage in self.storages:
+      storage.close()
+    self.directory.cleanup()
+
+  def open(self, factory=AddressBook, filename=None, **kwargs):
+    storage = JournalStorage(filename or self.filename, factory, **kwargs)
+    self.storages.append(storage)
+    return storage, storage.load()
+
+  def fill(self, book):
+    for record in build_contacts(200, 1).values():
+      book.add_record(record)
+    names = sorted(book.keys())
+    book.find(names[0]).add_phone('0501234567')
+    book.find(names[1]).edit_name('Renamed Contact')
+    book.delete(names[2])
+    book.put_many((f'Imported {number}', Record(f'Imported {number}')) for number in range(30))
+
+  def test_replays_the_journal_without_a_snapshot(self):
+    storage, book = self.open()
+    self.fill(book)
+    self.assertFalse(os.path.exists(self.filename))
+    self.assertEqual(storage.segments(), [1])
+    _, replayed = self.open()
+    self.assertEqual(contacts(replayed), contacts(book))
+
+  def test_compaction_keeps_every_change(self):
+    storage, book = self.open(compact_after=50)
+    self.fill(book)
+    storage.close()
+    storage, reopened = self.open()
+    self.assertEqual(contacts(reopened), contacts(book))
+    storage.compact(wait=True)
+    self.assertEqual(storage.segments(), [])
+    _, compacted = self.open()
+    self.assertEqual(contacts(compacted), contacts(book))
+
+  def test_changes_after_compaction_go_to_a_new_segment(self):
+    storage, book = self.open()
+    self.fill(book)
+    storage.compact(wait=True)
+    book.delete('Imported 0')
+    book.add_record(Record('After Compaction'))
+    self.assertEqual(len(storage.segments()), 1)
+    _, reopened = self.open()
+    self.assertEqual(contacts(reopened), contacts(book))
+
+  def test_torn_tail_is_ignored(self):
+    storage, book = self.open()
+    book.add_record(Record('Kept'))
+    storage.rotate()
+    with open(storage.segment_path(1), 'rb') as f:
+      entry = f.read()
+    book.add_record(Record('Torn'))
+    storage.rotate()
+    with open(storage.segment_path(2), 'r+b') as f:
+      f.truncate(len(entry) // 2)
+    _, reopened = self.open()
+    self.assertEqual(list(reopened.keys()), ['Kept'])
+
+  def test_note_ids_survive_replay(self):
+    filename = os.path.join(self.directory.name, 'notebook.pkl')
+    storage, note_book = self.open(NoteBook, filename, compact_after=40)
+    for note_record in build_notes(100, 1).values():
+      note_book.add_note(note_record)
+    last = max(note_book.keys())
+    note_book.delete_note(last)
+    storage.close()
+    _, reopened = self.open(NoteBook, filename)
+    self.assertEqual(notes(reopened), notes(note_book))
+    self.assertEqual(reopened.add_note(NoteRecord('next')), last + 1)
+
+
+SNAPSHOTS = [
+  ('columnar', ColumnarSnapshot, AddressBook, NoteBook),
+  ('columnar compressed', lambda: ColumnarSnapshot(6), AddressBook, NoteBook),
+  ('lazy', IndexedSnapshot, LazyAddressBook, LazyNoteBook),
+]
+
+
+class SnapshotRoundTripTest(unittest.TestCase):
+  @classmethod
+  def setUpClass(cls):
+    cls.book = build_contacts(300, 3)
+    record = Record('Олена Коваль-Шевчук')
+    record.add_phone('0001234567')
+    record.add_address('Київ,  вул. Хрещатик 1')
+    cls.book.add_record(record)
+    cls.book.add_record(Record('Empty'))
+    cls.note_book = build_notes(300, 3)
+    cls.note_book.delete_note(150)
+    cls.note_book.add_note(NoteRecord('Нотатка без тегів'))
+
+  def round_trip(self, make_snapshot, book, factory, filename):
+    make_snapshot().write(book, filename)
+    storage = JournalStorage(filename, factory, snapshot=make_snapshot())
+    return storage, storage.load()
+
+  def reopen(self, make_snapshot, factory, filename, values):
+    storage = JournalStorage(filename, factory, snapshot=make_snapshot())
+    try:
+      return values(storage.load())
+    finally:
+      storage.close()
+
+  def test_contacts(self):
+    for kind, make_snapshot, factory, _ in SNAPSHOTS:
+      with self.subTest(kind=kind), tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'addressbook')
+        storage, book = self.round_trip(make_snapshot, self.book, factory, filename)
+        self.assertEqual(contacts(book), contacts(self.book))
+        self.assertEqual(book.find_by_phone('0001234567').name.value, 'Олена Коваль-Шевчук')
+        book.delete('Empty')
+        book.find('Олена Коваль-Шевчук').add_email('olena@mail.ua')
+        expected = contacts(book)
+        storage.compact(wait=True)
+        storage.close()
+        self.assertEqual(self.reopen(make_snapshot, factory, filename, contacts), expected)
+
+  def test_notes(self):
+    for kind, make_snapshot, _, factory in SNAPSHOTS:
+      with self.subTest(kind=kind), tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'notebook')
+        storage, note_book = self.round_trip(make_snapshot, self.note_book, factory, filename)
+        self.assertEqual(notes(note_book), notes(self.note_book))
+        self.assertEqual(note_book.last_id, self.note_book.last_id)
+        last = note_book.add_note(NoteRecord('after round trip'))
+        note_book.delete_note(last)
+        storage.compact(wait=True)
+        storage.close()
+        reopened = self.reopen(make_snapshot, factory, filename, lambda note_book: (notes(note_book), note_book.next_id()))
+        self.assertEqual(reopened, (notes(self.note_book), last + 1))
+
+
+if __name__ == '__main__':
+  unittest.main()